@@ -3,13 +3,32 @@ import os
 
 
 class Settings(BaseSettings):
-    OPENAI_API_KEY: str = os.environ.get("OPENAI_API_KEY")
+    OPENAI_API_KEY: str | None = os.environ.get("OPENAI_API_KEY")
     DOCUMENTS_FOLDER: str = "documenti"
     VECTOR_DB_PROVIDER: str = "chroma"
     VECTOR_DB_DIRECTORY: str = "chroma_db"
+    VECTOR_DB_SEARCH_WORKERS: int = 8
+    QUERY_CACHE_MAX_SIZE: int = 2048
+    QUERY_CACHE_TTL_SECONDS: float = 3600
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_SEARCH_CANDIDATES_FACTOR: int = 3
+    HYBRID_SEARCH_RRF_K: int = 60
     EMBEDDING_MODEL_NAME: str = "text-embedding-ada-002"
+    EMBEDDING_PROVIDER: str = ""
+    HASHING_EMBEDDING_DIMENSIONS: int = 512
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = ""
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_SIZE: int = 256
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 10
     LLM_MODEL_NAME: str = "gpt-4o-mini"
     LLM_PROVIDER: str = "openai"
+    FAKE_LLM_TTFT_MS: float = 300
+    FAKE_LLM_TOKENS_PER_SECOND: float = 50
+    FAKE_LLM_RESPONSE_TOKENS: int = 120
+    FAKE_LLM_ERROR_RATE: float = 0.0
+    FAKE_LLM_SEED: int | None = None
     CHATBOT_INSTRUCTIONS: str = """
         Sei il chatbot di un'azienda.
 
@@ -23,6 +42,48 @@ class Settings(BaseSettings):
 		- Non esprimere opinioni personali o fare supposizioni.
         - Non fornire informazioni personali.
         """
+    CONVERSATION_SUMMARY_ENABLED: bool = False
+    CONVERSATION_RECENT_MESSAGES: int = 6
+    CONVERSATION_SUMMARY_MIN_NEW_MESSAGES: int = 4
+    CONVERSATION_SUMMARY_CACHE_SIZE: int = 1000
+    SUMMARY_LLM_MODEL_NAME: str = ""
+    SESSION_STORE_PROVIDER: str = "memory"
+    SESSION_MAX_SESSIONS: int = 10_000
+    SESSION_MAX_MESSAGES: int = 200
+    SESSION_TTL_SECONDS: float = 24 * 60 * 60
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    FAQ_FAST_PATH_ENABLED: bool = True
+    FAQ_FAST_PATH_THRESHOLD: float = 0.92
+    PROMPT_HISTORY_MAX_TOKENS: int = 1000
+    PROMPT_CONTEXT_MAX_TOKENS: int = 2000
+    PROMPT_QUESTION_MAX_TOKENS: int = 500
+    DATABASE_API_URL: str = "http://database-api:8000"
+    DATABASE_API_TIMEOUT: float = 10.0
+    DATABASE_API_MAX_CONNECTIONS: int = 100
+    DATABASE_API_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPLOAD_CONCURRENCY: int = 8
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    INGEST_MANIFEST_PATH: str = ""
+    INGESTION_JOB_WORKERS: int = 4
+    INGESTION_JOB_HISTORY: int = 1000
+    PDF_PARSER_WORKERS: int = 2
+    PDF_PARSE_TIMEOUT_SECONDS: float = 120.0
+    PDF_MAX_PAGES: int = 2000
+    PDF_STREAMING_MIN_PAGES: int = 200
+    PDF_STREAMING_WINDOW_PAGES: int = 16
+    # il boilerplate dipende dai documenti già caricati: lo stesso file può dare
+    # chunk diversi man mano che il corpus cresce, e in quel caso replace_document
+    # ricalcola gli embedding dei chunk cambiati invece di riusarli
+    BOILERPLATE_FILTER_ENABLED: bool = False
+    BOILERPLATE_MIN_DOCUMENTS: int = 3
+    BOILERPLATE_DOCUMENT_RATIO: float = 0.2
+    BOILERPLATE_STRIP_REPEATED_TITLE: bool = False
+    NEAR_DUPLICATE_FILTER_ENABLED: bool = True
+    NEAR_DUPLICATE_THRESHOLD: float = 0.9
+    EVENT_LOOP_MONITOR_INTERVAL_MS: float = 100
     CHUNK_SIZE: int = 400
     CHUNK_OVERLAP: int = 100
     model_config = SettingsConfigDict()
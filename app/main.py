@@ -1,12 +1,63 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.routes import llm, documents, faq
+from app.routes import llm, documents, faq, metrics
+from app.services.llm_response_service import (
+    get_llm_response_service,
+    close_llm_response_service,
+)
+from app.services.vector_database_service import (
+    get_shared_vector_database,
+    close_shared_vector_database,
+)
+from app.services.database_api_service import close_database_api_client
+from app.services.ingest_manifest_service import close_ingest_manifest
+from app.services.file_manager_service import close_pdf_executor
+from app.services.conversation_memory_service import close_conversation_memory
+from app.services.session_service import close_session_store
+from app.services.event_loop_monitor_service import (
+    get_event_loop_monitor,
+    close_event_loop_monitor,
+)
+from app.services.ingestion_job_service import (
+    get_ingestion_job_manager,
+    close_ingestion_job_manager,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Crea una sola volta LLM, provider di embedding e database vettoriale,
+    condivisi da tutte le richieste, e avvia i worker dei caricamenti in background
+    e la misura del ritardo dell'event loop.
+    Allo spegnimento li rilascia insieme al pool di connessioni verso il Database API
+    e al pool di processi per la lettura dei PDF.
+    """
+    get_shared_vector_database().open()
+    get_llm_response_service()
+    get_ingestion_job_manager().start()
+    get_event_loop_monitor().start()
+    yield
+    await close_event_loop_monitor()
+    await close_ingestion_job_manager()
+    await close_llm_response_service()
+    await close_conversation_memory()
+    await close_session_store()
+    await close_shared_vector_database()
+    await close_database_api_client()
+    close_ingest_manifest()
+    close_pdf_executor()
+
 
 app = FastAPI(
     title="LLM API",
     description="LLM API for the Suppl-AI project",
     version="0.2",
+    lifespan=lifespan,
 )
 
 app.include_router(llm.router)
 app.include_router(documents.router)
 app.include_router(faq.router)
+app.include_router(metrics.router)
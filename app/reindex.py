@@ -0,0 +1,318 @@
+"""
+Ricostruisce il database vettoriale a partire dai file nella cartella dei
+documenti caricati (DOCUMENTS_DIR).
+
+I file vengono letti e divisi in chunk dal file manager del loro tipo, come
+un caricamento dall'API: i chunk hanno lo stesso percorso come source e
+passano per gli stessi filtri del boilerplate e dei quasi duplicati.
+Gli embedding sono calcolati in blocchi concorrenti e scritti nel database
+in blocco. Il progresso è salvato in un checkpoint: un reindex interrotto
+riprende dai file non ancora completati, dei file modificati dopo l'ultimo
+reindex vengono sostituiti i chunk e di quelli eliminati rimossi.
+
+Uso:
+    python -m app.reindex [--folder /data/documents] [--workers 4] [--reset]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.services.file_manager_service import (
+    close_pdf_executor,
+    get_documents_dir,
+    get_file_manager_by_extension,
+    run_in_ingest_executor,
+)
+from app.services.ingest_manifest_service import IngestManifest, get_ingest_manifest
+from app.services.vector_database_service import (
+    VectorDatabase,
+    get_shared_vector_database,
+)
+from app.utils import count_tokens, get_uuid3
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+
+def list_files(folder: str) -> list[str]:
+    """Restituisce i file supportati nella cartella, in ordine."""
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith(SUPPORTED_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+async def parse_file(file_path: str) -> list[Document]:
+    """
+    Legge e divide un file in chunk con il file manager del suo tipo,
+    scartando i quasi duplicati di chunk già salvati.
+    """
+    file_manager = get_file_manager_by_extension(file_path)
+    # la versione già indicizzata non conta come duplicato di quella nuova
+    file_manager._forget_boilerplate(file_path)
+    chunks = await file_manager._load_split_file(file_path)
+    return await run_in_ingest_executor(
+        file_manager._drop_duplicates, file_path, chunks
+    )
+
+
+def file_sha256(file_path: str) -> str:
+    """Restituisce lo SHA-256 del contenuto del file, letto a blocchi."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(settings.UPLOAD_CHUNK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """File JSON con i file già indicizzati e la loro data di modifica."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def is_done(self, file_path: str) -> bool:
+        return self.files.get(file_path) == os.path.getmtime(file_path)
+
+    def is_changed(self, file_path: str) -> bool:
+        """True se il file è già stato indicizzato in una versione precedente."""
+        return file_path in self.files and not self.is_done(file_path)
+
+    def missing_files(self) -> list[str]:
+        """Restituisce i file indicizzati che non esistono più."""
+        return [f for f in self.files if not os.path.exists(f)]
+
+    def mark_done(self, file_paths: list[str]):
+        for file_path in file_paths:
+            self.files[file_path] = os.path.getmtime(file_path)
+        self._save()
+
+    def remove(self, file_paths: list[str]):
+        for file_path in file_paths:
+            self.files.pop(file_path, None)
+        self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.files = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def _embed(vector_database: VectorDatabase, texts, batch_size, concurrency):
+    """Calcola gli embedding dei testi in blocchi, con al più concurrency blocchi in volo."""
+    embedding_function = vector_database.embedding_provider.get_embedding_function()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch):
+        async with semaphore:
+            return await asyncio.to_thread(embedding_function.embed_documents, batch)
+
+    batches = await asyncio.gather(
+        *(
+            embed_batch(texts[i : i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        )
+    )
+    return [embedding for batch in batches for embedding in batch]
+
+
+async def reindex(
+    folder: str | None = None,
+    vector_database: VectorDatabase | None = None,
+    checkpoint_path: str | None = None,
+    workers: int = os.cpu_count() or 1,
+    batch_size: int = 256,
+    concurrency: int = 4,
+    reset: bool = False,
+    manifest: IngestManifest | None = None,
+) -> dict:
+    """
+    Indicizza i file della cartella (di default DOCUMENTS_DIR) non ancora
+    presenti nel checkpoint e li registra nel registro dei file indicizzati,
+    come un caricamento dall'API. I chunk dei file del checkpoint che non
+    esistono più vengono rimossi. Al più workers file sono letti in parallelo.
+
+    Returns:
+    - dict: Le statistiche del reindex (file, chunk, token, tempi).
+    """
+    folder = folder or get_documents_dir()
+    vector_database = vector_database or get_shared_vector_database()
+    manifest = manifest or get_ingest_manifest()
+    checkpoint = Checkpoint(
+        checkpoint_path
+        or os.path.join(vector_database.persist_directory, "reindex_checkpoint.json")
+    )
+    if reset:
+        vector_database.delete_all_documents()
+        manifest.clear()
+        checkpoint.clear()
+
+    # file eliminati dopo l'ultimo reindex
+    removed = checkpoint.missing_files()
+    for file_path in removed:
+        vector_database.delete_document(file_path)
+        manifest.remove_source(file_path)
+        get_file_manager_by_extension(file_path)._forget_boilerplate(file_path)
+    if removed:
+        checkpoint.remove(removed)
+
+    files = list_files(folder)
+    pending = [f for f in files if not checkpoint.is_done(f)]
+    stats = {
+        "files": 0,
+        "skipped_files": len(files) - len(pending),
+        "updated_files": 0,
+        "removed_files": len(removed),
+        "chunks": 0,
+        "skipped_chunks": 0,
+        "tokens": 0,
+    }
+    start = time.perf_counter()
+    seen_ids = set()
+    group_size = batch_size * concurrency
+
+    async def flush(group):
+        group_files = [file_path for file_path, _ in group]
+        group_chunks = [chunk for _, chunks in group for chunk in chunks]
+        for file_path in group_files:
+            # chunk della versione precedente del file modificato
+            if checkpoint.is_changed(file_path):
+                vector_database.delete_document(file_path)
+                stats["updated_files"] += 1
+        ids = [get_uuid3(chunk.page_content) for chunk in group_chunks]
+        existing = vector_database.get_existing_ids(ids) if ids else set()
+        chunks = []
+        for doc_id, chunk in zip(ids, group_chunks):
+            # chunk già salvati da un run interrotto o identici tra file diversi
+            if doc_id in existing or doc_id in seen_ids:
+                stats["skipped_chunks"] += 1
+                continue
+            seen_ids.add(doc_id)
+            chunks.append(chunk)
+        if chunks:
+            texts = [c.page_content for c in chunks]
+            embeddings = await _embed(vector_database, texts, batch_size, concurrency)
+            vector_database.add_documents(chunks, embeddings=embeddings)
+            stats["chunks"] += len(chunks)
+            stats["tokens"] += sum(
+                count_tokens(text, settings.EMBEDDING_MODEL_NAME) for text in texts
+            )
+        # un caricamento dello stesso contenuto dall'API riceve 409
+        for file_path, file_chunks in group:
+            manifest.add(
+                await asyncio.to_thread(file_sha256, file_path),
+                file_path,
+                [get_uuid3(chunk.page_content) for chunk in file_chunks],
+            )
+        checkpoint.mark_done(group_files)
+        stats["files"] += len(group_files)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Reindex: {stats['files']}/{len(pending)} file in {elapsed:.1f}s")
+
+    def submit(file_path):
+        return asyncio.ensure_future(parse_file(file_path))
+
+    queue = deque()
+    try:
+        # al più workers file in lettura: il parsing non accumula chunk
+        # in memoria se gli embedding sono più lenti
+        next_files = iter(pending)
+        for file_path in next_files:
+            queue.append((file_path, submit(file_path)))
+            if len(queue) >= max(workers, 1):
+                break
+
+        group, group_size_chunks = [], 0
+        while queue:
+            file_path, task = queue.popleft()
+            next_file = next(next_files, None)
+            if next_file is not None:
+                queue.append((next_file, submit(next_file)))
+            try:
+                chunks = await task
+            except Exception as e:
+                logger.error(f"Errore nel processare il file {file_path}: {e}")
+                continue
+            group.append((file_path, chunks))
+            group_size_chunks += len(chunks)
+            if group_size_chunks >= group_size:
+                await flush(group)
+                group, group_size_chunks = [], 0
+        if group:
+            await flush(group)
+    finally:
+        for _, task in queue:
+            task.cancel()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["files_per_second"] = stats["files"] / elapsed if elapsed else 0.0
+    stats["chunks_per_second"] = stats["chunks"] / elapsed if elapsed else 0.0
+    stats["tokens_per_second"] = stats["tokens"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Ricostruisce il database vettoriale dai file in DOCUMENTS_DIR."
+    )
+    parser.add_argument("--folder", default=None)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="svuota il database e ignora il checkpoint",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        stats = asyncio.run(
+            reindex(
+                folder=args.folder,
+                checkpoint_path=args.checkpoint,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                concurrency=args.concurrency,
+                reset=args.reset,
+            )
+        )
+    finally:
+        close_pdf_executor()
+    print(
+        f"Indicizzati {stats['files']} file ({stats['skipped_files']} già presenti), "
+        f"{stats['chunks']} chunk ({stats['skipped_chunks']} duplicati), "
+        f"{stats['tokens']} token in {stats['seconds']:.1f}s: "
+        f"{stats['files_per_second']:.1f} file/s, "
+        f"{stats['chunks_per_second']:.1f} chunk/s, "
+        f"{stats['tokens_per_second']:.0f} token/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
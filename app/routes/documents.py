@@ -1,11 +1,16 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi.responses import JSONResponse
 from typing import List
+import asyncio
 import os
 
+from app.config import settings
+
 from app.services.file_manager_service import (
     get_file_manager,
     get_file_manager_by_extension,
 )
+from app.services.ingestion_job_service import get_ingestion_job_manager
 
 import app.schemas as schemas
 
@@ -17,12 +22,18 @@ router = APIRouter(
 
 
 @router.post("")
-async def upload_file(files: List[UploadFile], token: str):
+async def upload_file(
+    files: List[UploadFile],
+    token: str,
+    background: bool = False,
+):
     """
     Carica il file nel database vettoriale.
 
     ### Args:
     * **files (List[UploadFile])**: I file da caricare. Devono essere file di testo o PDF.
+    * **background (bool)**: Se vero, i file vengono salvati e indicizzati in background:
+      la risposta (202) contiene gli id dei job da consultare con GET /documents/jobs/{id}.
 
     ### Raises:
     * **HTTPException.400_BAD_REQUEST**: Se non sono stati forniti file o se i file non sono di tipo testo o PDF.
@@ -32,49 +43,57 @@ async def upload_file(files: List[UploadFile], token: str):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
-    processed_files_count = 0
-    errors = []
+    semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+    jobs = []
 
-    for file in files:
+    async def process_file(file: UploadFile):
+        """Carica un file; restituisce None se riuscito, altrimenti l'errore."""
         if not file.filename:
-            errors.append({"filename": "N/A", "detail": "No filename provided"})
-            continue
+            return {"filename": "N/A", "detail": "No filename provided"}
         if not file.filename.endswith((".txt", ".pdf")):
-            errors.append(
-                {"filename": file.filename, "detail": "Only txt/pdf files are allowed"}
-            )
-            continue
+            return {"filename": file.filename, "detail": "Only txt/pdf files are allowed"}
         if file.content_type not in ("text/plain", "application/pdf"):
-            errors.append(
-                {
-                    "filename": file.filename,
-                    "detail": f"Invalid content type: {file.content_type}",
-                }
-            )
-            continue
-
-        try:
-            print(f"Processing file: {file.filename}")
-            file_manager = get_file_manager(file)
-            await file_manager.add_document(file, token)  # Passa il singolo file
-            processed_files_count += 1
-        except HTTPException as e:
-            print(f"HTTPException processing {file.filename}: {e.detail}")
-            errors.append(
-                {
+            return {
+                "filename": file.filename,
+                "detail": f"Invalid content type: {file.content_type}",
+            }
+
+        async with semaphore:
+            try:
+                print(f"Processing file: {file.filename}")
+                file_manager = get_file_manager(file)
+                if background:
+                    file_path, sha256 = await file_manager._save_new_file(file)
+                    try:
+                        job = get_ingestion_job_manager().submit(
+                            file_manager, file_path, file.filename, token, sha256
+                        )
+                    except BaseException:
+                        file_manager._discard_new_file(file_path, sha256)
+                        raise
+                    jobs.append({"filename": file.filename, "job_id": job.id})
+                else:
+                    await file_manager.add_document(file, token)  # Passa il singolo file
+                return None
+            except HTTPException as e:
+                print(f"HTTPException processing {file.filename}: {e.detail}")
+                return {
                     "filename": file.filename,
                     "detail": e.detail,
                     "status_code": e.status_code,
                 }
-            )
-        except Exception as e:
-            print(f"Exception processing {file.filename}: {e}")
-            errors.append(
-                {
+            except Exception as e:
+                print(f"Exception processing {file.filename}: {e}")
+                return {
                     "filename": file.filename,
                     "detail": f"Internal server error during processing: {str(e)}",
                 }
-            )
+
+    # I file vengono caricati in parallelo (al più UPLOAD_CONCURRENCY alla volta);
+    # gli errori restano nell'ordine dei file ricevuti
+    results = await asyncio.gather(*(process_file(file) for file in files))
+    errors = [error for error in results if error is not None]
+    processed_files_count = len(results) - len(errors)
 
     if processed_files_count == 0 and errors:
         first_error = errors[0]
@@ -82,6 +101,18 @@ async def upload_file(files: List[UploadFile], token: str):
             status_code=first_error.get("status_code", 400),
             detail=f"Failed to process any files. First error on '{first_error.get('filename', 'N/A')}': {first_error.get('detail', 'Unknown error')}",
         )
+    elif background:
+        # ordine dei file ricevuti, non di completamento del salvataggio
+        order = {file.filename: i for i, file in enumerate(files)}
+        jobs.sort(key=lambda job: order.get(job["filename"], 0))
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": f"Accepted {len(jobs)} files for processing.",
+                "jobs": jobs,
+                "errors": errors,
+            },
+        )
     elif errors:
         return {
             "message": f"Processed {processed_files_count} files with {len(errors)} errors.",
@@ -94,6 +125,61 @@ async def upload_file(files: List[UploadFile], token: str):
         }
 
 
+@router.put("")
+async def replace_file(file: UploadFile, token: str):
+    """
+    Sostituisce un documento già caricato con una nuova versione, ricalcolando
+    gli embedding solo dei chunk cambiati.
+
+    ### Args:
+    * **file (UploadFile)**: La nuova versione del file, con lo stesso nome. Deve essere un file di testo o PDF.
+    * **token (str)**: Il token di autenticazione, verificato con il Database API.
+
+    ### Returns:
+    * **dict**: chunk aggiunti, rimossi, invariati ed embedding risparmiati.
+
+    ### Raises:
+    * **HTTPException.400_BAD_REQUEST**: Se il file non è di tipo testo o PDF.
+    * **HTTPException.401_UNAUTHORIZED**: Se il token non è valido.
+    * **HTTPException.404_NOT_FOUND**: Se il documento da sostituire non esiste.
+    * **HTTPException.409_CONFLICT**: Se il contenuto è già indicizzato come un altro documento.
+    * **HTTPException.500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante la sostituzione.
+    """
+    if not file.filename or not file.filename.endswith((".txt", ".pdf")):
+        raise HTTPException(status_code=400, detail="Only txt/pdf files are allowed")
+    if file.content_type not in ("text/plain", "application/pdf"):
+        raise HTTPException(
+            status_code=400, detail=f"Invalid content type: {file.content_type}"
+        )
+
+    try:
+        file_manager = get_file_manager(file)
+        stats = await file_manager.replace_document(file, token)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in replacing file: {str(e)}")
+
+    return {"message": f"File {file.filename} replaced successfully", **stats}
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.IngestionJob)
+async def get_job(job_id: str):
+    """
+    Restituisce lo stato di un caricamento in background.
+
+    ### Returns:
+    * **schemas.IngestionJob**: La fase corrente, il numero di chunk e la durata di ogni fase.
+
+    ### Raises:
+    * **HTTPException.404_NOT_FOUND**: Se il job non esiste.
+    """
+    job = get_ingestion_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
 @router.delete("")
 async def delete_file(fileDelete: schemas.DocumentDelete):
     """
@@ -18,6 +18,7 @@ async def generate_chat_response(
 
     ### Args:
         * **question (schemas.Question)**: La domanda e lo storico dei messaggi.
+          Con un session_id lo storico è conservato dal servizio: basta inviare la nuova domanda.
 
     ### Returns:
         * **response**: La risposta generata dal modello LLM.
@@ -30,7 +31,7 @@ async def generate_chat_response(
     if not question.question or question.question.strip() == "":
         raise HTTPException(status_code=400, detail="Nessuna domanda fornita")
 
-    return llm_response_service.generate_llm_response(question)
+    return await llm_response_service.generate_llm_response(question)
 
 
 @router.post("/chat_name")
@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+
+from app.services.vector_database_service import get_shared_vector_database
+from app.services.boilerplate_service import get_boilerplate_stats
+from app.services.event_loop_monitor_service import get_event_loop_stats
+from app.services.prompt_builder_service import get_prompt_stats
+from app.services.conversation_memory_service import get_conversation_memory_stats
+from app.services.session_service import get_session_stats
+from app.services.answer_cache_service import get_answer_cache_stats
+from app.services.llm_response_service import get_faq_fast_path_stats
+
+router = APIRouter(
+    tags=["metrics"],
+)
+
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    Restituisce le metriche delle cache del servizio.
+
+    ### Returns:
+    * **dict**: Hit, miss e dimensione della cache delle ricerche e di quella degli embedding,
+      byte, chunk e token di embedding risparmiati dal filtro del boilerplate,
+      istogramma cumulativo del ritardo dell'event loop, token dei prompt inviati al modello,
+      riassunti delle conversazioni riusati e calcolati, sessioni in memoria,
+      hit rate e secondi di generazione risparmiati dalla cache delle risposte,
+      domande a cui è stato risposto direttamente con una FAQ.
+    """
+    return {
+        "vector_database": get_shared_vector_database().stats(),
+        "boilerplate": get_boilerplate_stats(),
+        "event_loop": get_event_loop_stats(),
+        "prompt": get_prompt_stats(),
+        "conversation_memory": get_conversation_memory_stats(),
+        "sessions": get_session_stats(),
+        "answer_cache": get_answer_cache_stats(),
+        "faq_fast_path": get_faq_fast_path_stats(),
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
 from uuid import UUID
 
@@ -12,6 +12,7 @@ class Message(BaseModel):
 class Question(BaseModel):
     question: str
     messages: List[Message] = []
+    session_id: Optional[str] = None
 
 
 class Context(BaseModel):
@@ -33,6 +34,17 @@ class DocumentDelete(DocumentBase):
     current_password: str
 
 
+class IngestionJob(BaseModel):
+    id: str
+    filename: str
+    stage: str
+    chunks: Optional[int] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created_at: datetime
+    timings: Dict[str, float] = {}
+
+
 class FAQBase(BaseModel):
     title: str
     question: str
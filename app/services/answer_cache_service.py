@@ -0,0 +1,183 @@
+"""
+Cache semantica delle risposte della chat.
+
+Una domanda riceve la risposta già data a una domanda precedente se:
+- l'embedding delle due domande ha similarità del coseno almeno pari alla soglia;
+- il contesto recuperato è lo stesso (stessi id dei chunk, nello stesso ordine);
+- lo storico della conversazione è lo stesso (di solito vuoto).
+Le risposte sono legate alla generazione del database vettoriale: dopo ogni
+scrittura la cache viene svuotata.
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedAnswer:
+    __slots__ = ("group", "embedding", "chunks", "seconds", "expires_at")
+
+    def __init__(self, group, embedding, chunks, seconds, expires_at):
+        self.group = group
+        self.embedding = embedding
+        self.chunks = chunks
+        self.seconds = seconds
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Risposte indicizzate per (id del contesto, storico) e confrontate per
+    similarità della domanda. Politica LRU e scadenza opzionale; thread-safe.
+
+    Param:
+    - max_entries: int - Le risposte da tenere in memoria.
+    - threshold: float - La similarità del coseno minima tra le domande.
+    - ttl: float - Secondi dopo cui una risposta scade (0: mai).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.ANSWER_CACHE_MAX_ENTRIES,
+        threshold: float = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl: float = settings.ANSWER_CACHE_TTL_SECONDS,
+    ):
+        self._max_entries = max_entries
+        self.threshold = threshold
+        self._ttl = ttl
+        self._entries: OrderedDict[int, _CachedAnswer] = OrderedDict()
+        self._groups: dict[tuple, set[int]] = {}
+        self._next_key = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self, generation: int):
+        """Svuota la cache se il database è cambiato. Va chiamato con _lock."""
+        if generation == self._generation:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._groups.clear()
+        self._generation = generation
+
+    def _remove(self, key: int):
+        """Va chiamato con _lock."""
+        entry = self._entries.pop(key)
+        group = self._groups.get(entry.group)
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[entry.group]
+
+    def get(
+        self, embedding, context_ids: tuple, history_key: str, generation: int
+    ) -> list[str] | None:
+        """
+        Restituisce i pezzi della risposta salvata per una domanda simile,
+        con lo stesso contesto e storico, o None.
+        """
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation(generation)
+            best_key, best_similarity = None, self.threshold
+            for key in list(self._groups.get((context_ids, history_key), ())):
+                entry = self._entries[key]
+                if entry.expires_at is not None and entry.expires_at < now:
+                    self._remove(key)
+                    continue
+                similarity = float(vector @ entry.embedding)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.seconds_saved += entry.seconds
+            return list(entry.chunks)
+
+    def set(
+        self,
+        embedding,
+        context_ids: tuple,
+        history_key: str,
+        generation: int,
+        chunks: list[str],
+        seconds: float,
+    ):
+        """
+        Salva la risposta, se generation (quella in cui è stato recuperato il
+        contesto) non è più vecchia di quella già vista dalla cache.
+
+        Param:
+        - chunks: list[str] - I pezzi della risposta, come sono stati inviati.
+        - seconds: float - Il tempo impiegato dal modello per la risposta.
+        """
+        if self._max_entries <= 0:
+            return
+        group = (context_ids, history_key)
+        expires_at = time.monotonic() + self._ttl if self._ttl else None
+        entry = _CachedAnswer(
+            group, self._normalize(embedding), list(chunks), seconds, expires_at
+        )
+        with self._lock:
+            if self._generation is not None and generation < self._generation:
+                return
+            self._check_generation(generation)
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "size": len(self._entries),
+                "max_size": self._max_entries,
+                "invalidations": self.invalidations,
+                "seconds_saved": self.seconds_saved,
+            }
+
+
+_answer_cache: AnswerCache | None = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """Restituisce la cache delle risposte condivisa dall'intero processo."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def get_answer_cache_stats() -> dict:
+    """Statistiche della cache delle risposte, vuote se non è in uso."""
+    if _answer_cache is None:
+        return {}
+    return _answer_cache.stats()
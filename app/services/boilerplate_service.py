@@ -0,0 +1,468 @@
+"""
+Rimozione del boilerplate e dei chunk quasi duplicati durante il caricamento.
+
+Le schede prodotto ripetono le stesse frasi del sito (menu, "Aggiungi ai
+preferiti Scheda in PDF Condividi via mail ...", footer) e il titolo più volte
+all'inizio. Il testo viene diviso in segmenti ai confini delle frasi e dei
+campi ("Peso: 1 kg"); i segmenti presenti in una buona parte dei documenti del
+corpus vengono tolti interi prima della divisione in chunk e, se richiesto,
+anche le ripetizioni del titolo. I campi non vengono mai toccati, così i dati
+del prodotto restano nel testo. I chunk quasi uguali a uno già salvato
+(similarità di Jaccard stimata con MinHash e trovata con LSH) non vengono salvati.
+Le due parti si attivano separatamente (BOILERPLATE_FILTER_ENABLED e
+NEAR_DUPLICATE_FILTER_ENABLED).
+
+Le statistiche del corpus non vengono congelate per documento: se il corpus
+cresce, un segmento può diventare boilerplate e la stessa versione di un file
+dare chunk (e id) diversi, che replace_document indicizza di nuovo.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.services.vector_database_service import get_shared_vector_database
+from app.utils import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\S+")
+# fine frase, a capo o più spazi consecutivi (separatori dei blocchi della pagina)
+_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\s*\n\s*|\s{2,}")
+# titolo della scheda: il testo prima di " - " o del primo separatore
+_TITLE_RE = re.compile(r"^(.+?)(?:\s+-\s+|\s{2,}|\n|$)")
+_FIELD_KEY_WORDS = 5
+# preposizioni che possono unire le parole di una chiave
+_KEY_CONNECTORS = {
+    "a", "al", "con", "d'", "da", "dei", "del", "della", "delle", "di", "e", "in", "per"
+}
+_TITLE_MAX_WORDS = 12
+_PRIME = (1 << 31) - 1
+
+
+def _shingle_hashes(words: list[str], size: int) -> list[int]:
+    """Restituisce l'hash di ogni sequenza di size parole consecutive."""
+    return [
+        zlib.crc32(" ".join(words[i : i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    ]
+
+
+def _key_start(words: list[re.Match], colon: int, first: int) -> int | None:
+    """
+    Restituisce l'indice della prima parola della chiave che termina con la
+    parola colon, cercandola tra le parole da first in poi: l'ultima parola
+    maiuscola, estesa all'indietro alle parole maiuscole precedenti, anche se
+    unite da una preposizione ("Paese e Luogo di Origine:"). None se non c'è.
+    """
+    first = max(first, colon - _FIELD_KEY_WORDS + 1)
+
+    def capitalized(i: int) -> bool:
+        return words[i].group()[0].isupper()
+
+    start = colon
+    while start >= first and not capitalized(start):
+        start -= 1
+    if start < first:
+        return None
+    while start > first:
+        if capitalized(start - 1):
+            start -= 1
+        elif (
+            start - 2 >= first
+            and words[start - 1].group().lower() in _KEY_CONNECTORS
+            and capitalized(start - 2)
+        ):
+            start -= 2
+        else:
+            break
+    return start
+
+
+def _split_fields(text: str, start: int, end: int) -> list[tuple[int, int, bool]]:
+    """
+    Divide text[start:end] prima di ogni chiave di un campo ("Paese di Origine:").
+    Nel dubbio la chiave comincia qualche parola prima, così non viene mai divisa.
+
+    Returns:
+    - list[tuple[int, int, bool]]: Inizio, fine e se il segmento è un campo.
+    """
+    words = list(_WORD_RE.finditer(text, start, end))
+    starts = []
+    previous_key = -1
+    for i, word in enumerate(words):
+        if not word.group().endswith(":") or len(word.group()) < 2:
+            continue
+        # la chiave non comprende le parole del campo precedente
+        key = _key_start(words, i, previous_key + 1)
+        if key is not None:
+            starts.append(words[key].start())
+        previous_key = i
+    bounds = [start, *(s for s in starts if s > start), end]
+    return [
+        (a, b, a in starts) for a, b in zip(bounds, bounds[1:]) if text[a:b].strip()
+    ]
+
+
+def _segments(text: str) -> list[tuple[int, int, bool]]:
+    """Divide il testo in segmenti ai confini delle frasi e dei campi."""
+    segments = []
+    position = 0
+    for boundary in _BOUNDARY_RE.finditer(text):
+        segments.extend(_split_fields(text, position, boundary.start()))
+        position = boundary.end()
+    segments.extend(_split_fields(text, position, len(text)))
+    return segments
+
+
+def _title_pattern(text: str) -> re.Pattern | None:
+    """
+    Restituisce l'espressione che trova il titolo della scheda (il testo prima
+    di " - " o del primo separatore), None se è troppo lungo per esserlo.
+    """
+    match = _TITLE_RE.match(text.lstrip())
+    title = match.group(1).strip() if match else ""
+    if not title or len(title.split()) > _TITLE_MAX_WORDS:
+        return None
+    return re.compile(rf"(?:^|\s+){re.escape(title)}(?=\s|$)")
+
+
+def _segment_hash(segment: str) -> int:
+    return zlib.crc32(" ".join(segment.lower().split()).encode("utf-8"))
+
+
+class BoilerplateFilter:
+    """
+    Statistiche del corpus per riconoscere il boilerplate e indice MinHash dei
+    chunk salvati per riconoscere i quasi duplicati. Thread-safe.
+
+    Param:
+    - min_documents: int - Documenti minimi in cui un segmento deve comparire.
+    - document_ratio: float - Frazione minima dei documenti in cui deve comparire.
+    - similarity_threshold: float - Similarità oltre cui un chunk è un duplicato.
+    - strip_repeated_title: bool - Se togliere le ripetizioni del titolo dopo la prima.
+    - min_words: int - Parole minime di un chunk dopo la pulizia.
+    - num_perm: int - Permutazioni della firma MinHash.
+    - bands: int - Bande LSH (num_perm deve esserne multiplo).
+    """
+
+    def __init__(
+        self,
+        min_documents: int = 3,
+        document_ratio: float = 0.2,
+        similarity_threshold: float = 0.9,
+        strip_repeated_title: bool = False,
+        min_words: int = 3,
+        num_perm: int = 64,
+        bands: int = 16,
+    ):
+        self.min_documents = min_documents
+        self.document_ratio = document_ratio
+        self.similarity_threshold = similarity_threshold
+        self.strip_repeated_title = strip_repeated_title
+        self.min_words = min_words
+        self.bands = bands
+        self._rows = num_perm // bands
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._document_frequency = Counter()
+        self._source_segments: dict[str, set[int]] = {}
+        self._signatures: dict[int, tuple[str, np.ndarray]] = {}
+        self._source_keys: dict[str, list[int]] = {}
+        self._buckets: dict[tuple[int, bytes], set[int]] = {}
+        self._next_key = 0
+        self._stats = {
+            "stripped_documents": 0,
+            "chunks": 0,
+            "empty_chunks_dropped": 0,
+            "duplicate_chunks_dropped": 0,
+            "bytes_saved": 0,
+            "tokens_saved": 0,
+        }
+
+    # statistiche del corpus
+    def observe(self, source: str, texts: list[str]):
+        """Aggiunge alle statistiche del corpus i segmenti dei testi del documento."""
+        segments = set()
+        for text in texts:
+            segments.update(
+                _segment_hash(text[start:end])
+                for start, end, is_field in _segments(text)
+                if not is_field
+            )
+        with self._lock:
+            known = self._source_segments.setdefault(source, set())
+            new = segments - known
+            known.update(new)
+            self._document_frequency.update(new)
+
+    def observe_folder(self, folder: str):
+        """Aggiunge alle statistiche i file di testo della cartella."""
+        if not os.path.isdir(folder):
+            return
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not name.lower().endswith(".txt") or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.observe(path, [f.read()])
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Boilerplate: impossibile leggere {path}: {e}")
+
+    def remove_source(self, source: str):
+        """Dimentica un documento, dalle statistiche del corpus e dall'indice MinHash."""
+        with self._lock:
+            segments = self._source_segments.pop(source, set())
+            self._document_frequency.subtract(segments)
+            for segment in segments:
+                if self._document_frequency[segment] <= 0:
+                    del self._document_frequency[segment]
+            for key in self._source_keys.pop(source, []):
+                _, signature = self._signatures.pop(key)
+                for band in self._band_keys(signature):
+                    bucket = self._buckets.get(band)
+                    if bucket is not None:
+                        bucket.discard(key)
+                        if not bucket:
+                            del self._buckets[band]
+
+    def rename_source(self, old_source: str, new_source: str):
+        """Sposta le statistiche e le firme di un documento sotto un altro nome."""
+        with self._lock:
+            segments = self._source_segments.pop(old_source, None)
+            if segments is not None:
+                self._source_segments[new_source] = segments
+            keys = self._source_keys.pop(old_source, [])
+            for key in keys:
+                self._signatures[key] = (new_source, self._signatures[key][1])
+            if keys:
+                self._source_keys.setdefault(new_source, []).extend(keys)
+
+    def _boilerplate_threshold(self) -> int:
+        documents = len(self._source_segments)
+        return max(self.min_documents, math.ceil(self.document_ratio * documents))
+
+    def strip(self, text: str) -> str:
+        """
+        Toglie dal testo i segmenti comuni a molti documenti e, con
+        strip_repeated_title, le ripetizioni del titolo dopo la prima.
+        I segmenti dei campi restano sempre interi.
+        """
+        segments = _segments(text)
+        with self._lock:
+            threshold = self._boilerplate_threshold()
+            frequencies = [
+                0 if is_field else self._document_frequency.get(
+                    _segment_hash(text[start:end]), 0
+                )
+                for start, end, is_field in segments
+            ]
+        title_re = _title_pattern(text) if self.strip_repeated_title else None
+
+        kept = []
+        changed = False
+        previous_end = None
+        for i, ((start, end, is_field), frequency) in enumerate(
+            zip(segments, frequencies)
+        ):
+            if frequency >= threshold:
+                changed = True
+                continue
+            segment = text[start:end].strip()
+            if title_re is not None and not is_field:
+                # la prima occorrenza del titolo, all'inizio del testo, resta
+                prefix, rest = "", segment
+                if i == 0 and (match := title_re.match(segment)):
+                    prefix, rest = segment[: match.end()], segment[match.end() :]
+                rest, repeated = title_re.subn("", rest)
+                if repeated:
+                    changed = True
+                    segment = (prefix + rest).strip()
+                    if not segment:
+                        continue
+            if previous_end is not None:
+                gap = text[previous_end:start]
+                kept.append("\n" if "\n" in gap else " ")
+            kept.append(segment)
+            previous_end = start + len(text[start:end].rstrip())
+        if not changed:
+            return text
+        stripped = "".join(kept)
+        self._record_saved(text, stripped, "stripped_documents")
+        return stripped
+
+    # quasi duplicati
+    def signature(self, text: str) -> np.ndarray:
+        """Restituisce la firma MinHash degli shingle di tre parole del testo."""
+        words = [w.lower() for w in _WORD_RE.findall(text)]
+        shingles = _shingle_hashes(words, 3) or _shingle_hashes(words, len(words))
+        hashes = np.array(shingles or [0], dtype=np.uint64) % _PRIME
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        rows = self._rows
+        return [
+            (band, signature[band * rows : (band + 1) * rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _find_duplicate(self, signature: np.ndarray) -> bool:
+        """Va chiamato con _lock."""
+        candidates = set()
+        for band in self._band_keys(signature):
+            candidates.update(self._buckets.get(band, ()))
+        for key in candidates:
+            _, other = self._signatures[key]
+            if np.mean(signature == other) >= self.similarity_threshold:
+                return True
+        return False
+
+    def _index(self, source: str, signature: np.ndarray):
+        """Va chiamato con _lock."""
+        key = self._next_key
+        self._next_key += 1
+        self._signatures[key] = (source, signature)
+        self._source_keys.setdefault(source, []).append(key)
+        for band in self._band_keys(signature):
+            self._buckets.setdefault(band, set()).add(key)
+
+    def index(self, source: str, texts: list[str]):
+        """Aggiunge all'indice MinHash dei chunk già salvati, senza filtrarli."""
+        signatures = [self.signature(text) for text in texts]
+        with self._lock:
+            for signature in signatures:
+                self._index(source, signature)
+
+    def _is_empty(self, text: str) -> bool:
+        if len(_WORD_RE.findall(text)) < self.min_words:
+            self._record_saved(text, "", "empty_chunks_dropped")
+            return True
+        return False
+
+    def drop_empty(self, chunks: list[Document]) -> list[Document]:
+        """Scarta i chunk rimasti quasi vuoti dopo la pulizia."""
+        kept = [chunk for chunk in chunks if not self._is_empty(chunk.page_content)]
+        with self._lock:
+            self._stats["chunks"] += len(chunks)
+        return kept
+
+    def drop_duplicates(
+        self, source: str, chunks: list[Document], drop_empty: bool = True
+    ) -> list[Document]:
+        """
+        Scarta i chunk rimasti quasi vuoti dopo la pulizia e quelli quasi
+        uguali a un chunk già salvato, aggiungendo gli altri all'indice.
+
+        Param:
+        - source: str - Il documento da cui provengono i chunk.
+        - chunks: list[Document] - I chunk da salvare.
+        - drop_empty: bool - Se scartare i chunk quasi vuoti.
+
+        Returns:
+        - list[Document]: I chunk rimasti.
+        """
+        kept = []
+        for chunk in chunks:
+            text = chunk.page_content
+            if drop_empty and self._is_empty(text):
+                continue
+            signature = self.signature(text)
+            with self._lock:
+                duplicate = self._find_duplicate(signature)
+                if not duplicate:
+                    self._index(source, signature)
+            if duplicate:
+                self._record_saved(text, "", "duplicate_chunks_dropped")
+                continue
+            kept.append(chunk)
+        with self._lock:
+            self._stats["chunks"] += len(chunks)
+        return kept
+
+    def _record_saved(self, original: str, cleaned: str, counter: str = None):
+        """Aggiorna i byte e i token di embedding risparmiati."""
+        saved_bytes = len(original.encode("utf-8")) - len(cleaned.encode("utf-8"))
+        saved_tokens = count_tokens(
+            original, settings.EMBEDDING_MODEL_NAME
+        ) - count_tokens(cleaned, settings.EMBEDDING_MODEL_NAME)
+        with self._lock:
+            if counter is not None:
+                self._stats[counter] += 1
+            self._stats["bytes_saved"] += saved_bytes
+            self._stats["tokens_saved"] += max(saved_tokens, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "documents": len(self._source_segments),
+                "indexed_chunks": len(self._signatures),
+            }
+
+
+_boilerplate_filter: BoilerplateFilter | None = None
+_boilerplate_filter_lock = threading.Lock()
+
+
+def get_boilerplate_filter() -> BoilerplateFilter:
+    """
+    Restituisce il filtro condiviso. Alla creazione le statistiche del corpus
+    sono calcolate dai file di testo già caricati (con BOILERPLATE_FILTER_ENABLED)
+    e l'indice MinHash dai chunk già presenti nel database vettoriale
+    (con NEAR_DUPLICATE_FILTER_ENABLED).
+    """
+    global _boilerplate_filter
+    with _boilerplate_filter_lock:
+        if _boilerplate_filter is None:
+            boilerplate_filter = BoilerplateFilter(
+                min_documents=settings.BOILERPLATE_MIN_DOCUMENTS,
+                document_ratio=settings.BOILERPLATE_DOCUMENT_RATIO,
+                similarity_threshold=settings.NEAR_DUPLICATE_THRESHOLD,
+                strip_repeated_title=settings.BOILERPLATE_STRIP_REPEATED_TITLE,
+            )
+            if settings.BOILERPLATE_FILTER_ENABLED:
+                boilerplate_filter.observe_folder(
+                    os.environ.get("DOCUMENTS_DIR", "/data/documents")
+                )
+            if settings.NEAR_DUPLICATE_FILTER_ENABLED:
+                _index_stored_chunks(boilerplate_filter)
+            _boilerplate_filter = boilerplate_filter
+    return _boilerplate_filter
+
+
+def _index_stored_chunks(boilerplate_filter: BoilerplateFilter):
+    """Aggiunge all'indice MinHash i chunk già presenti nel database vettoriale."""
+    try:
+        stored = get_shared_vector_database().get_all_documents()
+    except Exception as e:
+        logger.warning(f"Boilerplate: impossibile leggere i chunk salvati: {e}")
+        return
+    if not isinstance(stored, dict) or not stored.get("documents"):
+        return
+    by_source = {}
+    for text, metadata in zip(stored["documents"], stored["metadatas"]):
+        source = (metadata or {}).get("source", "")
+        by_source.setdefault(source, []).append(text)
+    for source, texts in by_source.items():
+        boilerplate_filter.index(source, texts)
+
+
+def get_boilerplate_stats() -> dict:
+    """Statistiche del filtro, vuote se non è ancora stato usato."""
+    if _boilerplate_filter is None:
+        return {}
+    return _boilerplate_filter.stats()
+
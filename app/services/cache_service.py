@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Cache in memoria con politica LRU e scadenza (TTL) opzionale delle voci.
+    È thread-safe: viene usata anche dai thread del pool di ricerca.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Restituisce il valore associato alla chiave, o default se assente o scaduto."""
+        with self._lock:
+            value, expires_at = self._data.get(key, (_MISSING, None))
+            if value is not _MISSING and expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                value = _MISSING
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Inserisce la voce, eliminando quelle usate meno di recente oltre max_size."""
+        if self._max_size <= 0:
+            return
+        expires_at = time.monotonic() + self._ttl if self._ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value, _ = self._data.pop(key, (default, None))
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Restituisce hit, miss, hit rate e dimensione della cache."""
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "size": len(self._data),
+            "max_size": self._max_size,
+        }
+
+
+class QueryCache:
+    """
+    Cache delle ricerche nel database vettoriale:
+    - domanda normalizzata -> embedding della domanda;
+    - (domanda normalizzata, k) -> chunk trovati.
+
+    I risultati sono legati a un contatore di generazione, incrementato a ogni
+    scrittura nel database vettoriale: una ricerca iniziata prima di una scrittura
+    non può quindi salvare risultati che la scrittura ha reso obsoleti.
+    Gli embedding delle domande non dipendono dal contenuto del database
+    e restano validi fino alla scadenza.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        self._embeddings = LRUCache(max_size, ttl)
+        self._results = LRUCache(max_size, ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalizza la domanda: maiuscole, spazi e punteggiatura finale non contano."""
+        query = unicodedata.normalize("NFC", query).lower()
+        return " ".join(query.split()).rstrip("?!. ")
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get_embedding(self, query: str):
+        return self._embeddings.get(self.normalize(query))
+
+    def set_embedding(self, query: str, embedding):
+        self._embeddings.set(self.normalize(query), embedding)
+
+    def get_results(self, query: str, results_number: int):
+        results = self._results.get(
+            (self._generation, self.normalize(query), results_number)
+        )
+        return list(results) if results is not None else None
+
+    def set_results(self, query: str, results_number: int, generation: int, results):
+        """Salva i risultati solo se nessuna scrittura è avvenuta durante la ricerca."""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._results.set(
+                (generation, self.normalize(query), results_number), list(results)
+            )
+
+    def invalidate(self):
+        """Rende obsoleti tutti i risultati salvati (da chiamare dopo ogni scrittura)."""
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
+        logger.debug(f"QueryCache: nuova generazione {self._generation}")
+
+    def stats(self) -> dict:
+        return {
+            "generation": self._generation,
+            "embeddings": self._embeddings.stats(),
+            "results": self._results.stats(),
+        }
@@ -0,0 +1,199 @@
+"""
+Riassunto progressivo delle conversazioni lunghe.
+
+Degli ultimi CONVERSATION_RECENT_MESSAGES messaggi viene inviato il testo
+integrale; i precedenti sono sostituiti da un riassunto prodotto in background
+da un modello economico (SUMMARY_LLM_MODEL_NAME). I riassunti sono salvati in
+una cache LRU indicizzata dall'hash della parte di conversazione riassunta:
+il client rimanda ogni volta l'intero storico, quindi ai turni successivi il
+riassunto si ritrova senza ricalcolarlo, e il nuovo riassunto parte dal più
+lungo già disponibile aggiungendo solo i messaggi successivi. Un nuovo
+riassunto viene calcolato solo quando i messaggi non ancora riassunti sono
+almeno CONVERSATION_SUMMARY_MIN_NEW_MESSAGES, non a ogni turno.
+La risposta non aspetta mai il riassunto: finché non è pronto si usa quello
+precedente seguito dai messaggi non ancora riassunti.
+"""
+
+import asyncio
+import hashlib
+import logging
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app import schemas
+from app.config import settings
+from app.services.cache_service import LRUCache
+from app.services.llm_service import LLM, get_llm_model
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Riassumi la conversazione tra utente e chatbot in poche frasi, mantenendo "
+    "i prodotti, i codici e le preferenze dell'utente citati. Rispondi solo con il riassunto."
+)
+
+
+def prefix_hashes(messages: list[schemas.Message]) -> list[str]:
+    """
+    Restituisce l'hash di ogni prefisso dello storico: l'elemento i identifica
+    i primi i + 1 messaggi.
+    """
+    hashes = []
+    digest = b""
+    for message in messages:
+        digest = hashlib.sha256(
+            digest
+            + message.sender.encode("utf-8")
+            + b"\0"
+            + message.content.encode("utf-8")
+            + b"\0"
+        ).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+class ConversationMemory:
+    """
+    Comprime lo storico della conversazione con un riassunto dei messaggi meno recenti.
+
+    Param:
+    - llm: LLM - Il modello usato per i riassunti.
+    - recent_messages: int - I messaggi più recenti da inviare integralmente.
+    - min_new_messages: int - I messaggi non riassunti oltre cui aggiornare il riassunto.
+    - cache_size: int - I riassunti da tenere in memoria.
+    """
+
+    def __init__(
+        self,
+        llm: LLM = None,
+        recent_messages: int = settings.CONVERSATION_RECENT_MESSAGES,
+        min_new_messages: int = settings.CONVERSATION_SUMMARY_MIN_NEW_MESSAGES,
+        cache_size: int = settings.CONVERSATION_SUMMARY_CACHE_SIZE,
+    ):
+        self._llm = llm
+        self.recent_messages = recent_messages
+        self.min_new_messages = max(1, min_new_messages)
+        self._summaries = LRUCache(cache_size)
+        self._pending: dict[str, asyncio.Task] = {}
+        self._stats = {
+            "requests": 0,
+            "hits": 0,
+            "partial_hits": 0,
+            "misses": 0,
+            "deferred": 0,
+            "summaries_computed": 0,
+            "summary_errors": 0,
+        }
+
+    def _get_llm(self) -> LLM:
+        if self._llm is None:
+            self._llm = get_llm_model(settings.SUMMARY_LLM_MODEL_NAME or None)
+        return self._llm
+
+    def compact(
+        self, messages: list[schemas.Message]
+    ) -> tuple[str, list[schemas.Message]]:
+        """
+        Restituisce il riassunto disponibile e i messaggi da inviare integralmente,
+        avviando in background il riassunto dei messaggi meno recenti se manca
+        e i messaggi non ancora riassunti sono almeno min_new_messages.
+
+        Returns:
+        - tuple[str, list[schemas.Message]]: Il riassunto (vuoto se non ce n'è
+          ancora uno) e i messaggi successivi al riassunto.
+        """
+        if len(messages) <= self.recent_messages:
+            return "", messages
+        self._stats["requests"] += 1
+        older = len(messages) - self.recent_messages
+        hashes = prefix_hashes(messages[:older])
+
+        summary = self._summaries.get(hashes[-1])
+        if summary is not None:
+            self._stats["hits"] += 1
+            return summary, messages[older:]
+
+        # il riassunto più lungo già pronto, da cui partire
+        covered, summary = 0, ""
+        for i in range(older - 1, 0, -1):
+            cached = self._summaries.get(hashes[i - 1])
+            if cached is not None:
+                covered, summary = i, cached
+                break
+        self._stats["partial_hits" if covered else "misses"] += 1
+        if older - covered < self.min_new_messages:
+            # troppo pochi messaggi nuovi per una chiamata al modello
+            self._stats["deferred"] += 1
+        else:
+            self._schedule(hashes[-1], summary, messages[covered:older])
+        return summary, messages[covered:]
+
+    def _schedule(self, key: str, summary: str, messages: list[schemas.Message]):
+        if key in self._pending:
+            return
+        task = asyncio.create_task(self._summarize(key, summary, messages))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _summarize(self, key: str, summary: str, messages: list[schemas.Message]):
+        conversation = "\n".join(f"{m.sender}: {m.content}" for m in messages)
+        prompt = [
+            SystemMessage(SUMMARY_INSTRUCTIONS),
+            HumanMessage(
+                f"Riassunto precedente: {summary}\n\nNuovi messaggi:\n{conversation}"
+            ),
+        ]
+        try:
+            response = await self._get_llm()._model.ainvoke(prompt)
+        except Exception as e:
+            self._stats["summary_errors"] += 1
+            logger.warning(f"Errore nel riassunto della conversazione: {e}")
+            return
+        self._summaries.set(key, response.content)
+        self._stats["summaries_computed"] += 1
+
+    async def wait_pending(self):
+        """Attende i riassunti in corso."""
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "cached_summaries": len(self._summaries),
+            "pending": len(self._pending),
+        }
+
+    async def aclose(self):
+        """Annulla i riassunti in corso e chiude il modello."""
+        for task in list(self._pending.values()):
+            task.cancel()
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self._llm is not None:
+            await self._llm.aclose()
+
+
+_conversation_memory: ConversationMemory | None = None
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """Restituisce la memoria delle conversazioni condivisa dall'intero processo."""
+    global _conversation_memory
+    if _conversation_memory is None:
+        _conversation_memory = ConversationMemory()
+    return _conversation_memory
+
+
+async def close_conversation_memory():
+    """Annulla i riassunti in corso e chiude il modello dei riassunti, se presente."""
+    global _conversation_memory
+    if _conversation_memory is not None:
+        await _conversation_memory.aclose()
+        _conversation_memory = None
+
+
+def get_conversation_memory_stats() -> dict:
+    """Statistiche dei riassunti, vuote se la memoria non è in uso."""
+    if _conversation_memory is None:
+        return {}
+    return _conversation_memory.stats()
@@ -0,0 +1,102 @@
+import logging
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseAPIClient:
+    """
+    Client HTTP asincrono verso il Database API.
+
+    Mantiene un pool di connessioni keep-alive condiviso da tutte le richieste,
+    così le chiamate non bloccano l'event loop e non riaprono una connessione TCP ogni volta.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.DATABASE_API_URL,
+        timeout: float = settings.DATABASE_API_TIMEOUT,
+        max_connections: int = settings.DATABASE_API_MAX_CONNECTIONS,
+        max_keepalive_connections: int = settings.DATABASE_API_MAX_KEEPALIVE_CONNECTIONS,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self._base_url = base_url
+        self._timeout = httpx.Timeout(timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._transport = transport
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            logger.info(f"DatabaseAPIClient: apertura del pool verso {self._base_url}")
+            self._client = httpx.AsyncClient(
+                base_url=self._base_url,
+                timeout=self._timeout,
+                limits=self._limits,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def request(
+        self, method: str, path: str, token: str = None, json: dict = None
+    ) -> httpx.Response:
+        """
+        Esegue una richiesta verso il Database API.
+
+        Param:
+        - method: str - Il metodo HTTP.
+        - path: str - Il percorso relativo all'URL base.
+        - token: str - Il token di autenticazione, inviato come Bearer.
+        - json: dict - Il corpo della richiesta.
+
+        Returns:
+        - httpx.Response: La risposta del Database API.
+        """
+        headers = {"Content-Type": "application/json"}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        return await self._get_client().request(
+            method, path, headers=headers, json=json
+        )
+
+    async def get(self, path: str, token: str = None):
+        return await self.request("GET", path, token=token)
+
+    async def post(self, path: str, token: str = None, json: dict = None):
+        return await self.request("POST", path, token=token, json=json)
+
+    async def patch(self, path: str, token: str = None, json: dict = None):
+        return await self.request("PATCH", path, token=token, json=json)
+
+    async def delete(self, path: str, token: str = None, json: dict = None):
+        return await self.request("DELETE", path, token=token, json=json)
+
+    async def aclose(self):
+        """Chiude il pool di connessioni."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_database_api_client: DatabaseAPIClient | None = None
+
+
+def get_database_api_client() -> DatabaseAPIClient:
+    """Restituisce il client del Database API condiviso dall'intero processo."""
+    global _database_api_client
+    if _database_api_client is None:
+        _database_api_client = DatabaseAPIClient()
+    return _database_api_client
+
+
+async def close_database_api_client():
+    """Chiude il client condiviso del Database API, se presente."""
+    global _database_api_client
+    if _database_api_client is not None:
+        await _database_api_client.aclose()
+        _database_api_client = None
@@ -1,7 +1,19 @@
 from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
+import hashlib
+import logging
+import math
 import os
+import sqlite3
+import threading
+import time
 from app.config import settings
+from app.services.lexical_index_service import tokenize
+
+logger = logging.getLogger(__name__)
 
 
 class EmbeddingProvider(ABC):
@@ -12,6 +24,10 @@ class EmbeddingProvider(ABC):
         """Restituisce la funzione di embedding."""
         pass
 
+    async def aclose(self):
+        """Rilascia le risorse (es. connessioni HTTP) del provider."""
+        pass
+
 
 class OpenAIEmbeddingProvider(EmbeddingProvider):
     """Provider di embedding di OpenAI."""
@@ -36,13 +52,379 @@ class OpenAIEmbeddingProvider(EmbeddingProvider):
             )
         return self._embedding_function
 
+    async def aclose(self):
+        """Chiude i client HTTP di OpenAI creati dalla funzione di embedding."""
+        if self._embedding_function is None:
+            return
+        client = getattr(self._embedding_function.client, "_client", None)
+        if client is not None:
+            client.close()
+        async_client = getattr(self._embedding_function.async_client, "_client", None)
+        if async_client is not None:
+            await async_client.close()
+        self._embedding_function = None
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Funzione di embedding locale e deterministica, senza chiamate di rete:
+    i token del testo (gli stessi della ricerca lessicale) e le coppie di token
+    consecutivi vengono proiettati con feature hashing su un vettore di
+    dimensions componenti, pesati con 1 + log(tf) e normalizzati.
+    Pensata per benchmark e test offline, non per la qualità delle risposte.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _feature(self, feature: str) -> tuple[int, float]:
+        digest = int.from_bytes(
+            hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        sign = 1.0 if digest >> 63 else -1.0
+        return digest % self.dimensions, sign
+
+    def _embed(self, text: str) -> list[float]:
+        tokens = tokenize(text)
+        counts = {}
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        vector = [0.0] * self.dimensions
+        for feature, count in counts.items():
+            index, sign = self._feature(feature)
+            weight = 1.0 + math.log(count)
+            vector[index] += sign * (weight if " " not in feature else weight / 2)
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Provider di embedding locale basato su feature hashing."""
+
+    def __init__(self, dimensions: int = settings.HASHING_EMBEDDING_DIMENSIONS):
+        self._embedding_function = HashingEmbeddings(dimensions)
+
+    def get_embedding_function(self) -> HashingEmbeddings:
+        return self._embedding_function
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Funzione di embedding che salva su disco (SQLite) i vettori dei documenti,
+    indicizzati per (nome del modello, SHA-256 del testo).
+    Un testo già visto non viene più inviato al provider.
+    Le voci meno usate di recente vengono eliminate oltre max_entries.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        path: str,
+        max_entries: int = settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self._embeddings = embeddings
+        self._model_name = model_name
+        self._path = path
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        # SQLite limita il numero di parametri per query
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [self._model_name, *batch],
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def _evict(self):
+        (entries,) = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = entries - self._max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            logger.info(f"CachedEmbeddings: eliminate {excess} voci dalla cache")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [self._hash(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(list(set(hashes)))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        computed = {}
+        if missing:
+            vectors = self._embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+
+        now = time.time()
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                [(now, self._model_name, text_hash) for text_hash in cached],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (self._model_name, text_hash, array("f", vector).tobytes(), now)
+                    for text_hash, vector in computed.items()
+                ],
+            )
+            self._evict()
+            self._connection.commit()
+
+        vectors = {**cached, **computed}
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embeddings.embed_query(text)
+
+    def stats(self) -> dict:
+        """Restituisce i contatori di hit/miss e il numero di voci in cache."""
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+            "max_entries": self._max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Funzione di embedding che raggruppa le richieste concorrenti di più thread
+    (es. upload in parallelo) in blocchi da al più batch_size testi.
+    Il primo thread in attesa fa da leader: aspetta al più max_wait secondi
+    che il blocco si riempia e lo invia al provider per tutti gli altri.
+    """
 
-def get_embedding_provider() -> EmbeddingProvider:
-    """Restituisce il provider di embedding in base alla configurazione."""
-    provider = settings.LLM_PROVIDER.lower()
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        max_wait: float = settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self._embeddings = embeddings
+        self._batch_size = batch_size
+        self._max_wait = max_wait
+        self._condition = threading.Condition()
+        self._pending: list[tuple[list[str], Future]] = []
+        self._pending_texts = 0
+        self._collecting = False
+        self.requests = 0
+        self.batches = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        future = Future()
+        with self._condition:
+            self._pending.append((list(texts), future))
+            self._pending_texts += len(texts)
+            self.requests += 1
+            leader = not self._collecting
+            self._collecting = True
+            self._condition.notify()
+        if leader:
+            self._flush()
+        return future.result()
+
+    def _flush(self):
+        deadline = time.monotonic() + self._max_wait
+        with self._condition:
+            while self._pending_texts < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            # da qui un nuovo arrivato diventa leader del blocco successivo
+            pending, self._pending = self._pending, []
+            self._pending_texts = 0
+            self._collecting = False
+
+        texts = [text for request_texts, _ in pending for text in request_texts]
+        try:
+            vectors = []
+            for start in range(0, len(texts), self._batch_size):
+                vectors.extend(
+                    self._embeddings.embed_documents(
+                        texts[start : start + self._batch_size]
+                    )
+                )
+                self.batches += 1
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future in pending:
+            future.set_result(vectors[offset : offset + len(request_texts)])
+            offset += len(request_texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embeddings.embed_query(text)
+
+
+class BatchingEmbeddingProvider(EmbeddingProvider):
+    """Provider che raggruppa in blocchi le richieste di embedding di un altro provider."""
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        max_wait: float = settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self._provider = provider
+        self._batch_size = batch_size
+        self._max_wait = max_wait
+        self._embedding_function = None
+
+    def get_embedding_function(self) -> BatchingEmbeddings:
+        if self._embedding_function is None:
+            self._embedding_function = BatchingEmbeddings(
+                self._provider.get_embedding_function(),
+                self._batch_size,
+                self._max_wait,
+            )
+        return self._embedding_function
+
+    async def aclose(self):
+        self._embedding_function = None
+        await self._provider.aclose()
+
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """Provider che aggiunge la cache persistente degli embedding a un altro provider."""
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        model_name: str = settings.EMBEDDING_MODEL_NAME,
+        cache_path: str = None,
+        max_entries: int = settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self._provider = provider
+        self._model_name = model_name
+        self._cache_path = cache_path or os.path.join(
+            settings.VECTOR_DB_DIRECTORY, "embedding_cache.sqlite3"
+        )
+        self._max_entries = max_entries
+        self._embedding_function = None
+
+    def get_embedding_function(self) -> CachedEmbeddings:
+        """Restituisce la funzione di embedding con cache."""
+        if self._embedding_function is None:
+            self._embedding_function = CachedEmbeddings(
+                self._provider.get_embedding_function(),
+                self._model_name,
+                self._cache_path,
+                self._max_entries,
+            )
+        return self._embedding_function
+
+    def stats(self) -> dict:
+        """Restituisce le statistiche della cache (vuote se non ancora aperta)."""
+        if self._embedding_function is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": None}
+        return self._embedding_function.stats()
+
+    async def aclose(self):
+        if self._embedding_function is not None:
+            self._embedding_function.close()
+            self._embedding_function = None
+        await self._provider.aclose()
+
+
+def get_embedding_provider(cache_directory: str = None) -> EmbeddingProvider:
+    """
+    Restituisce il provider di embedding in base alla configurazione
+    (EMBEDDING_PROVIDER, o LLM_PROVIDER se non impostato; con il provider
+    LLM "fake" gli embedding sono quelli locali di feature hashing).
+    Se EMBEDDING_BATCH_ENABLED è attivo, le richieste concorrenti vengono
+    raggruppate in blocchi; se EMBEDDING_CACHE_ENABLED è attivo, il provider
+    viene avvolto dalla cache persistente, salvata in cache_directory
+    (default: VECTOR_DB_DIRECTORY), così solo i testi nuovi finiscono nei blocchi.
+    """
+    provider = (settings.EMBEDDING_PROVIDER or settings.LLM_PROVIDER).lower()
     match provider:
         case "openai":
-            return OpenAIEmbeddingProvider()
+            embedding_provider = OpenAIEmbeddingProvider()
+            model_name = settings.EMBEDDING_MODEL_NAME
+        case "hashing" | "fake":
+            embedding_provider = HashingEmbeddingProvider(
+                settings.HASHING_EMBEDDING_DIMENSIONS
+            )
+            model_name = f"hashing-{settings.HASHING_EMBEDDING_DIMENSIONS}"
             # aggiungere altri provider qui
         case _:
             raise ValueError(f"Provider di embedding '{provider}' non supportato.")
+
+    if settings.EMBEDDING_BATCH_ENABLED:
+        embedding_provider = BatchingEmbeddingProvider(embedding_provider)
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embedding_provider
+    cache_path = settings.EMBEDDING_CACHE_PATH or os.path.join(
+        cache_directory or settings.VECTOR_DB_DIRECTORY, "embedding_cache.sqlite3"
+    )
+    return CachedEmbeddingProvider(
+        embedding_provider,
+        model_name=model_name,
+        cache_path=cache_path,
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    )
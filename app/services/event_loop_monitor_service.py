@@ -0,0 +1,108 @@
+"""
+Misura del ritardo dell'event loop.
+
+Un task si risveglia ogni intervallo e misura di quanto è arrivato in ritardo
+rispetto al previsto: se il ritardo cresce, qualcosa sta bloccando l'event loop
+(codice sincrono, CPU satura) e tutte le richieste in corso ne risentono.
+I ritardi sono contati in un istogramma cumulativo, così chi legge le metriche
+a intervalli (ad esempio il test di carico) può calcolarne la differenza.
+"""
+
+import asyncio
+import logging
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# limiti superiori dei bucket dell'istogramma, in millisecondi
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf"))
+
+
+class EventLoopMonitor:
+    """
+    Campiona il ritardo dell'event loop.
+
+    Param:
+    - interval_ms: float - Intervallo tra due campioni; 0 disattiva la misura.
+    """
+
+    def __init__(self, interval_ms: float = settings.EVENT_LOOP_MONITOR_INTERVAL_MS):
+        self._interval = interval_ms / 1000
+        self._task: asyncio.Task | None = None
+        self._samples = 0
+        self._total_lag_ms = 0.0
+        self._max_lag_ms = 0.0
+        self._buckets = [0] * len(LAG_BUCKETS_MS)
+
+    def start(self):
+        """Avvia il campionamento sull'event loop corrente."""
+        if self._task is not None or self._interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run(), name="event-loop-monitor")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            self.record((time.perf_counter() - expected) * 1000)
+
+    def record(self, lag_ms: float):
+        """Aggiunge un campione all'istogramma."""
+        lag_ms = max(lag_ms, 0.0)
+        self._samples += 1
+        self._total_lag_ms += lag_ms
+        self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+        for i, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self._buckets[i] += 1
+                break
+
+    def stats(self) -> dict:
+        return {
+            "interval_ms": self._interval * 1000,
+            "samples": self._samples,
+            "mean_lag_ms": self._total_lag_ms / self._samples if self._samples else 0.0,
+            "max_lag_ms": self._max_lag_ms,
+            "total_lag_ms": self._total_lag_ms,
+            "buckets": {
+                str(bound): count for bound, count in zip(LAG_BUCKETS_MS, self._buckets)
+            },
+        }
+
+
+_event_loop_monitor: EventLoopMonitor | None = None
+
+
+def get_event_loop_monitor() -> EventLoopMonitor:
+    """Restituisce il monitor dell'event loop condiviso dall'intero processo."""
+    global _event_loop_monitor
+    if _event_loop_monitor is None:
+        _event_loop_monitor = EventLoopMonitor()
+    return _event_loop_monitor
+
+
+async def close_event_loop_monitor():
+    """Ferma il monitor dell'event loop, se presente."""
+    global _event_loop_monitor
+    if _event_loop_monitor is not None:
+        await _event_loop_monitor.stop()
+        _event_loop_monitor = None
+
+
+def get_event_loop_stats() -> dict:
+    """Statistiche del monitor, vuote se non è stato avviato."""
+    if _event_loop_monitor is None:
+        return {}
+    return _event_loop_monitor.stats()
@@ -3,23 +3,299 @@ from fastapi import Depends, File, UploadFile
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_core.documents import Document
+from pypdf import PdfReader
 from fastapi import HTTPException
+import asyncio
+import hashlib
 import os
+import tempfile
 import logging
-import json
-import requests
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
-from app.services.vector_database_service import get_vector_database
+from app.services.vector_database_service import get_shared_vector_database
+from app.services.database_api_service import get_database_api_client
+from app.services.lexical_index_service import extract_product_codes
+from app.services.ingest_manifest_service import get_ingest_manifest
+from app.services.boilerplate_service import get_boilerplate_filter
+from app.utils import get_uuid3
 import app.schemas as schemas
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
+_ingest_executor: ThreadPoolExecutor | None = None
+
+
+def _get_ingest_executor() -> ThreadPoolExecutor:
+    """
+    Pool di thread per le fasi bloccanti del caricamento (lettura, split,
+    embedding e scrittura nel database vettoriale), fuori dall'event loop.
+    """
+    global _ingest_executor
+    if _ingest_executor is None:
+        _ingest_executor = ThreadPoolExecutor(
+            max_workers=settings.UPLOAD_CONCURRENCY,
+            thread_name_prefix="file-ingest",
+        )
+    return _ingest_executor
+
+
+async def run_in_ingest_executor(func, *args):
+    """Esegue func nel pool del caricamento file."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_ingest_executor(), func, *args)
+
+
+def add_product_codes(data: list[Document], chunks: list[Document]):
+    """
+    Salva nei metadati di ogni chunk i codici prodotto ("Codice: 93002")
+    presenti nel file, così la ricerca per codice trova tutta la scheda.
+
+    Param:
+    - data: list[Document] - Il contenuto del file.
+    - chunks: list[Document] - I chunk ottenuti dal file.
+
+    Returns:
+    - list[Document]: I chunk con il metadato product_codes.
+    """
+    codes = extract_product_codes(" ".join(d.page_content for d in data))
+    if codes:
+        for chunk in chunks:
+            chunk.metadata["product_codes"] = ",".join(codes)
+    return chunks
+
+
+PDF_PAGES_DELIMITER = "\n\f"
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """Restituisce il numero di pagine del PDF, senza estrarne il testo."""
+    return len(PdfReader(file_path).pages)
+
+
+def load_pdf_file(file_path: str) -> list[Document]:
+    """
+    Estrae il testo di un PDF in un unico documento. Eseguita nei processi del
+    pool dei PDF (o in un thread se il pool è disattivato), quindi non deve
+    dipendere da stato del processo principale.
+
+    Param:
+    - file_path: str - Il percorso del file PDF.
+
+    Returns:
+    - list[Document]: Il contenuto del file.
+    """
+    loader = PyPDFLoader(file_path, mode="single")
+    return loader.load()
+
+
+def load_pdf_pages(file_path: str, start: int, stop: int) -> list[tuple[int, str]]:
+    """
+    Estrae il testo delle pagine da start a stop (esclusa) di un PDF, senza
+    leggere il resto del file. Eseguita come load_pdf_file.
+
+    Returns:
+    - list[tuple[int, str]]: Numero (da 0) e testo di ogni pagina.
+    """
+    reader = PdfReader(file_path)
+    return [
+        (number, reader.pages[number].extract_text().strip())
+        for number in range(start, min(stop, len(reader.pages)))
+    ]
+
+
+class PdfPageSplitter:
+    """
+    Divide in chunk le pagine di un PDF man mano che vengono estratte.
+    L'ultimo chunk non viene restituito ma riportato davanti alle pagine
+    successive, così i chunk sono gli stessi che si otterrebbero dividendo
+    tutto il testo in una volta. Ogni chunk riporta nei metadati la pagina
+    iniziale e finale e i codici prodotto di quelle pagine.
+
+    Param:
+    - file_path: str - Il percorso del file PDF.
+    - splitter: RecursiveCharacterTextSplitter - Lo splitter dei chunk.
+    - total_pages: int - Il numero di pagine del file.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        splitter: RecursiveCharacterTextSplitter,
+        total_pages: int,
+    ):
+        self.file_path = file_path
+        self.splitter = splitter
+        self.total_pages = total_pages
+        self._text = ""
+        self._starts: list[tuple[int, int]] = []
+        self._codes: dict[int, list[str]] = {}
+
+    def add_pages(self, pages: list[tuple[int, str]]) -> list[Document]:
+        """Aggiunge le pagine e restituisce i chunk completi."""
+        for number, page_text in pages:
+            if not page_text:
+                continue
+            if self._text:
+                self._text += PDF_PAGES_DELIMITER
+            self._starts.append((len(self._text), number))
+            self._codes[number] = extract_product_codes(page_text)
+            self._text += page_text
+        pieces = self._split()
+        if not pieces:
+            return []
+        carry_start, _ = pieces.pop()
+        chunks = self._make_chunks(pieces)
+        first_page = self._page_at(carry_start)
+        self._starts = [(0, first_page)] + [
+            (start - carry_start, number)
+            for start, number in self._starts
+            if start > carry_start
+        ]
+        self._codes = {n: c for n, c in self._codes.items() if n >= first_page}
+        self._text = self._text[carry_start:]
+        return chunks
+
+    def finish(self) -> list[Document]:
+        """Restituisce i chunk rimasti dopo l'ultima pagina."""
+        chunks = self._make_chunks(self._split())
+        self._text, self._starts, self._codes = "", [], {}
+        return chunks
+
+    def _split(self) -> list[tuple[int, str]]:
+        # posizione di ogni chunk nel testo, come con add_start_index di langchain
+        pieces = []
+        offset = 0
+        for piece in self.splitter.split_text(self._text) if self._text else []:
+            found = self._text.find(piece, offset)
+            offset = found if found >= 0 else offset
+            pieces.append((offset, piece))
+            offset = max(offset + 1, offset + len(piece) - self.splitter._chunk_overlap)
+        return pieces
+
+    def _page_at(self, offset: int) -> int:
+        """Restituisce la pagina che contiene il carattere in posizione offset."""
+        page = self._starts[0][1]
+        for start, number in self._starts:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def _make_chunks(self, pieces: list[tuple[int, str]]) -> list[Document]:
+        chunks = []
+        for piece_start, piece in pieces:
+            first = self._page_at(piece_start)
+            last = self._page_at(piece_start + len(piece) - 1)
+            metadata = {
+                "source": self.file_path,
+                "total_pages": self.total_pages,
+                "page": first,
+                "page_end": last,
+            }
+            codes = []
+            for number in range(first, last + 1):
+                for code in self._codes.get(number, []):
+                    if code not in codes:
+                        codes.append(code)
+            if codes:
+                metadata["product_codes"] = ",".join(codes)
+            chunks.append(Document(page_content=piece, metadata=metadata))
+        return chunks
+
+
+_pdf_executor: ProcessPoolExecutor | None = None
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """
+    Pool di processi per la lettura dei PDF: l'estrazione del testo è CPU-bound
+    e in un thread terrebbe il GIL, rallentando le risposte in streaming.
+    """
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=settings.PDF_PARSER_WORKERS)
+    return _pdf_executor
+
+
+def _reset_pdf_executor(executor: ProcessPoolExecutor):
+    """
+    Termina i processi del pool dei PDF; il prossimo PDF ne crea uno nuovo.
+    Serve dopo un timeout, perché un processo bloccato non si può interrompere.
+    """
+    global _pdf_executor
+    if _pdf_executor is executor:
+        _pdf_executor = None
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def close_pdf_executor():
+    """Chiude il pool dei PDF allo spegnimento dell'applicazione."""
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=True, cancel_futures=True)
+        _pdf_executor = None
+
+
+async def run_in_pdf_executor(func, *args):
+    """
+    Esegue func nel pool di processi dei PDF, con un tempo massimo.
+
+    Param:
+    - func: La funzione da eseguire, importabile dai processi del pool.
+    - args: Gli argomenti della funzione.
+
+    Returns:
+    - Il risultato di func.
+
+    Raises:
+    - HTTPException: Se la lettura supera il tempo massimo.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = _get_pdf_executor()
+        future = loop.run_in_executor(executor, func, *args)
+        try:
+            return await asyncio.wait_for(
+                future, timeout=settings.PDF_PARSE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout nella lettura del PDF {args[0]}")
+            _reset_pdf_executor(executor)
+            raise HTTPException(
+                status_code=422,
+                detail="Tempo massimo per la lettura del PDF superato",
+            )
+        except BrokenProcessPool:
+            # il pool è stato terminato per il timeout di un altro PDF
+            _reset_pdf_executor(executor)
+            if attempt:
+                raise
+
+
+def get_documents_dir() -> str:
+    """Restituisce la cartella dei documenti caricati (variabile DOCUMENTS_DIR)."""
+    return os.environ.get("DOCUMENTS_DIR", "/data/documents")
+
+
+def _uses_boilerplate_filter() -> bool:
+    return settings.BOILERPLATE_FILTER_ENABLED or settings.NEAR_DUPLICATE_FILTER_ENABLED
+
+
+def _remove_if_exists(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
 class FileManager(ABC):
     def __init__(self):
-        self._vector_database = get_vector_database()
+        self._vector_database = get_shared_vector_database()
+        self._database_api = get_database_api_client()
         self._splitter = RecursiveCharacterTextSplitter(
             chunk_size=settings.CHUNK_SIZE,
             chunk_overlap=settings.CHUNK_OVERLAP,
@@ -35,8 +311,32 @@ class FileManager(ABC):
         Returns:
         - str: Il percorso completo del file.
         """
-        documents_dir = os.environ.get("DOCUMENTS_DIR", "/data/documents")
-        return os.path.join(documents_dir, filename)
+        return os.path.join(get_documents_dir(), filename)
+
+    async def _verify_token(self, token: str):
+        """
+        Controlla con il Database API che il token sia valido.
+
+        Param:
+        - token: str - Il token di autenticazione.
+
+        Raises:
+        - HTTPException: 401 se il token non è valido, 500 se il Database API non risponde correttamente.
+        """
+        verify_response = await self._database_api.get("/auth/verify", token=token)
+        match verify_response.status_code:
+            case 200:
+                return
+            case 401 | 403:
+                raise HTTPException(
+                    status_code=401,
+                    detail="Token non valido",
+                )
+            case _:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Errore nella verifica del token",
+                )
 
     def get_documents_number(self):
         """
@@ -71,19 +371,60 @@ class FileManager(ABC):
         Returns:
         - str: Il percorso completo del file salvato.
         """
-        await file.seek(0)
-        contents = await file.read()
+        file_path, _ = await self._save_file_with_hash(file)
+        return file_path
 
-        path = file.filename
-        file_path = self.get_full_path(path)
+    async def _save_file_with_hash(self, file: File):
+        """
+        Salva il file nel filesystem a blocchi di UPLOAD_CHUNK_SIZE byte,
+        senza tenerlo tutto in memoria: le scritture avvengono fuori
+        dall'event loop su un file temporaneo nella stessa cartella,
+        rinominato atomicamente a fine scrittura. Calcola intanto lo SHA-256.
 
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        Param:
+        - file: File - Il file da salvare.
 
-        with open(file_path, "wb") as f:
-            f.write(contents)
-            logger.info(f"File salvato in {file_path}")
+        Returns:
+        - tuple[str, str]: Il percorso completo del file salvato e lo SHA-256 del contenuto.
+        """
+        file_path = self.get_full_path(file.filename)
+        tmp_path, sha256 = await self._save_temp_file(file, os.path.dirname(file_path))
+        try:
+            await asyncio.to_thread(os.replace, tmp_path, file_path)
+        except BaseException:
+            _remove_if_exists(tmp_path)
+            raise
+        logger.info(f"File salvato in {file_path}")
+
+        return file_path, sha256
+
+    async def _save_temp_file(self, file: File, directory: str):
+        """
+        Salva il file in un file temporaneo della cartella, a blocchi di
+        UPLOAD_CHUNK_SIZE byte scritti fuori dall'event loop, calcolandone lo SHA-256.
+        Se la scrittura fallisce il file temporaneo viene rimosso.
 
-        return file_path
+        Param:
+        - file: File - Il file da salvare.
+        - directory: str - La cartella in cui creare il file temporaneo.
+
+        Returns:
+        - tuple[str, str]: Il percorso del file temporaneo e lo SHA-256 del contenuto.
+        """
+        await file.seek(0)
+        os.makedirs(directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            _remove_if_exists(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest()
 
     @abstractmethod
     def _load_split_file(self, file_path: str):
@@ -100,13 +441,208 @@ class FileManager(ABC):
 
     async def add_document(self, file: File, token: str):
         """
-        Salva il file nel filesystem,
-        lo carica e lo divide in chunk,
+        Salva il file nel filesystem e lo indicizza (vedi _ingest_file).
+
+        Param:
+        - file: File - Il file da caricare.
+        - token: str - Il token di autenticazione.
+
+        Returns:
+        - bool: True se il file è stato caricato correttamente, False altrimenti.
+
+        Raises:
+        - HTTPException: Se il file è già esistente o se si verifica un errore durante il caricamento.
+        """
+        file_path, sha256 = await self._save_new_file(file)
+        return await self._ingest_file(file_path, file.filename, token, sha256=sha256)
+
+    async def _save_new_file(self, file: File):
+        """
+        Salva il file in un file temporaneo e lo sposta nel percorso finale
+        solo se il contenuto non è già indicizzato (vedi _check_not_indexed):
+        un file rifiutato non sovrascrive il documento con lo stesso nome.
+        Il contenuto resta segnato come in caricamento.
+
+        Param:
+        - file: File - Il file da salvare.
+
+        Returns:
+        - tuple[str, str]: Il percorso completo del file salvato e lo SHA-256 del contenuto.
+
+        Raises:
+        - HTTPException: 409 se il file è già indicizzato o già in caricamento.
+        """
+        file_path = self.get_full_path(file.filename)
+        tmp_path, sha256 = await self._save_temp_file(file, os.path.dirname(file_path))
+        try:
+            self._check_not_indexed(sha256)
+            try:
+                await asyncio.to_thread(os.replace, tmp_path, file_path)
+            except BaseException:
+                get_ingest_manifest().release(sha256)
+                raise
+        finally:
+            _remove_if_exists(tmp_path)
+        logger.info(f"File salvato in {file_path}")
+
+        return file_path, sha256
+
+    def _discard_new_file(self, file_path: str, sha256: str | None):
+        """
+        Annulla il caricamento di un file salvato con _save_new_file e non
+        indicizzato: toglie il segno di caricamento in corso e rimuove il file.
+        """
+        if sha256 is not None:
+            get_ingest_manifest().release(sha256)
+        _remove_if_exists(file_path)
+
+    def _check_not_indexed(self, sha256: str | None):
+        """
+        Controlla nel registro dei file indicizzati (in O(1), prima di leggere
+        e dividere il file) che lo stesso contenuto non sia già stato caricato,
+        e lo segna come in caricamento.
+
+        Param:
+        - sha256: str - Lo SHA-256 del contenuto del file.
+
+        Raises:
+        - HTTPException: 409 se il file è già indicizzato o già in caricamento.
+        """
+        if sha256 is None:
+            return
+        manifest = get_ingest_manifest()
+        entry = manifest.get(sha256)
+        if (
+            entry is not None
+            and entry["chunk_ids"]
+            and not self._vector_database.get_existing_ids(entry["chunk_ids"][:1])
+        ):
+            # il database vettoriale è stato svuotato o ricostruito dopo il caricamento
+            manifest.remove(sha256)
+            entry = None
+        if entry is not None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Documento già indicizzato: {os.path.basename(entry['source'])}",
+            )
+        if not manifest.claim(sha256):
+            raise HTTPException(
+                status_code=409,
+                detail="Documento già in caricamento",
+            )
+
+    def _strip_boilerplate(
+        self, file_path: str, data: list[Document]
+    ) -> list[Document]:
+        """
+        Aggiunge il contenuto del file alle statistiche del corpus e ne toglie
+        le frasi ripetute in molti documenti (menu, footer, titolo ripetuto).
+
+        Param:
+        - file_path: str - Il percorso completo del file.
+        - data: list[Document] - Il contenuto del file.
+
+        Returns:
+        - list[Document]: Il contenuto senza boilerplate.
+        """
+        if not settings.BOILERPLATE_FILTER_ENABLED:
+            return data
+        boilerplate_filter = get_boilerplate_filter()
+        boilerplate_filter.observe(file_path, [d.page_content for d in data])
+        return [
+            Document(
+                page_content=boilerplate_filter.strip(d.page_content),
+                metadata=d.metadata,
+            )
+            for d in data
+        ]
+
+    def _drop_duplicates(
+        self, file_path: str, chunks: list[Document]
+    ) -> list[Document]:
+        """
+        Scarta i chunk quasi uguali a un chunk già salvato e, se il boilerplate
+        viene tolto, quelli rimasti quasi vuoti.
+        """
+        if settings.NEAR_DUPLICATE_FILTER_ENABLED:
+            return get_boilerplate_filter().drop_duplicates(
+                file_path, chunks, drop_empty=settings.BOILERPLATE_FILTER_ENABLED
+            )
+        if settings.BOILERPLATE_FILTER_ENABLED:
+            return get_boilerplate_filter().drop_empty(chunks)
+        return chunks
+
+    def _forget_boilerplate(self, file_path: str):
+        """Toglie il file dalle statistiche del corpus e dall'indice dei duplicati."""
+        if _uses_boilerplate_filter():
+            get_boilerplate_filter().remove_source(file_path)
+
+    def _rename_boilerplate_source(self, old_path: str, new_path: str):
+        """Attribuisce al nuovo percorso le statistiche del corpus del file."""
+        if _uses_boilerplate_filter():
+            get_boilerplate_filter().rename_source(old_path, new_path)
+
+    async def _iter_split_file(self, file_path: str):
+        """
+        Restituisce i chunk del file a blocchi, man mano che sono pronti.
+        Di default il file viene diviso in un unico blocco.
+        """
+        yield await self._load_split_file(file_path)
+
+    async def _index_file(self, file_path: str, job=None) -> list[Document]:
+        """
+        Salva nel database vettoriale i chunk del file, un blocco alla volta,
+        scartando i quasi duplicati di chunk già salvati.
+        Se la lettura fallisce a metà, i blocchi già salvati vengono rimossi.
+
+        Param:
+        - file_path: str - Il percorso completo del file salvato.
+        - job: IngestionJob - Il job in background di cui aggiornare le fasi (opzionale).
+
+        Returns:
+        - list[Document]: I chunk salvati.
+        """
+        indexed = []
+        try:
+            async for chunks in self._iter_split_file(file_path):
+                chunks = await run_in_ingest_executor(
+                    self._drop_duplicates, file_path, chunks
+                )
+                if job is not None:
+                    if job.stage == job.PARSING:
+                        job.set_stage(job.INDEXING)
+                    job.chunks = len(indexed) + len(chunks)
+                await run_in_ingest_executor(
+                    self._vector_database.add_documents, chunks
+                )
+                indexed.extend(chunks)
+        except Exception:
+            self._forget_boilerplate(file_path)
+            if indexed:
+                await run_in_ingest_executor(
+                    self._vector_database.delete_chunks,
+                    [get_uuid3(chunk.page_content) for chunk in indexed],
+                )
+            raise
+        return indexed
+
+    async def _ingest_file(
+        self, file_path: str, title: str, token: str, job=None, sha256: str = None
+    ):
+        """
+        Carica il file salvato e lo divide in chunk,
         lo salva nel database vettoriale,
         e invia una richiesta al database API per caricarne il riferimento.
+        Le fasi bloccanti vengono eseguite nel pool del caricamento, così più
+        file possono essere indicizzati in parallelo e gli embedding dei loro
+        chunk vengono calcolati in blocchi condivisi.
 
         Param:
-        - file: File - Il file da caricare.
+        - file_path: str - Il percorso completo del file salvato.
+        - title: str - Il nome del file.
+        - token: str - Il token di autenticazione.
+        - job: IngestionJob - Il job in background di cui aggiornare le fasi (opzionale).
+        - sha256: str - Lo SHA-256 del file, registrato a caricamento riuscito (opzionale).
 
         Returns:
         - bool: True se il file è stato caricato correttamente, False altrimenti.
@@ -114,47 +650,128 @@ class FileManager(ABC):
         Raises:
         - HTTPException: Se il file è già esistente o se si verifica un errore durante il caricamento.
         """
+        try:
+            if job is not None:
+                job.set_stage(job.PARSING)
+            chunks = await self._index_file(file_path, job)
+
+            if job is not None:
+                job.set_stage(job.REGISTERING)
+
+            request_body = {
+                "file_path": file_path,
+                "title": title,
+                "owner_email": "test@test.it",
+                "uploaded_at": datetime.now().isoformat(),
+            }
+            upload_request_response = await self._database_api.post(
+                "/documents", token=token, json=request_body
+            )
+            print("upload_request_response:", upload_request_response.text)
+            match upload_request_response.status_code:
+                case 201:
+                    print(f"Documento caricato e splittato in {len(chunks)} chunk")
+                    if sha256 is not None:
+                        get_ingest_manifest().add(
+                            sha256,
+                            file_path,
+                            [get_uuid3(chunk.page_content) for chunk in chunks],
+                        )
+                    return True
+                case 400:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Documento già esistente",
+                    )
+                case 500:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Errore nel caricare e processare file",
+                    )
+                case _:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Errore nel caricare e processare file",
+                    )
+            return False
+        finally:
+            if sha256 is not None:
+                get_ingest_manifest().release(sha256)
+
+    async def replace_document(self, file: File, token: str) -> dict:
+        """
+        Sostituisce un documento già caricato con una nuova versione.
+        Vengono calcolati gli embedding solo dei chunk nuovi ed eliminati
+        solo i chunk non più presenti (gli id dei chunk derivano dal contenuto).
+        La nuova versione resta in un file temporaneo finché non è indicizzata:
+        se viene rifiutata o l'indicizzazione fallisce, sul disco resta quella precedente.
 
-        file_path = await self._save_file(file)
-        chunks = await self._load_split_file(file_path)
+        Param:
+        - file: File - La nuova versione del file, con lo stesso nome.
+        - token: str - Il token di autenticazione.
 
-        self._vector_database.add_documents(chunks)
+        Returns:
+        - dict: chunk aggiunti, rimossi, invariati ed embedding risparmiati.
 
-        request_body = {
-            "file_path": file_path,
-            "title": file.filename,
-            "owner_email": "test@test.it",
-            "uploaded_at": datetime.now().isoformat(),
-        }
-        upload_request_response = requests.post(
-            "http://database-api:8000/documents",
-            data=json.dumps(request_body),
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {token}",
-            },
-        )
-        print("upload_request_response:", upload_request_response.json())
-        match upload_request_response.status_code:
-            case 201:
-                print(f"Documento caricato e splittato in {len(chunks)} chunk")
-                return True
-            case 400:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Documento già esistente",
+        Raises:
+        - HTTPException: 401 se il token non è valido, 404 se il documento non
+          esiste, 409 se il contenuto è già indicizzato come un altro documento
+          o è già in caricamento.
+        """
+        await self._verify_token(token)
+
+        file_path = self.get_full_path(file.filename)
+        if not os.path.exists(file_path):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Documento {file.filename} non trovato",
+            )
+
+        tmp_path, sha256 = await self._save_temp_file(file, os.path.dirname(file_path))
+        try:
+            manifest = get_ingest_manifest()
+            entry = manifest.get(sha256)
+            if entry is not None and entry["source"] == file_path:
+                # stesso contenuto della versione indicizzata: niente da fare
+                unchanged = len(entry["chunk_ids"])
+                return {
+                    "added": 0,
+                    "removed": 0,
+                    "unchanged": unchanged,
+                    "embeddings_saved": unchanged,
+                }
+            self._check_not_indexed(sha256)
+
+            try:
+                # la versione precedente non conta come duplicato della nuova
+                self._forget_boilerplate(file_path)
+                chunks = await self._load_split_file(tmp_path)
+                self._rename_boilerplate_source(tmp_path, file_path)
+                for chunk in chunks:
+                    chunk.metadata["source"] = file_path
+                chunks = await run_in_ingest_executor(
+                    self._drop_duplicates, file_path, chunks
                 )
-            case 500:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Errore nel caricare e processare file",
+                stats = await run_in_ingest_executor(
+                    self._vector_database.replace_document, file_path, chunks
                 )
-            case _:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Errore nel caricare e processare file",
+                await asyncio.to_thread(os.replace, tmp_path, file_path)
+                manifest.add(
+                    sha256, file_path, [get_uuid3(chunk.page_content) for chunk in chunks]
                 )
-        return False
+            except BaseException:
+                self._forget_boilerplate(tmp_path)
+                raise
+            finally:
+                manifest.release(sha256)
+        finally:
+            _remove_if_exists(tmp_path)
+
+        logger.info(
+            f"Documento {file_path} sostituito: {stats['added']} chunk nuovi, "
+            f"{stats['removed']} rimossi, {stats['embeddings_saved']} embedding risparmiati"
+        )
+        return stats
 
     async def delete_document(
         self, file_id: str, file_path: str, token: str, current_password: str
@@ -170,12 +787,9 @@ class FileManager(ABC):
         """
 
         # rimuovi da Database API
-        delete_req = requests.delete(
-            f"http://database-api:8000/documents",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {token}",
-            },
+        delete_req = await self._database_api.delete(
+            "/documents",
+            token=token,
             json={
                 "admin": {
                     "current_password": current_password,
@@ -232,29 +846,123 @@ class FileManager(ABC):
 
         # rimuovi da database vettoriale
         self._vector_database.delete_document(file_path)
+        get_ingest_manifest().remove_source(file_path)
+        self._forget_boilerplate(file_path)
 
 
 class TextFileManager(FileManager):
     async def _load_split_file(self, file_path: str):
+        return await run_in_ingest_executor(self._split_file, file_path)
+
+    def _split_file(self, file_path: str):
         loader = TextLoader(file_path, encoding="utf-8")
-        data = loader.load()
+        data = self._strip_boilerplate(file_path, loader.load())
         chunks = self._splitter.split_documents(data)
-        return chunks
+        return add_product_codes(data, chunks)
 
 
 class PdfFileManager(FileManager):
     async def _load_split_file(self, file_path: str):
-        loader = PyPDFLoader(file_path, mode="single")
-        data = loader.load()
+        pages = await self._count_pages(file_path)
+        if self._is_streamed(pages):
+            chunks = []
+            async for batch in self._stream_split_file(file_path, pages):
+                chunks.extend(batch)
+            return chunks
+        data = await self._run_parser(load_pdf_file, file_path)
+        return await run_in_ingest_executor(self._split_data, file_path, data)
+
+    async def _iter_split_file(self, file_path: str):
+        pages = await self._count_pages(file_path)
+        if self._is_streamed(pages):
+            async for batch in self._stream_split_file(file_path, pages):
+                yield batch
+        else:
+            data = await self._run_parser(load_pdf_file, file_path)
+            yield await run_in_ingest_executor(self._split_data, file_path, data)
+
+    def _split_data(self, file_path: str, data: list[Document]):
+        data = self._strip_boilerplate(file_path, data)
         chunks = self._splitter.split_documents(data)
-        return chunks
+        return add_product_codes(data, chunks)
+
+    async def _run_parser(self, func, *args):
+        """Esegue l'estrazione del testo nel pool di processi dei PDF, o nel pool dei thread."""
+        if settings.PDF_PARSER_WORKERS > 0:
+            return await run_in_pdf_executor(func, *args)
+        return await run_in_ingest_executor(func, *args)
+
+    async def _count_pages(self, file_path: str) -> int | None:
+        """
+        Restituisce il numero di pagine del PDF, None se non serve saperlo.
+
+        Raises:
+        - HTTPException: 413 se il PDF supera PDF_MAX_PAGES.
+        """
+        if settings.PDF_MAX_PAGES <= 0 and settings.PDF_STREAMING_MIN_PAGES <= 0:
+            return None
+        pages = await run_in_ingest_executor(count_pdf_pages, file_path)
+        if 0 < settings.PDF_MAX_PAGES < pages:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Il PDF ha {pages} pagine, il massimo è {settings.PDF_MAX_PAGES}",
+            )
+        return pages
+
+    def _is_streamed(self, pages: int | None) -> bool:
+        """Indica se il PDF va letto a pagine invece che in una volta."""
+        return pages is not None and 0 < settings.PDF_STREAMING_MIN_PAGES <= pages
+
+    async def _stream_split_file(self, file_path: str, pages: int):
+        """
+        Legge il PDF a finestre di PDF_STREAMING_WINDOW_PAGES pagine e ne
+        restituisce i chunk in blocchi di EMBEDDING_BATCH_SIZE. La finestra
+        successiva viene letta mentre il blocco precedente è indicizzato.
+        """
+        window = max(1, settings.PDF_STREAMING_WINDOW_PAGES)
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        page_splitter = PdfPageSplitter(file_path, self._splitter, pages)
+        batch = []
+
+        def split_pages(page_texts):
+            data = self._strip_boilerplate(
+                file_path, [Document(page_content=text) for _, text in page_texts]
+            )
+            return page_splitter.add_pages(
+                [(n, d.page_content) for (n, _), d in zip(page_texts, data)]
+            )
+
+        pending = asyncio.ensure_future(
+            self._run_parser(load_pdf_pages, file_path, 0, window)
+        )
+        try:
+            for start in range(0, pages, window):
+                page_texts = await pending
+                pending = None
+                if start + window < pages:
+                    pending = asyncio.ensure_future(
+                        self._run_parser(
+                            load_pdf_pages, file_path, start + window, start + 2 * window
+                        )
+                    )
+                batch.extend(await run_in_ingest_executor(split_pages, page_texts))
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+            batch.extend(page_splitter.finish())
+            if batch:
+                yield batch
+        finally:
+            if pending is not None:
+                pending.cancel()
 
 
 class StringManager(FileManager):
     async def _load_split_file(self, faq: schemas.FAQ):
         data = Document(
             page_content=f"Domanda: {faq.question}\nRisposta: {faq.answer}",
-            metadata={"source": "faqs", "faq_id": faq.id},
+            # la risposta serve intera per rispondere direttamente alla FAQ
+            metadata={"source": "faqs", "faq_id": faq.id, "faq_answer": faq.answer},
         )
         print("[StringManager] data:", data)
         chunks = self._splitter.split_documents([data])
@@ -270,11 +978,7 @@ class StringManager(FileManager):
         """
         print("[StringManager] adding faq:", faq)
 
-        ris = requests.post(
-            "http://database-api:8000/faqs",
-            headers={"Authorization": f"Bearer {token}"},
-            json=faq.dict(),
-        )
+        ris = await self._database_api.post("/faqs", token=token, json=faq.dict())
         faq_json = ris.json()
 
         if ris.status_code != 201:
@@ -300,12 +1004,9 @@ class StringManager(FileManager):
         - token: str - Il token di autenticazione.
         """
         # rimuovi da Database API
-        delete_req = requests.delete(
-            f"http://database-api:8000/faqs/{faq.id}",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {token}",
-            },
+        delete_req = await self._database_api.delete(
+            f"/faqs/{faq.id}",
+            token=token,
             json={
                 "current_password": faq.admin_password,
             },
@@ -342,12 +1043,9 @@ class StringManager(FileManager):
         - token: str - Il token di autenticazione.
         """
         # rimuovi da Database API
-        update_req = requests.patch(
-            f"http://database-api:8000/faqs/{faq.id}",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {token}",
-            },
+        update_req = await self._database_api.patch(
+            f"/faqs/{faq.id}",
+            token=token,
             json={
                 "title": faq.title,
                 "question": faq.question,
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestManifest:
+    """
+    Registro persistente (SQLite) dei file indicizzati, per SHA-256 del contenuto:
+    percorso del file, id dei chunk e data di caricamento.
+    Permette di riconoscere un file già caricato prima di leggerlo e dividerlo.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._in_progress = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                hash TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                ingested_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS files_source ON files (source)"
+        )
+        self._connection.commit()
+
+    def get(self, file_hash: str) -> dict | None:
+        """Restituisce la voce del file con questo hash, se già indicizzato."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT source, chunk_ids, ingested_at FROM files WHERE hash = ?",
+                (file_hash,),
+            ).fetchone()
+        if row is None:
+            return None
+        source, chunk_ids, ingested_at = row
+        return {
+            "hash": file_hash,
+            "source": source,
+            "chunk_ids": json.loads(chunk_ids),
+            "ingested_at": ingested_at,
+        }
+
+    def get_by_source(self, source: str) -> dict | None:
+        """Restituisce la voce del file salvato in source, se indicizzato."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash FROM files WHERE source = ?", (source,)
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def add(self, file_hash: str, source: str, chunk_ids: list[str]):
+        """Registra un file indicizzato, sostituendo l'eventuale voce dello stesso percorso."""
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE source = ?", (source,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (file_hash, source, json.dumps(chunk_ids), time.time()),
+            )
+            self._connection.commit()
+
+    def remove(self, file_hash: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE hash = ?", (file_hash,))
+            self._connection.commit()
+
+    def remove_source(self, source: str):
+        """Elimina la voce del file salvato in source (es. documento eliminato)."""
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE source = ?", (source,))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM files")
+            self._connection.commit()
+
+    def claim(self, file_hash: str) -> bool:
+        """
+        Segna il file come in caricamento in questo processo.
+        Restituisce False se lo stesso contenuto è già in caricamento.
+        """
+        with self._lock:
+            if file_hash in self._in_progress:
+                return False
+            self._in_progress.add(file_hash)
+            return True
+
+    def release(self, file_hash: str):
+        with self._lock:
+            self._in_progress.discard(file_hash)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_ingest_manifest: IngestManifest | None = None
+
+
+def get_ingest_manifest() -> IngestManifest:
+    """
+    Restituisce il registro dei file indicizzati condiviso dall'intero processo,
+    salvato accanto al database vettoriale.
+    """
+    global _ingest_manifest
+    if _ingest_manifest is None:
+        _ingest_manifest = IngestManifest(
+            settings.INGEST_MANIFEST_PATH
+            or os.path.join(settings.VECTOR_DB_DIRECTORY, "ingest_manifest.sqlite3")
+        )
+    return _ingest_manifest
+
+
+def close_ingest_manifest():
+    global _ingest_manifest
+    if _ingest_manifest is not None:
+        _ingest_manifest.close()
+        _ingest_manifest = None
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+import asyncio
+import logging
+import time
+import uuid
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJob:
+    """Stato di un caricamento eseguito in background."""
+
+    QUEUED = "queued"
+    PARSING = "parsing"
+    INDEXING = "indexing"
+    REGISTERING = "registering"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.stage = self.QUEUED
+        self.chunks = None
+        self.error = None
+        self.status_code = None
+        self.created_at = datetime.now(timezone.utc)
+        self.timings = {}
+        self._stage_started = time.perf_counter()
+
+    def set_stage(self, stage: str):
+        """Passa alla fase successiva, registrando la durata di quella corrente."""
+        now = time.perf_counter()
+        self.timings[self.stage] = now - self._stage_started
+        self.stage = stage
+        self._stage_started = now
+
+    def fail(self, detail: str, status_code: int = 500):
+        self.error = str(detail)
+        self.status_code = status_code
+        self.set_stage(self.FAILED)
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in (self.DONE, self.FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "stage": self.stage,
+            "chunks": self.chunks,
+            "error": self.error,
+            "status_code": self.status_code,
+            "created_at": self.created_at,
+            "timings": dict(self.timings),
+        }
+
+
+class IngestionJobManager:
+    """
+    Coda in memoria dei caricamenti in background, eseguiti da un pool di
+    worker asyncio. Conserva lo stato degli ultimi max_history job.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.INGESTION_JOB_WORKERS,
+        max_history: int = settings.INGESTION_JOB_HISTORY,
+    ):
+        self._workers_number = workers
+        self._max_history = max_history
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._workers = []
+
+    def start(self):
+        """Avvia i worker sull'event loop corrente."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"ingestion-worker-{i}")
+            for i in range(self._workers_number)
+        ]
+
+    async def stop(self):
+        """
+        Ferma i worker; i job ancora in coda vengono segnati come falliti
+        e i loro file annullati, così lo stesso contenuto si può ricaricare.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self._queue is not None and not self._queue.empty():
+            job, file_manager, file_path, token, sha256 = self._queue.get_nowait()
+            try:
+                file_manager._discard_new_file(file_path, sha256)
+            except Exception as e:
+                logger.error(f"Errore nell'annullare il caricamento di {job.filename}: {e}")
+            self._queue.task_done()
+        for job in self._jobs.values():
+            if not job.finished:
+                job.fail("Caricamento interrotto dallo spegnimento del server")
+
+    def submit(
+        self, file_manager, file_path: str, title: str, token: str, sha256: str = None
+    ) -> IngestionJob:
+        """Accoda l'indicizzazione di un file già salvato e restituisce il job."""
+        self.start()
+        job = IngestionJob(title)
+        self._jobs[job.id] = job
+        self._trim()
+        self._queue.put_nowait((job, file_manager, file_path, token, sha256))
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def _trim(self):
+        """Elimina i job conclusi più vecchi oltre max_history."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(self._jobs) - self._max_history)]:
+            del self._jobs[job_id]
+
+    async def _work(self):
+        while True:
+            job, file_manager, file_path, token, sha256 = await self._queue.get()
+            try:
+                await file_manager._ingest_file(
+                    file_path, job.filename, token, job=job, sha256=sha256
+                )
+                job.set_stage(IngestionJob.DONE)
+            except HTTPException as e:
+                job.fail(e.detail, e.status_code)
+            except Exception as e:
+                logger.error(f"Errore nel caricamento di {job.filename}: {e}", exc_info=True)
+                job.fail(f"Internal server error during processing: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+
+_ingestion_job_manager: IngestionJobManager | None = None
+
+
+def get_ingestion_job_manager() -> IngestionJobManager:
+    """Restituisce la coda dei caricamenti condivisa dall'intero processo."""
+    global _ingestion_job_manager
+    if _ingestion_job_manager is None:
+        _ingestion_job_manager = IngestionJobManager()
+    return _ingestion_job_manager
+
+
+async def close_ingestion_job_manager():
+    """Ferma i worker dei caricamenti in background."""
+    global _ingestion_job_manager
+    if _ingestion_job_manager is not None:
+        await _ingestion_job_manager.stop()
+        _ingestion_job_manager = None
@@ -0,0 +1,258 @@
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+from langchain_core.documents import Document
+import math
+import re
+import threading
+import unicodedata
+import uuid
+
+ITALIAN_STOPWORDS = frozenset(
+    """
+    a ad al allo ai agli all alla alle agl anche c che chi ci col come con cui
+    d da dal dallo dai dagli dall dalla dalle de degli dei del dell della delle
+    dello di dove e ed era gli ha hai hanno ho i il in io l la le lei li lo loro
+    lui ma mi ne negli nei nel nell nella nelle nello ni no noi non o per piu
+    perche po qual quale quali quanto quanta quanti quante quel quella quelle
+    quelli quello questa queste questi questo se si sia sono su sua sue sugli
+    sui sul sull sulla sulle sullo suo suoi ti tra tu tua tue tuo tuoi un una
+    uno vi voi
+    """.split()
+)
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_PRODUCT_CODE_RE = re.compile(r"Codice:\s*([0-9A-Za-z]+)")
+_CODE_CANDIDATE_RE = re.compile(r"[0-9A-Za-z]*[0-9][0-9A-Za-z]*")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+    )
+
+
+def _stem(token: str) -> str:
+    """Stemming leggero per l'italiano: unifica singolare/plurale e maschile/femminile."""
+    if token.isalpha() and len(token) > 4 and token[-1] in "aeio":
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizza un testo italiano per la ricerca lessicale.
+
+    Minuscole e accenti rimossi, elisioni separate ("dell'orto" -> "orto"),
+    stopword eliminate e stemming leggero. I codici prodotto alfanumerici
+    (es. "31100M23F04") restano token interi.
+    """
+    tokens = _TOKEN_RE.findall(_strip_accents(text.lower()))
+    return [_stem(t) for t in tokens if t not in ITALIAN_STOPWORDS]
+
+
+def document_key(document: Document) -> str:
+    """Restituisce l'ID del chunk (lo stesso generato dai database vettoriali)."""
+    return document.id or str(uuid.uuid3(uuid.NAMESPACE_DNS, document.page_content))
+
+
+class BM25Index:
+    """
+    Indice invertito in memoria con ranking BM25.
+    Tiene una copia dei chunk indicizzati, così i risultati sono già Document.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self._k1 = k1
+        self._b = b
+        self._postings = defaultdict(dict)
+        self._lengths = {}
+        self._documents = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, ids: Iterable[str], documents: Iterable[Document]):
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+                terms = Counter(tokenize(document.page_content))
+                for term, frequency in terms.items():
+                    self._postings[term][doc_id] = frequency
+                length = sum(terms.values())
+                self._lengths[doc_id] = length
+                self._total_length += length
+                self._documents[doc_id] = Document(
+                    id=doc_id,
+                    page_content=document.page_content,
+                    metadata=dict(document.metadata),
+                )
+
+    def _remove(self, doc_id: str):
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        for term in set(tokenize(document.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def remove_where(self, key: str, value: str):
+        """Rimuove i chunk il cui metadato key vale value (es. source o faq_id)."""
+        with self._lock:
+            ids = [
+                doc_id
+                for doc_id, document in self._documents.items()
+                if document.metadata.get(key) == value
+            ]
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._documents.clear()
+            self._total_length = 0
+
+    def search(
+        self, query: str, results_number: int = 4, ids: Iterable[str] | None = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Restituisce i chunk con punteggio BM25 più alto, in ordine decrescente.
+        Se ids è indicato, ordina solo quei chunk (anche con punteggio nullo).
+        """
+        with self._lock:
+            count = len(self._documents)
+            if count == 0:
+                return []
+            average_length = self._total_length / count
+            scores = defaultdict(float)
+            allowed = None
+            if ids is not None:
+                allowed = {doc_id for doc_id in ids if doc_id in self._documents}
+                scores.update((doc_id, 0.0) for doc_id in allowed)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self._k1 * (
+                        1 - self._b + self._b * self._lengths[doc_id] / average_length
+                    )
+                    scores[doc_id] += idf * frequency * (self._k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            return [
+                (self._documents[doc_id], score)
+                for doc_id, score in best[:results_number]
+            ]
+
+
+def extract_product_codes(text: str) -> List[str]:
+    """Restituisce i codici prodotto ("Codice: 93002") presenti nel testo, senza duplicati."""
+    return list(dict.fromkeys(code.upper() for code in _PRODUCT_CODE_RE.findall(text)))
+
+
+def product_code_candidates(text: str) -> List[str]:
+    """Restituisce le parole del testo che potrebbero essere codici prodotto (contengono cifre)."""
+    return [candidate.upper() for candidate in _CODE_CANDIDATE_RE.findall(text)]
+
+
+class ProductCodeIndex:
+    """
+    Indice esatto codice prodotto -> chunk, costruito dal metadato product_codes
+    (codici separati da virgola) assegnato in fase di caricamento.
+    """
+
+    def __init__(self):
+        self._ids_by_code = defaultdict(set)
+        self._chunks = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids_by_code)
+
+    def add(self, ids: Iterable[str], documents: Iterable[Document]):
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove(doc_id)
+                codes = [
+                    code
+                    for code in document.metadata.get("product_codes", "").split(",")
+                    if code
+                ]
+                if not codes:
+                    continue
+                for code in codes:
+                    self._ids_by_code[code].add(doc_id)
+                self._chunks[doc_id] = (codes, dict(document.metadata))
+
+    def _remove(self, doc_id: str):
+        codes, _ = self._chunks.pop(doc_id, ((), None))
+        for code in codes:
+            ids = self._ids_by_code.get(code)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._ids_by_code[code]
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def remove_where(self, key: str, value: str):
+        """Rimuove i chunk il cui metadato key vale value (es. source o faq_id)."""
+        with self._lock:
+            ids = [
+                doc_id
+                for doc_id, (_, metadata) in self._chunks.items()
+                if metadata.get(key) == value
+            ]
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._ids_by_code.clear()
+            self._chunks.clear()
+
+    def lookup(self, text: str) -> List[str]:
+        """Restituisce gli id dei chunk dei prodotti i cui codici compaiono nel testo."""
+        with self._lock:
+            ids = {}
+            for candidate in product_code_candidates(text):
+                for doc_id in self._ids_by_code.get(candidate, ()):
+                    ids[doc_id] = None
+            return list(ids)
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Document]], results_number: int, k: int = 60
+) -> List[Document]:
+    """
+    Fonde più classifiche di chunk con la Reciprocal Rank Fusion:
+    score(d) = somma su ogni classifica di 1 / (k + posizione di d).
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document_key(document)
+            scores[key] += 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    best = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [documents[key] for key in best[:results_number]]
@@ -1,4 +1,5 @@
 import os
+import time
 from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
 from starlette.responses import StreamingResponse
@@ -8,10 +9,22 @@ from app import schemas
 from typing import List, Union
 
 from app.config import settings
+from app.utils import get_uuid3
 
 
-from app.services.vector_database_service import VectorDatabase, get_vector_database
+from app.services.vector_database_service import (
+    VectorDatabase,
+    get_shared_vector_database,
+)
 from app.services.llm_service import LLM, get_llm_model
+from app.services.prompt_builder_service import PromptBuilder, get_prompt_builder
+from app.services.session_service import SessionStore, get_session_store
+from app.services.conversation_memory_service import (
+    ConversationMemory,
+    get_conversation_memory,
+    prefix_hashes,
+)
+from app.services.answer_cache_service import AnswerCache, get_answer_cache
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +32,36 @@ load_dotenv()
 
 
 class LLMResponseService:
-    def __init__(self):
-        self._LLM = get_llm_model()
-        self._vector_database = get_vector_database()
+    def __init__(
+        self,
+        llm: LLM = None,
+        vector_database: VectorDatabase = None,
+        prompt_builder: PromptBuilder = None,
+        conversation_memory: ConversationMemory = None,
+        session_store: SessionStore = None,
+        answer_cache: AnswerCache = None,
+    ):
+        self._LLM = llm if llm is not None else get_llm_model()
+        self._vector_database = (
+            vector_database
+            if vector_database is not None
+            else get_shared_vector_database()
+        )
         self._CHATBOT_INSTRUCTIONS = settings.CHATBOT_INSTRUCTIONS
+        self._prompt_builder = (
+            prompt_builder if prompt_builder is not None else get_prompt_builder()
+        )
+        # older turns are replaced by a summary computed in the background
+        if conversation_memory is None and settings.CONVERSATION_SUMMARY_ENABLED:
+            conversation_memory = get_conversation_memory()
+        self._conversation_memory = conversation_memory
+        self._session_store = (
+            session_store if session_store is not None else get_session_store()
+        )
+        if answer_cache is None and settings.ANSWER_CACHE_ENABLED:
+            answer_cache = get_answer_cache()
+        self._answer_cache = answer_cache
+        self._faq_stats = {"hits": 0, "misses": 0}
 
     def _get_context(self, question: str) -> Union[str, list[str]]:
         """
@@ -32,22 +71,7 @@ class LLMResponseService:
         """
         try:
             question_context = self._vector_database.search_context(question)
-            if not question_context:
-                logger.warning(f"No context found for question: '{question}'")
-                raise ValueError(f"No context found for question: '{question}'")
-
-            output = []
-            for doc in question_context:
-                if hasattr(doc, 'page_content'):
-                    output.append(doc.page_content)
-                else:
-                    logger.warning(f"Document in context for question '{question}' missing 'page_content': {doc}")
-
-            if not output:
-                logger.warning(f"Context found for question '{question}', but no page_content extracted.")
-                raise ValueError(f"Context found for question '{question}', but no page_content could be extracted.")
-
-            return output
+            return self._extract_context(question, question_context)
         except ValueError as ve:
             raise HTTPException(
                 status_code=404, detail=f"Error getting context: {str(ve)}"
@@ -58,60 +82,221 @@ class LLMResponseService:
                 status_code=500, detail=f"Unexpected error getting context: {str(e)}"
             )
 
-    def generate_llm_response(self, question: schemas.Question) -> StreamingResponse:
+    async def _aget_context(self, question: str) -> Union[str, list[str]]:
+        """
+        Async version of _get_context: the vector search runs off the event loop,
+        so other streams served by this worker keep flowing.
+        Product codes are resolved before, in generate_llm_response.
+        """
         try:
-            context = self._get_context(question.question)
-        except HTTPException as e:
-            logger.error(f"No context found", exc_info=True)
-            context = ""
+            question_context = await self._vector_database.asearch_context(question)
+            return self._extract_context(question, question_context)
+        except ValueError as ve:
+            raise HTTPException(
+                status_code=404, detail=f"Error getting context: {str(ve)}"
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error in _aget_context for question '{question}': {str(e)}", exc_info=True)
+            raise HTTPException(
+                status_code=500, detail=f"Unexpected error getting context: {str(e)}"
+            )
 
-        formatted_messages = ""
-        # context_messages = ""
+    def _extract_context(self, question: str, question_context) -> list[str]:
+        """
+        Extract the page_content strings from the retrieved documents.
+        Raises ValueError if nothing usable was retrieved.
+        """
+        if not question_context:
+            logger.warning(f"No context found for question: '{question}'")
+            raise ValueError(f"No context found for question: '{question}'")
 
-        if question.messages:
-            formatted_messages = "\n".join(
-                [f"{msg.sender}: {msg.content}" for msg in question.messages]
-            )            
-            # context_messages = self._get_context(formatted_messages)
+        output = []
+        for doc in question_context:
+            if hasattr(doc, 'page_content'):
+                output.append(doc.page_content)
+            else:
+                logger.warning(f"Document in context for question '{question}' missing 'page_content': {doc}")
 
-        messages = [
-            SystemMessage(self._CHATBOT_INSTRUCTIONS),
-            SystemMessage(f"Conversazione precedente: {formatted_messages}"),
-            SystemMessage(
-                f"Contesto: {context}",
-            ),
-            HumanMessage(f"Domanda a cui devi rispondere: {question}"),
+        if not output:
+            logger.warning(f"Context found for question '{question}', but no page_content extracted.")
+            raise ValueError(f"Context found for question '{question}', but no page_content could be extracted.")
+
+        return output
+
+    async def _get_product_code_context(self, question: str) -> list[str]:
+        """
+        Context of the product codes mentioned in the question, from the exact
+        code index: no embedding is computed and the lookup runs off the event
+        loop. Empty if the question has no known code.
+        """
+        try:
+            documents = await self._vector_database.asearch_by_product_code(question)
+        except Exception as e:
+            logger.warning(f"Product code lookup skipped: {e}")
+            return []
+        return [
+            doc.page_content
+            for doc in documents or []
+            if hasattr(doc, "page_content")
         ]
-        print()
-        print(f"PROMPT: {context}")
-        print()
+
+    async def _match_faq(self, question: str) -> str | None:
+        """
+        FAQ fast path: the stored answer of the most similar FAQ, if its
+        cosine similarity to the question reaches FAQ_FAST_PATH_THRESHOLD.
+        """
+        if not settings.FAQ_FAST_PATH_ENABLED:
+            return None
         try:
-            stream_response = self._LLM._model.astream(messages)
-
-            async def stream_adapter():
-                try:
-                    async for chunk in stream_response:
-                        if hasattr(chunk, "content"):
-                            content = chunk.content
-                        elif isinstance(chunk, dict) and "content" in chunk:
-                            content = chunk["content"]
-                        else:
-                            content = str(chunk)
-
-                        if content:
-                            yield f"data: {content}\n\n"
-
-                    # Segnala la fine dello stream
-                    yield "data: [DONE]\n\n"
-                except Exception as e:
-                    logger.error(f"Error in stream adapter: {str(e)}", exc_info=True)
-                    yield f"data: [ERROR] {str(e)}\n\n"
+            matches = await self._vector_database.asearch_faqs(question, 1)
+        except Exception as e:
+            logger.warning(f"FAQ fast path skipped: {e}")
+            return None
+        if not matches:
+            return None
+        faq, score = matches[0]
+        # FAQs stored before faq_answer was added only have it in the text
+        answer = faq.metadata.get("faq_answer") or faq.page_content.partition(
+            "Risposta: "
+        )[2]
+        if score < settings.FAQ_FAST_PATH_THRESHOLD or not answer:
+            self._faq_stats["misses"] += 1
+            return None
+        self._faq_stats["hits"] += 1
+        logger.info(f"FAQ {faq.metadata.get('faq_id')} matched with score {score:.3f}")
+        return answer
 
+    async def _answer_cache_key(
+        self, question: str, conversation: list[schemas.Message], context
+    ) -> tuple | None:
+        """
+        Key of the answer cache for the question: embedding of the question,
+        ids of the retrieved chunks and hash of the history.
+        None if the cache is disabled or there is no context to key it on.
+        """
+        if self._answer_cache is None or not context:
+            return None
+        chunks = [context] if isinstance(context, str) else context
+        try:
+            embedding = await self._vector_database.aembed_query(question)
         except Exception as e:
-            logger.error(f"Error in chat service streaming: {str(e)}", exc_info=True)
-            raise HTTPException(
-                status_code=500, detail=f"Error in chat service: {str(e)}"
+            logger.warning(f"Answer cache skipped, cannot embed the question: {e}")
+            return None
+        history = prefix_hashes(conversation)
+        return (
+            embedding,
+            tuple(get_uuid3(chunk) for chunk in chunks),
+            history[-1] if history else "",
+        )
+
+    @staticmethod
+    async def _iter_contents(stream_response):
+        """Yield the text of each chunk streamed by the model."""
+        async for chunk in stream_response:
+            if hasattr(chunk, "content"):
+                content = chunk.content
+            elif isinstance(chunk, dict) and "content" in chunk:
+                content = chunk["content"]
+            else:
+                content = str(chunk)
+
+            if content:
+                yield content
+
+    @staticmethod
+    async def _replay(chunks: list[str]):
+        for chunk in chunks:
+            yield chunk
+
+    async def generate_llm_response(self, question: schemas.Question) -> StreamingResponse:
+        generation = self._vector_database.generation if self._answer_cache else None
+        # product codes are resolved first, from the exact index: those questions
+        # are never embedded, neither for the FAQ search nor for the answer cache
+        code_context = await self._get_product_code_context(question.question)
+        context = code_context
+        # a question matching an FAQ is answered with the stored answer,
+        # without retrieving context or calling the LLM
+        faq_answer = None
+        if not code_context:
+            faq_answer = await self._match_faq(question.question)
+        if faq_answer is None and not code_context:
+            try:
+                context = await self._aget_context(question.question)
+            except HTTPException as e:
+                logger.error(f"No context found", exc_info=True)
+
+        # with a session the history is kept server-side; messages sent by the
+        # client only seed a session that does not exist yet
+        conversation = question.messages
+        new_messages = []
+        if question.session_id:
+            stored = await self._session_store.get_messages(question.session_id)
+            if stored:
+                conversation = stored
+            else:
+                new_messages = list(question.messages)
+
+        # a similar question with the same context and history was already answered;
+        # product code questions skip the cache, so they are never embedded
+        cache_key, cached_answer = None, None
+        if faq_answer is None and not code_context:
+            cache_key = await self._answer_cache_key(
+                question.question, conversation, context
+            )
+        if cache_key is not None:
+            cached_answer = self._answer_cache.get(*cache_key, generation)
+
+        if faq_answer is not None:
+            contents = self._replay([faq_answer])
+        elif cached_answer is not None:
+            contents = self._replay(cached_answer)
+        else:
+            history, summary = conversation, ""
+            if self._conversation_memory is not None:
+                summary, history = self._conversation_memory.compact(conversation)
+
+            # history, context and question are packed within their token budgets
+            messages = self._prompt_builder.build(
+                question.question, history, context, summary
             )
+            try:
+                contents = self._iter_contents(self._LLM._model.astream(messages))
+            except Exception as e:
+                logger.error(f"Error in chat service streaming: {str(e)}", exc_info=True)
+                raise HTTPException(
+                    status_code=500, detail=f"Error in chat service: {str(e)}"
+                )
+
+        async def stream_adapter():
+            answer = []
+            start = time.perf_counter()
+            try:
+                async for content in contents:
+                    answer.append(content)
+                    yield f"data: {content}\n\n"
+
+                if question.session_id:
+                    await self._session_store.append_messages(
+                        question.session_id,
+                        new_messages
+                        + [
+                            schemas.Message(sender="user", content=question.question),
+                            schemas.Message(sender="bot", content="".join(answer)),
+                        ],
+                    )
+                if (
+                    cache_key is not None
+                    and cached_answer is None
+                    and self._vector_database.generation == generation
+                ):
+                    self._answer_cache.set(
+                        *cache_key, generation, answer, time.perf_counter() - start
+                    )
+                # Segnala la fine dello stream
+                yield "data: [DONE]\n\n"
+            except Exception as e:
+                logger.error(f"Error in stream adapter: {str(e)}", exc_info=True)
+                yield f"data: [ERROR] {str(e)}\n\n"
 
         return StreamingResponse(stream_adapter(), media_type="text/event-stream")
 
@@ -132,5 +317,43 @@ class LLMResponseService:
             )
 
 
+    async def aclose(self):
+        """
+        Release the LLM clients. The vector database is shared and closed separately.
+        """
+        await self._LLM.aclose()
+
+
+_llm_response_service: LLMResponseService | None = None
+
+
 def get_llm_response_service() -> LLMResponseService:
-    return LLMResponseService()
+    """
+    Return the process-wide LLMResponseService, building it on first use.
+    The application lifespan builds it at startup so requests never pay for it.
+    """
+    global _llm_response_service
+    if _llm_response_service is None:
+        _llm_response_service = LLMResponseService()
+    return _llm_response_service
+
+
+async def close_llm_response_service():
+    """
+    Close the process-wide LLMResponseService, if it was built.
+    """
+    global _llm_response_service
+    if _llm_response_service is not None:
+        await _llm_response_service.aclose()
+        _llm_response_service = None
+
+
+
+def get_faq_fast_path_stats() -> dict:
+    """
+    Questions answered directly from an FAQ (hits) and FAQ matches below the
+    threshold (misses). Empty if the service was not built yet.
+    """
+    if _llm_response_service is None:
+        return {}
+    return dict(_llm_response_service._faq_stats)
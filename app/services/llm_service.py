@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
+import asyncio
 import os
 import logging
+import random
+import time
 from langchain.chat_models import init_chat_model
+from langchain_core.messages import AIMessage, AIMessageChunk
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -29,6 +33,17 @@ class LLM(ABC):
         """
         pass
 
+    async def aclose(self):
+        """
+        Chiude i client HTTP del modello, se presenti
+        """
+        client = getattr(self._model, "root_client", None)
+        if client is not None:
+            client.close()
+        async_client = getattr(self._model, "root_async_client", None)
+        if async_client is not None:
+            await async_client.close()
+
 
 class OpenAI(LLM):
     def _check_environment(self):
@@ -64,14 +79,120 @@ class Ollama(LLM):
             raise ValueError(f"Invalid or unavailable model: {self._model_name}") from e
 
 
-def get_llm_model() -> LLM:
-    """Factory function per creare un'istanza di LLM"""
+FAKE_LLM_TEXT = (
+    "Questa è una risposta simulata del modello di prova, generata senza "
+    "contattare alcun servizio esterno per misurare le prestazioni del chatbot."
+)
+
+
+class FakeChatModel:
+    """
+    Modello finto che risponde con un testo fisso, rispettando il tempo al
+    primo token e la velocità di generazione configurati. Con probabilità
+    error_rate la risposta si interrompe con un errore in un punto casuale.
+    """
+
+    def __init__(
+        self,
+        ttft_ms: float = 300,
+        tokens_per_second: float = 50,
+        response_tokens: int = 120,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.ttft = ttft_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        words = FAKE_LLM_TEXT.split()
+        self._tokens = [
+            words[i % len(words)] + " " for i in range(response_tokens)
+        ]
+
+    def _token_delay(self, index: int) -> float:
+        """Secondi dall'inizio della risposta all'emissione del token index."""
+        if self.tokens_per_second <= 0:
+            return self.ttft
+        return self.ttft + index / self.tokens_per_second
+
+    def _failure_index(self) -> int | None:
+        """Posizione del token a cui simulare un errore, None se non c'è errore."""
+        if self._random.random() >= self.error_rate:
+            return None
+        return self._random.randrange(self.response_tokens + 1)
+
+    def _error(self) -> RuntimeError:
+        return RuntimeError("Errore simulato del modello fake")
+
+    async def astream(self, messages):
+        failure = self._failure_index()
+        start = time.perf_counter()
+        for index, token in enumerate(self._tokens):
+            if index == failure:
+                raise self._error()
+            # si attende rispetto all'inizio per non accumulare i ritardi dello scheduler
+            delay = start + self._token_delay(index) - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+            yield AIMessageChunk(content=token)
+        if failure == self.response_tokens:
+            raise self._error()
+
+    def _response_tokens(self) -> tuple[list[str], bool]:
+        """Token della risposta completa e se la risposta deve fallire."""
+        failure = self._failure_index()
+        if failure is None:
+            return self._tokens, False
+        return self._tokens[:failure], True
+
+    def invoke(self, messages) -> AIMessage:
+        tokens, failed = self._response_tokens()
+        time.sleep(self._token_delay(max(len(tokens) - 1, 0)))
+        if failed:
+            raise self._error()
+        return AIMessage(content="".join(tokens).strip())
+
+    async def ainvoke(self, messages) -> AIMessage:
+        tokens, failed = self._response_tokens()
+        await asyncio.sleep(self._token_delay(max(len(tokens) - 1, 0)))
+        if failed:
+            raise self._error()
+        return AIMessage(content="".join(tokens).strip())
+
+
+class Fake(LLM):
+    """
+    Provider senza servizi esterni, per i test di carico: latenza, velocità
+    ed errori sono configurati dalle impostazioni FAKE_LLM_*.
+    """
+
+    def _check_environment(self):
+        pass
+
+    def _initialize_model(self):
+        self._model = FakeChatModel(
+            ttft_ms=settings.FAKE_LLM_TTFT_MS,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            response_tokens=settings.FAKE_LLM_RESPONSE_TOKENS,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            seed=settings.FAKE_LLM_SEED,
+        )
+
+
+def get_llm_model(model_name: str = None) -> LLM:
+    """
+    Factory function per creare un'istanza di LLM
+    (di default il modello LLM_MODEL_NAME)
+    """
     provider = settings.LLM_PROVIDER.lower()
+    model_name = model_name or settings.LLM_MODEL_NAME
     match provider:
         case "openai":
-            return OpenAI(settings.LLM_MODEL_NAME)
+            return OpenAI(model_name)
         case "ollama":
-            return Ollama(settings.LLM_MODEL_NAME)
+            return Ollama(model_name)
+        case "fake":
+            return Fake(model_name)
         # aggiungere altri provider qui
         case _:
             raise ValueError(f"Provider LLM '{provider}' non supportato.")
@@ -0,0 +1,179 @@
+"""
+Composizione del prompt della chat entro un budget di token.
+
+Storico della conversazione, contesto recuperato e domanda hanno ciascuno un
+budget (PROMPT_*_MAX_TOKENS), contato con il tokenizer locale del modello:
+dello storico vengono tenuti i messaggi più recenti, del contesto i chunk più
+rilevanti che ci stanno, la domanda viene troncata. La dimensione dei prompt
+inviati è esposta come metrica.
+"""
+
+import logging
+import threading
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from app import schemas
+from app.config import settings
+from app.utils import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class PromptBuilder:
+    """
+    Costruisce i messaggi per il modello rispettando i budget di token.
+
+    Param:
+    - instructions: str - Le istruzioni di sistema del chatbot.
+    - model_name: str - Il modello di cui usare il tokenizer.
+    - history_tokens: int - Budget dello storico della conversazione.
+    - context_tokens: int - Budget del contesto recuperato.
+    - question_tokens: int - Budget della domanda.
+    """
+
+    def __init__(
+        self,
+        instructions: str = settings.CHATBOT_INSTRUCTIONS,
+        model_name: str = settings.LLM_MODEL_NAME,
+        history_tokens: int = settings.PROMPT_HISTORY_MAX_TOKENS,
+        context_tokens: int = settings.PROMPT_CONTEXT_MAX_TOKENS,
+        question_tokens: int = settings.PROMPT_QUESTION_MAX_TOKENS,
+    ):
+        self._instructions = instructions
+        self._model_name = model_name
+        self.history_tokens = history_tokens
+        self.context_tokens = context_tokens
+        self.question_tokens = question_tokens
+        self._lock = threading.Lock()
+        self._stats = {
+            "prompts": 0,
+            "total_tokens": 0,
+            "max_tokens": 0,
+            "last_tokens": 0,
+            "history_messages_dropped": 0,
+            "context_chunks_dropped": 0,
+            "questions_truncated": 0,
+        }
+
+    def _count(self, text: str) -> int:
+        return count_tokens(text, self._model_name)
+
+    def pack_history(
+        self, messages: list[schemas.Message], summary: str = ""
+    ) -> tuple[str, int]:
+        """
+        Tiene i messaggi più recenti finché stanno nel budget, in ordine
+        cronologico, preceduti dal riassunto di quelli meno recenti (se presente).
+
+        Returns:
+        - tuple[str, int]: Lo storico formattato e il numero di messaggi scartati.
+        """
+        kept = []
+        used = 0
+        if summary:
+            summary = truncate_tokens(
+                f"Riassunto: {summary}", self.history_tokens, self._model_name
+            )
+            used = self._count(summary) + 1
+        for message in reversed(messages):
+            line = f"{message.sender}: {message.content}"
+            tokens = self._count(line) + 1  # a capo
+            if used + tokens > self.history_tokens:
+                break
+            kept.append(line)
+            used += tokens
+        dropped = len(messages) - len(kept)
+        if summary:
+            kept.append(summary)
+        kept.reverse()
+        return "\n".join(kept), dropped
+
+    def pack_context(self, chunks: str | list[str]) -> tuple[str, int]:
+        """
+        Aggiunge i chunk in ordine di rilevanza (quello della ricerca), saltando
+        i duplicati e quelli che non stanno più nel budget.
+
+        Returns:
+        - tuple[str, int]: Il contesto formattato e il numero di chunk scartati.
+        """
+        if isinstance(chunks, str):
+            chunks = [chunks] if chunks else []
+        kept = []
+        seen = set()
+        used = 0
+        for chunk in chunks:
+            if chunk in seen:
+                continue
+            seen.add(chunk)
+            tokens = self._count(chunk) + 2  # separatore
+            if used + tokens > self.context_tokens:
+                continue
+            kept.append(chunk)
+            used += tokens
+        return "\n\n".join(kept), len(chunks) - len(kept)
+
+    def build(
+        self,
+        question: str,
+        messages: list[schemas.Message],
+        context: str | list[str],
+        summary: str = "",
+    ) -> list[BaseMessage]:
+        """
+        Restituisce i messaggi da inviare al modello e aggiorna le metriche.
+
+        Param:
+        - question: str - La domanda dell'utente.
+        - messages: list[schemas.Message] - Lo storico della conversazione.
+        - context: str | list[str] - I chunk recuperati, dal più rilevante.
+        - summary: str - Il riassunto dei messaggi precedenti a quelli dello storico.
+        """
+        history, history_dropped = self.pack_history(messages, summary)
+        packed_context, context_dropped = self.pack_context(context)
+        truncated_question = truncate_tokens(
+            question, self.question_tokens, self._model_name
+        )
+
+        prompt = [
+            SystemMessage(self._instructions),
+            SystemMessage(f"Conversazione precedente: {history}"),
+            SystemMessage(f"Contesto: {packed_context}"),
+            HumanMessage(f"Domanda a cui devi rispondere: {truncated_question}"),
+        ]
+        tokens = sum(self._count(message.content) for message in prompt)
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["total_tokens"] += tokens
+            self._stats["max_tokens"] = max(self._stats["max_tokens"], tokens)
+            self._stats["last_tokens"] = tokens
+            self._stats["history_messages_dropped"] += history_dropped
+            self._stats["context_chunks_dropped"] += context_dropped
+            self._stats["questions_truncated"] += truncated_question != question
+        return prompt
+
+    def stats(self) -> dict:
+        with self._lock:
+            prompts = self._stats["prompts"]
+            return {
+                **self._stats,
+                "mean_tokens": self._stats["total_tokens"] / prompts if prompts else 0.0,
+            }
+
+
+_prompt_builder: PromptBuilder | None = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Restituisce il costruttore dei prompt condiviso dall'intero processo."""
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder()
+    return _prompt_builder
+
+
+def get_prompt_stats() -> dict:
+    """Statistiche dei prompt, vuote se non ne è ancora stato costruito uno."""
+    if _prompt_builder is None:
+        return {}
+    return _prompt_builder.stats()
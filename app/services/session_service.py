@@ -0,0 +1,110 @@
+"""
+Sessioni di conversazione lato server.
+
+Con un session_id il client invia solo la nuova domanda: lo storico è letto
+dal SessionStore e il servizio vi aggiunge la domanda e la risposta al
+termine dello stream. L'implementazione in memoria tiene le sessioni usate
+più di recente (LRU con scadenza); un archivio condiviso tra più worker
+(ad esempio Redis) va aggiunto come nuova classe in get_session_store.
+"""
+
+from abc import ABC, abstractmethod
+import logging
+
+from app import schemas
+from app.config import settings
+from app.services.cache_service import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    async def get_messages(self, session_id: str) -> list[schemas.Message]:  # pragma: no cover
+        """Restituisce lo storico della sessione, vuoto se non esiste."""
+        pass
+
+    @abstractmethod
+    async def append_messages(
+        self, session_id: str, messages: list[schemas.Message]
+    ):  # pragma: no cover
+        """Aggiunge i messaggi in coda allo storico, creando la sessione se non esiste."""
+        pass
+
+    @abstractmethod
+    async def delete(self, session_id: str):  # pragma: no cover
+        """Elimina la sessione."""
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    async def aclose(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessioni nella memoria del processo, con eliminazione di quelle usate meno
+    di recente e scadenza dopo ttl secondi di inattività.
+
+    Param:
+    - max_sessions: int - Le sessioni da tenere in memoria.
+    - max_messages: int - I messaggi più recenti da tenere per sessione.
+    - ttl: float - Secondi di inattività dopo cui la sessione scade (0: mai).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = settings.SESSION_MAX_SESSIONS,
+        max_messages: int = settings.SESSION_MAX_MESSAGES,
+        ttl: float = settings.SESSION_TTL_SECONDS,
+    ):
+        self._sessions = LRUCache(max_sessions, ttl or None)
+        self._max_messages = max_messages
+
+    async def get_messages(self, session_id: str) -> list[schemas.Message]:
+        return list(self._sessions.get(session_id, ()))
+
+    async def append_messages(self, session_id: str, messages: list[schemas.Message]):
+        # nuova lista: chi ha letto lo storico non lo vede cambiare
+        history = list(self._sessions.get(session_id, ())) + list(messages)
+        self._sessions.set(session_id, history[-self._max_messages :])
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
+
+
+_session_store: SessionStore | None = None
+
+
+def get_session_store() -> SessionStore:
+    """Restituisce l'archivio delle sessioni condiviso, in base a SESSION_STORE_PROVIDER."""
+    global _session_store
+    if _session_store is None:
+        provider = settings.SESSION_STORE_PROVIDER.lower()
+        match provider:
+            case "memory":
+                _session_store = InMemorySessionStore()
+            # aggiungere altri archivi qui
+            case _:
+                raise ValueError(f"Archivio delle sessioni '{provider}' non supportato.")
+    return _session_store
+
+
+async def close_session_store():
+    """Chiude l'archivio delle sessioni, se presente."""
+    global _session_store
+    if _session_store is not None:
+        await _session_store.aclose()
+        _session_store = None
+
+
+def get_session_stats() -> dict:
+    """Statistiche delle sessioni, vuote se l'archivio non è ancora in uso."""
+    if _session_store is None:
+        return {}
+    return _session_store.stats()
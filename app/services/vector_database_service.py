@@ -5,52 +5,233 @@ from langchain_chroma import Chroma
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from fastapi import Depends
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
 import os
 import logging
+import threading
 import uuid
+import numpy as np
 from chromadb.errors import DuplicateIDError
 
 logger = logging.getLogger(__name__)
 
 from app.services.embeddings_service import EmbeddingProvider, get_embedding_provider
+from app.services.cache_service import QueryCache
+from app.services.lexical_index_service import (
+    BM25Index,
+    ProductCodeIndex,
+    product_code_candidates,
+    reciprocal_rank_fusion,
+)
 from app.config import settings
 
 
+_search_executor: ThreadPoolExecutor | None = None
+
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    """Pool di thread limitato usato per le ricerche asincrone."""
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_DB_SEARCH_WORKERS,
+            thread_name_prefix="vector-search",
+        )
+    return _search_executor
+
+
+_lexical_executor: ThreadPoolExecutor | None = None
+
+
+def _get_lexical_executor() -> ThreadPoolExecutor:
+    """
+    Pool di thread per la ricerca lessicale, separato da quello delle ricerche:
+    search_context vi sottomette lavoro mentre occupa già un thread di quel pool.
+    """
+    global _lexical_executor
+    if _lexical_executor is None:
+        _lexical_executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_DB_SEARCH_WORKERS,
+            thread_name_prefix="lexical-search",
+        )
+    return _lexical_executor
+
+
 class VectorDatabase(ABC):
     """Interfaccia per la gestione del database vettoriale."""
 
-    @abstractmethod
-    def __init__(self):
-        self._embedding_provider = get_embedding_provider()
-        self._persist_directory = settings.VECTOR_DB_DIRECTORY
+    def __init__(self, persist_directory: str = settings.VECTOR_DB_DIRECTORY):
+        self.embedding_provider = get_embedding_provider(
+            cache_directory=persist_directory
+        )
+        self.persist_directory = persist_directory
         self._db = None
+        self._query_cache = QueryCache(
+            settings.QUERY_CACHE_MAX_SIZE, settings.QUERY_CACHE_TTL_SECONDS
+        )
+        self._lexical_index = None
+        self._code_index = None
+        self._lexical_lock = threading.Lock()
 
     @abstractmethod
     def _get_db(self):
         pass
 
     @abstractmethod
-    def __init__(self):
-        self._embedding_provider = get_embedding_provider()
-        self._persist_directory = settings.VECTOR_DB_DIRECTORY
-        self._db = None
+    def add_documents(
+        self, documents: List[Document], embeddings: List[List[float]] | None = None
+    ):
+        pass
 
     @abstractmethod
-    def _get_db(self):
+    def get_existing_ids(self, ids: List[str]) -> set[str]:
         pass
 
     @abstractmethod
-    def add_documents(self, documents: List[Document]):
+    def delete_document(self, document_path: str):
         pass
 
     @abstractmethod
-    def delete_document(self, document_path: str):
+    def delete_faq(self, faq_id: str):
+        pass
+
+    @abstractmethod
+    def get_document_chunks(self, document_path: str) -> dict[str, dict]:
+        pass
+
+    @abstractmethod
+    def delete_chunks(self, ids: List[str]):
+        pass
+
+    @abstractmethod
+    def update_chunk_metadatas(self, documents: dict[str, Document]):
         pass
 
+    def replace_document(self, document_path: str, documents: List[Document]) -> dict:
+        """
+        Sostituisce i chunk di un documento con quelli della nuova versione.
+        Gli id dei chunk derivano dal contenuto: vengono calcolati gli embedding
+        solo dei chunk nuovi ed eliminati solo quelli rimossi; i chunk invariati
+        ricevono al più i nuovi metadati.
+
+        Returns:
+        - dict: chunk aggiunti, rimossi, invariati ed embedding risparmiati.
+        """
+        new_chunks = {}
+        for document in documents:
+            new_chunks.setdefault(
+                str(uuid.uuid3(uuid.NAMESPACE_DNS, document.page_content)), document
+            )
+        old_chunks = self.get_document_chunks(document_path)
+
+        added = [doc for doc_id, doc in new_chunks.items() if doc_id not in old_chunks]
+        removed = [doc_id for doc_id in old_chunks if doc_id not in new_chunks]
+        changed = {
+            doc_id: doc
+            for doc_id, doc in new_chunks.items()
+            if doc_id in old_chunks and old_chunks[doc_id] != doc.metadata
+        }
+
+        # prima le aggiunte: se falliscono la versione precedente resta intatta
+        if added:
+            self.add_documents(added)
+        if removed:
+            self.delete_chunks(removed)
+        if changed:
+            self.update_chunk_metadatas(changed)
+
+        unchanged = len(new_chunks) - len(added)
+        return {
+            "added": len(added),
+            "removed": len(removed),
+            "unchanged": unchanged,
+            "embeddings_saved": unchanged,
+        }
+
     @abstractmethod
+    def _search_by_vector(
+        self, embedding: List[float], results_number: int
+    ) -> List[Document]:
+        pass
+
     def search_context(self, query: str, results_number: int = 4) -> List[Document]:
+        """
+        Cerca i chunk più rilevanti per la domanda.
+        Con HYBRID_SEARCH_ENABLED la ricerca vettoriale e quella lessicale (BM25)
+        vengono eseguite in parallelo e fuse con la Reciprocal Rank Fusion.
+        """
+        try:
+            generation = self._query_cache.generation
+            cached_results = self._query_cache.get_results(query, results_number)
+            if cached_results is not None:
+                return cached_results
+
+            lexical_future = None
+            candidates = results_number
+            if settings.HYBRID_SEARCH_ENABLED:
+                candidates = results_number * settings.HYBRID_SEARCH_CANDIDATES_FACTOR
+                lexical_future = _get_lexical_executor().submit(
+                    self._lexical_search, query, candidates
+                )
+
+            results = self._search_by_vector(self._embed_query(query), candidates)
+            if lexical_future is not None:
+                results = reciprocal_rank_fusion(
+                    [results, lexical_future.result()],
+                    results_number,
+                    settings.HYBRID_SEARCH_RRF_K,
+                )
+
+            self._query_cache.set_results(query, results_number, generation, results)
+            return results
+        except Exception as e:
+            logger.error(f"Errore durante la similarity search: {e}", exc_info=True)
+            return []
+
+    async def asearch_context(
+        self, query: str, results_number: int = 4
+    ) -> List[Document]:
+        """
+        Versione asincrona di search_context: embedding e ricerca vengono eseguiti
+        nel pool di thread limitato, senza bloccare l'event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_search_executor(), self.search_context, query, results_number
+        )
+
+    @abstractmethod
+    def _search_faqs_by_vector(
+        self, embedding: List[float], results_number: int
+    ) -> List[tuple[Document, float]]:
         pass
 
+    def search_faqs(
+        self, query: str, results_number: int = 1
+    ) -> List[tuple[Document, float]]:
+        """
+        Cerca le FAQ più simili alla domanda (solo i chunk con source "faqs").
+
+        Returns:
+        - List[tuple[Document, float]]: I chunk con la similarità del coseno, dal più simile.
+        """
+        try:
+            return self._search_faqs_by_vector(self._embed_query(query), results_number)
+        except Exception as e:
+            logger.error(f"Errore durante la ricerca delle FAQ: {e}", exc_info=True)
+            return []
+
+    async def asearch_faqs(
+        self, query: str, results_number: int = 1
+    ) -> List[tuple[Document, float]]:
+        """Versione asincrona di search_faqs, eseguita nel pool di ricerca."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_search_executor(), self.search_faqs, query, results_number
+        )
+
     @abstractmethod
     def delete_all_documents(self):
         pass
@@ -68,6 +249,172 @@ class VectorDatabase(ABC):
     def count(self) -> int:  # pragma: no cover
         pass
 
+    def _embed_query(self, query: str) -> List[float]:
+        """Calcola l'embedding della domanda, riusando quello in cache se presente."""
+        embedding = self._query_cache.get_embedding(query)
+        if embedding is None:
+            embedding = self.embedding_provider.get_embedding_function().embed_query(
+                query
+            )
+            self._query_cache.set_embedding(query, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """
+        Embedding della domanda calcolato nel pool di ricerca; dopo una ricerca
+        per similarità è già nella cache delle ricerche.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_search_executor(), self._embed_query, query
+        )
+
+    @property
+    def generation(self) -> int:
+        """Contatore incrementato a ogni scrittura nel database."""
+        return self._query_cache.generation
+
+    def _build_side_indexes(self) -> bool:
+        """
+        Costruisce alla prima richiesta l'indice lessicale e quello dei codici
+        prodotto dai chunk già presenti nel database. Va chiamato con _lexical_lock.
+        """
+        if self._lexical_index is None:
+            stored = self.get_all_documents()
+            if not isinstance(stored, dict) or stored.get("ids") is None:
+                return False
+            documents = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(stored["documents"], stored["metadatas"])
+            ]
+            lexical_index = BM25Index()
+            lexical_index.add(stored["ids"], documents)
+            code_index = ProductCodeIndex()
+            code_index.add(stored["ids"], documents)
+            self._lexical_index = lexical_index
+            self._code_index = code_index
+            logger.info(
+                f"Indice lessicale costruito con {len(lexical_index)} chunk, "
+                f"{len(code_index)} codici prodotto."
+            )
+        return True
+
+    def _get_lexical_index(self) -> BM25Index | None:
+        """Restituisce l'indice lessicale, costruendolo se necessario."""
+        with self._lexical_lock:
+            if not self._build_side_indexes():
+                return None
+            return self._lexical_index
+
+    def _lexical_search(self, query: str, results_number: int) -> List[Document]:
+        index = self._get_lexical_index()
+        if index is None:
+            return []
+        return [document for document, _ in index.search(query, results_number)]
+
+    def search_by_product_code(
+        self, query: str, results_number: int = 4
+    ) -> List[Document]:
+        """
+        Risolve i codici prodotto citati nella domanda con l'indice esatto,
+        senza calcolare embedding. I chunk dei prodotti trovati sono ordinati
+        con BM25; restituisce una lista vuota se la domanda non cita codici noti.
+        """
+        if not product_code_candidates(query):
+            return []
+        try:
+            with self._lexical_lock:
+                if not self._build_side_indexes():
+                    return []
+                lexical_index, code_index = self._lexical_index, self._code_index
+            ids = code_index.lookup(query)
+            if not ids:
+                return []
+            return [
+                document
+                for document, _ in lexical_index.search(query, results_number, ids=ids)
+            ]
+        except Exception as e:
+            logger.error(f"Errore durante la ricerca per codice: {e}", exc_info=True)
+            return []
+
+    async def asearch_by_product_code(
+        self, query: str, results_number: int = 4
+    ) -> List[Document]:
+        """
+        Versione asincrona di search_by_product_code, eseguita nel pool di ricerca:
+        il lock degli indici lessicali e la loro costruzione non bloccano l'event loop.
+        """
+        if not product_code_candidates(query):
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_search_executor(), self.search_by_product_code, query, results_number
+        )
+
+    def _on_documents_added(self, ids: List[str], documents: List[Document]):
+        """Invalida la cache delle ricerche e aggiorna gli indici lessicali."""
+        self._query_cache.invalidate()
+        with self._lexical_lock:
+            if self._lexical_index is not None:
+                self._lexical_index.add(ids, documents)
+                self._code_index.add(ids, documents)
+
+    def _on_documents_deleted(self, key: str, value: str):
+        """Invalida la cache delle ricerche e rimuove i chunk dagli indici lessicali."""
+        self._query_cache.invalidate()
+        with self._lexical_lock:
+            if self._lexical_index is not None:
+                self._lexical_index.remove_where(key, value)
+                self._code_index.remove_where(key, value)
+
+    def _on_chunks_deleted(self, ids: List[str]):
+        """Invalida la cache delle ricerche e rimuove i chunk dagli indici lessicali."""
+        self._query_cache.invalidate()
+        with self._lexical_lock:
+            if self._lexical_index is not None:
+                self._lexical_index.remove(ids)
+                self._code_index.remove(ids)
+
+    def _on_chunks_updated(self, documents: dict[str, Document]):
+        """Invalida la cache delle ricerche e aggiorna i metadati negli indici lessicali."""
+        self._query_cache.invalidate()
+        with self._lexical_lock:
+            if self._lexical_index is not None:
+                self._lexical_index.add(list(documents), list(documents.values()))
+                self._code_index.add(list(documents), list(documents.values()))
+
+    def _on_all_documents_deleted(self):
+        self._query_cache.invalidate()
+        with self._lexical_lock:
+            if self._lexical_index is not None:
+                self._lexical_index.clear()
+                self._code_index.clear()
+
+    def stats(self) -> dict:
+        """Restituisce le metriche della cache delle ricerche e di quella degli embedding."""
+        stats = {"query_cache": self._query_cache.stats()}
+        if hasattr(self.embedding_provider, "stats"):
+            stats["embedding_cache"] = self.embedding_provider.stats()
+        if self._lexical_index is not None:
+            stats["lexical_index"] = {
+                "documents": len(self._lexical_index),
+                "product_codes": len(self._code_index),
+            }
+        return stats
+
+    def open(self):
+        """
+        Apre il database e costruisce gli indici lessicali in anticipo,
+        evitando il costo alla prima richiesta.
+        """
+        self._get_db()
+        self._get_lexical_index()
+
+    async def aclose(self):
+        """Rilascia il database e le risorse del provider di embedding."""
+        self._db = None
+
 
 class ChromaDB(VectorDatabase):
     """Implementazione del database vettoriale ChromaDB."""
@@ -76,9 +423,7 @@ class ChromaDB(VectorDatabase):
         self,
         persist_directory: str = settings.VECTOR_DB_DIRECTORY,
     ):
-        self.embedding_provider = get_embedding_provider()
-        self.persist_directory = persist_directory
-        self._db = None
+        super().__init__(persist_directory)
 
     # Singleton
     def _get_db(self):
@@ -100,7 +445,15 @@ class ChromaDB(VectorDatabase):
             str(uuid.uuid3(uuid.NAMESPACE_DNS, doc.page_content)) for doc in documents
         ]
 
-    def add_documents(self, documents_chunk: List[Document]):
+    def add_documents(
+        self,
+        documents_chunk: List[Document],
+        embeddings: List[List[float]] | None = None,
+    ):
+        """
+        Aggiunge i chunk al database. Se embeddings è indicato (es. calcolati
+        in blocco dal reindex) vengono usati al posto della funzione di embedding.
+        """
         print("document_chunks", documents_chunk)
         if not documents_chunk:
             logger.warning("Nessun documento fornito per l'aggiunta.")
@@ -120,11 +473,20 @@ class ChromaDB(VectorDatabase):
                     f"Attempted to add documents with an ID that already exists: {', '.join(colliding_ids)}"
                 )
 
-            db.add_documents(
-                documents=documents_chunk,
-                ids=ids_to_add,
-            )
+            if embeddings is None:
+                db.add_documents(
+                    documents=documents_chunk,
+                    ids=ids_to_add,
+                )
+            else:
+                collection.add(
+                    ids=ids_to_add,
+                    embeddings=embeddings,
+                    documents=[doc.page_content for doc in documents_chunk],
+                    metadatas=[doc.metadata or None for doc in documents_chunk],
+                )
 
+            self._on_documents_added(ids_to_add, documents_chunk)
             print(
                 f"ChromaDB: Aggiunti {len(documents_chunk)} documenti al vector store."
             )
@@ -141,11 +503,18 @@ class ChromaDB(VectorDatabase):
             )
             raise
 
+    def get_existing_ids(self, ids: List[str]) -> set[str]:
+        """Restituisce gli id, tra quelli indicati, già presenti nel database."""
+        if not ids:
+            return set()
+        return set(self._get_db()._collection.get(ids=ids, include=[])["ids"])
+
     def delete_document(self, document_path: str):
         """Elimina un documento dal database."""
         try:
             db = self._get_db()
             db.delete(where={"source": document_path})
+            self._on_documents_deleted("source", document_path)
             print(f"[VECTOR DB] Documento con PATH {document_path} eliminato.")
             logger.info(f"Documento con PATH {document_path} eliminato.")
         except Exception as e:
@@ -159,26 +528,80 @@ class ChromaDB(VectorDatabase):
         try:
             db = self._get_db()
             db.delete(where={"faq_id": faq_id})
+            self._on_documents_deleted("faq_id", faq_id)
             print(f"[VECTOR DB] FAQ con ID {faq_id} eliminata.")
             logger.info(f"FAQ con ID {faq_id} eliminata.")
         except Exception as e:
             logger.error(f"Errore durante l'eliminazione della FAQ: {e}", exc_info=True)
             raise
 
-    def search_context(self, query: str, results_number: int = 4) -> List[Document]:
-        try:
-            db = self._get_db()
-            results = db.similarity_search(query, k=results_number)
-            return results
-        except Exception as e:
-            logger.error(f"Errore durante la similarity search: {e}", exc_info=True)
+    def get_document_chunks(self, document_path: str) -> dict[str, dict]:
+        """Restituisce id e metadati dei chunk del documento."""
+        stored = self._get_db()._collection.get(
+            where={"source": document_path}, include=["metadatas"]
+        )
+        return {
+            doc_id: metadata or {}
+            for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+
+    def delete_chunks(self, ids: List[str]):
+        """Elimina i chunk con gli id indicati."""
+        if not ids:
+            return
+        self._get_db().delete(ids=ids)
+        self._on_chunks_deleted(ids)
+
+    def update_chunk_metadatas(self, documents: dict[str, Document]):
+        """Aggiorna i metadati dei chunk indicati, senza ricalcolarne gli embedding."""
+        if not documents:
+            return
+        self._get_db()._collection.update(
+            ids=list(documents),
+            metadatas=[doc.metadata or None for doc in documents.values()],
+        )
+        self._on_chunks_updated(documents)
+
+    def _search_by_vector(
+        self, embedding: List[float], results_number: int
+    ) -> List[Document]:
+        return self._get_db().similarity_search_by_vector(embedding, k=results_number)
+
+    def _search_faqs_by_vector(
+        self, embedding: List[float], results_number: int
+    ) -> List[tuple[Document, float]]:
+        # la collection usa la distanza l2: la similarità del coseno è calcolata
+        # dai vettori, così la soglia non dipende dalla metrica dell'indice
+        results = self._get_db()._collection.query(
+            query_embeddings=[embedding],
+            n_results=results_number,
+            where={"source": "faqs"},
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not results["ids"] or not results["ids"][0]:
             return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        output = []
+        for chunk_id, text, metadata, vector in zip(
+            results["ids"][0],
+            results["documents"][0],
+            results["metadatas"][0],
+            results["embeddings"][0],
+        ):
+            vector = np.asarray(vector, dtype=np.float32)
+            score = float(query @ vector / (np.linalg.norm(vector) or 1.0))
+            output.append(
+                (Document(id=chunk_id, page_content=text, metadata=metadata), score)
+            )
+        return sorted(output, key=lambda result: -result[1])
 
     def delete_all_documents(self):
         """Elimina tutti i documenti dal database."""
         try:
             db = self._get_db()
             db.reset_collection()
+            self._on_all_documents_deleted()
             print("[VECTOR DB] Tutti i documenti eliminati.")
         except Exception as e:
             logger.error(
@@ -221,16 +644,377 @@ class ChromaDB(VectorDatabase):
         return self._get_collection_count()
 
     def _delete(self):
+        self._on_all_documents_deleted()
         return self._get_db().delete_collection()
 
+    async def aclose(self):
+        self._db = None
+        await self.embedding_provider.aclose()
+
+
+class NumpyVectorDB(VectorDatabase):
+    """
+    Database vettoriale in memoria con ricerca esatta.
+
+    I vettori, normalizzati, sono righe di una matrice float32 contigua; la ricerca
+    è un prodotto matrice-vettore (similarità coseno) seguito da una selezione top-k.
+    Ogni scrittura salva uno snapshot nella persist_directory (vettori in .npy,
+    testi e metadati in .json); all'avvio la matrice viene mappata in memoria
+    e quindi ricaricata istantaneamente.
+    Adatto a corpus che stanno comodamente in RAM.
+    """
+
+    _VECTORS_FILE = "numpy_vectors.npy"
+    _DOCUMENTS_FILE = "numpy_documents.json"
+
+    def __init__(
+        self,
+        persist_directory: str = settings.VECTOR_DB_DIRECTORY,
+    ):
+        super().__init__(persist_directory)
+        self._lock = threading.RLock()
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.persist_directory, self._VECTORS_FILE)
+
+    def _documents_path(self) -> str:
+        return os.path.join(self.persist_directory, self._DOCUMENTS_FILE)
+
+    # Singleton
+    def _get_db(self) -> dict:
+        """Carica (una sola volta) lo snapshot dal disco."""
+        with self._lock:
+            if self._db is None:
+                logger.info(
+                    f"NumpyVectorDB: caricamento del database da {self.persist_directory}"
+                )
+                self._db = self._load()
+            return self._db
+
+    def _load(self) -> dict:
+        if os.path.exists(self._vectors_path()) and os.path.exists(
+            self._documents_path()
+        ):
+            vectors = np.load(self._vectors_path(), mmap_mode="r")
+            with open(self._documents_path(), "r", encoding="utf-8") as f:
+                documents = json.load(f)
+            return self._make_state(
+                vectors, documents["ids"], documents["documents"], documents["metadatas"]
+            )
+        return self._make_state(np.empty((0, 0), dtype=np.float32), [], [], [])
+
+    @staticmethod
+    def _make_state(vectors, ids, texts, metadatas) -> dict:
+        return {
+            "vectors": vectors,
+            "ids": ids,
+            "documents": texts,
+            "metadatas": metadatas,
+            "positions": {doc_id: i for i, doc_id in enumerate(ids)},
+        }
+
+    def _save(self, state: dict):
+        """Salva lo snapshot in modo atomico (file temporaneo + rename)."""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        vectors_tmp = self._vectors_path() + ".tmp"
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(state["vectors"], dtype=np.float32))
+        documents_tmp = self._documents_path() + ".tmp"
+        with open(documents_tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ids": state["ids"],
+                    "documents": state["documents"],
+                    "metadatas": state["metadatas"],
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(vectors_tmp, self._vectors_path())
+        os.replace(documents_tmp, self._documents_path())
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _generate_document_ids(self, documents: List[Document]) -> List[str]:
+        """Estrae gli ID dei documenti."""
+        return [
+            str(uuid.uuid3(uuid.NAMESPACE_DNS, doc.page_content)) for doc in documents
+        ]
+
+    @staticmethod
+    def _check_collisions(state: dict, ids: List[str]):
+        """Solleva DuplicateIDError se un id è già presente o ripetuto."""
+        colliding_ids = [i for i in ids if i in state["positions"]]
+        if colliding_ids or len(set(ids)) != len(ids):
+            raise DuplicateIDError(
+                f"Attempted to add documents with an ID that already exists: {', '.join(colliding_ids)}"
+            )
+
+    def add_documents(
+        self,
+        documents_chunk: List[Document],
+        embeddings: List[List[float]] | None = None,
+    ):
+        if not documents_chunk:
+            logger.warning("Nessun documento fornito per l'aggiunta.")
+            return
+        try:
+            ids_to_add = self._generate_document_ids(documents_chunk)
+            with self._lock:
+                self._check_collisions(self._get_db(), ids_to_add)
+
+            if embeddings is None:
+                embeddings = self.embedding_provider.get_embedding_function().embed_documents(
+                    [doc.page_content for doc in documents_chunk]
+                )
+            new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+            with self._lock:
+                state = self._get_db()
+                # un caricamento concorrente può aver aggiunto gli stessi chunk
+                # mentre si calcolavano gli embedding
+                self._check_collisions(state, ids_to_add)
+                vectors = (
+                    np.vstack([state["vectors"], new_vectors])
+                    if len(state["ids"])
+                    else new_vectors
+                )
+                new_state = self._make_state(
+                    np.ascontiguousarray(vectors, dtype=np.float32),
+                    state["ids"] + ids_to_add,
+                    state["documents"] + [doc.page_content for doc in documents_chunk],
+                    state["metadatas"] + [dict(doc.metadata) for doc in documents_chunk],
+                )
+                self._save(new_state)
+                self._db = new_state
+            self._on_documents_added(ids_to_add, documents_chunk)
+
+            logger.info(f"Aggiunti {len(documents_chunk)} documenti al vector store.")
+
+        except DuplicateIDError as e:
+            raise DuplicateIDError(
+                f"ID duplicato trovato durante l'aggiunta di documenti: {e}"
+            )
+        except Exception as e:
+            logger.error(
+                f"Errore durante l'aggiunta di documenti a NumpyVectorDB: {e}",
+                exc_info=True,
+            )
+            raise
+
+    def get_existing_ids(self, ids: List[str]) -> set[str]:
+        """Restituisce gli id, tra quelli indicati, già presenti nel database."""
+        with self._lock:
+            positions = self._get_db()["positions"]
+            return {doc_id for doc_id in ids if doc_id in positions}
+
+    def _keep_only(self, state: dict, keep: List[int]) -> bool:
+        """Salva lo stato con le sole righe indicate; False se non cambia nulla."""
+        if len(keep) == len(state["ids"]):
+            return False
+        new_state = self._make_state(
+            np.ascontiguousarray(state["vectors"][keep], dtype=np.float32),
+            [state["ids"][i] for i in keep],
+            [state["documents"][i] for i in keep],
+            [state["metadatas"][i] for i in keep],
+        )
+        self._save(new_state)
+        self._db = new_state
+        return True
+
+    def _delete_where(self, key: str, value: str):
+        with self._lock:
+            state = self._get_db()
+            keep = [
+                i
+                for i, metadata in enumerate(state["metadatas"])
+                if metadata.get(key) != value
+            ]
+            if not self._keep_only(state, keep):
+                return
+        self._on_documents_deleted(key, value)
+
+    def get_document_chunks(self, document_path: str) -> dict[str, dict]:
+        """Restituisce id e metadati dei chunk del documento."""
+        with self._lock:
+            state = self._get_db()
+            return {
+                doc_id: dict(metadata)
+                for doc_id, metadata in zip(state["ids"], state["metadatas"])
+                if metadata.get("source") == document_path
+            }
+
+    def delete_chunks(self, ids: List[str]):
+        """Elimina i chunk con gli id indicati."""
+        to_delete = set(ids)
+        with self._lock:
+            state = self._get_db()
+            keep = [i for i, doc_id in enumerate(state["ids"]) if doc_id not in to_delete]
+            if not self._keep_only(state, keep):
+                return
+        self._on_chunks_deleted(list(to_delete))
+
+    def update_chunk_metadatas(self, documents: dict[str, Document]):
+        """Aggiorna i metadati dei chunk indicati, senza ricalcolarne gli embedding."""
+        with self._lock:
+            state = self._get_db()
+            metadatas = list(state["metadatas"])
+            for doc_id, document in documents.items():
+                position = state["positions"].get(doc_id)
+                if position is not None:
+                    metadatas[position] = dict(document.metadata)
+            new_state = self._make_state(
+                state["vectors"], state["ids"], state["documents"], metadatas
+            )
+            self._save(new_state)
+            self._db = new_state
+        self._on_chunks_updated(documents)
+
+    def delete_document(self, document_path: str):
+        """Elimina un documento dal database."""
+        try:
+            self._delete_where("source", document_path)
+            logger.info(f"Documento con PATH {document_path} eliminato.")
+        except Exception as e:
+            logger.error(
+                f"Errore durante l'eliminazione del documento: {e}", exc_info=True
+            )
+            raise
+
+    def delete_faq(self, faq_id: str):
+        """Elimina una FAQ dal database."""
+        try:
+            self._delete_where("faq_id", faq_id)
+            logger.info(f"FAQ con ID {faq_id} eliminata.")
+        except Exception as e:
+            logger.error(f"Errore durante l'eliminazione della FAQ: {e}", exc_info=True)
+            raise
+
+    def _top_k(
+        self, embedding, results_number: int, source: str = None
+    ) -> List[tuple[Document, float]]:
+        """I results_number chunk più simili, solo di source se indicato."""
+        with self._lock:
+            state = self._get_db()
+        if not state["ids"] or results_number <= 0:
+            return []
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        scores = state["vectors"] @ query
+        if source is not None:
+            mask = np.array(
+                [metadata.get("source") == source for metadata in state["metadatas"]]
+            )
+            if not mask.any():
+                return []
+            scores = np.where(mask, scores, -np.inf)
+            results_number = min(results_number, int(mask.sum()))
+        k = min(results_number, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (
+                Document(
+                    id=state["ids"][i],
+                    page_content=state["documents"][i],
+                    metadata=state["metadatas"][i],
+                ),
+                float(scores[i]),
+            )
+            for i in top
+        ]
+
+    def _search_by_vector(self, embedding, results_number: int) -> List[Document]:
+        return [document for document, _ in self._top_k(embedding, results_number)]
+
+    def _search_faqs_by_vector(
+        self, embedding, results_number: int
+    ) -> List[tuple[Document, float]]:
+        return self._top_k(embedding, results_number, source="faqs")
+
+    def delete_all_documents(self):
+        """Elimina tutti i documenti dal database."""
+        try:
+            with self._lock:
+                for path in (self._vectors_path(), self._documents_path()):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._db = self._make_state(
+                    np.empty((0, 0), dtype=np.float32), [], [], []
+                )
+            self._on_all_documents_deleted()
+        except Exception as e:
+            logger.error(
+                f"Errore durante l'eliminazione di tutti i documenti: {e}",
+                exc_info=True,
+            )
+            raise
+
+    def get_all_documents(self):
+        """Recupera tutti i documenti dal database, nello stesso formato di Chroma."""
+        try:
+            with self._lock:
+                state = self._get_db()
+            return {
+                "ids": list(state["ids"]),
+                "embeddings": None,
+                "documents": list(state["documents"]),
+                "metadatas": list(state["metadatas"]),
+            }
+        except Exception as e:
+            logger.error(
+                f"Errore durante il recupero di tutti i documenti: {e}", exc_info=True
+            )
+            return []
+
+    # metodi ausiliari
+    def is_empty(self) -> bool:
+        return self.count() == 0
+
+    def count(self) -> int:
+        return len(self._get_db()["ids"])
+
+    def _delete(self):
+        return self.delete_all_documents()
+
+    async def aclose(self):
+        with self._lock:
+            self._db = None
+        await self.embedding_provider.aclose()
+
+
+_shared_vector_database: VectorDatabase | None = None
+
 
 def get_vector_database() -> VectorDatabase:
     match settings.VECTOR_DB_PROVIDER.lower():
         case "chroma":
-            vdb = ChromaDB(persist_directory=settings.VECTOR_DB_DIRECTORY)
-            # vdb.ensure_vectorized(settings.DOCUMENTS_FOLDER)
-            return vdb
+            return ChromaDB(persist_directory=settings.VECTOR_DB_DIRECTORY)
+        case "numpy":
+            return NumpyVectorDB(persist_directory=settings.VECTOR_DB_DIRECTORY)
         case _:
             raise ValueError(
                 f"Provider di database vettoriale '{settings.VECTOR_DB_PROVIDER}' non supportato."
             )
+
+
+def get_shared_vector_database() -> VectorDatabase:
+    """
+    Restituisce l'istanza del database vettoriale condivisa dall'intero processo,
+    creandola alla prima richiesta.
+    """
+    global _shared_vector_database
+    if _shared_vector_database is None:
+        _shared_vector_database = get_vector_database()
+    return _shared_vector_database
+
+
+async def close_shared_vector_database():
+    """Chiude l'istanza condivisa del database vettoriale, se presente."""
+    global _shared_vector_database
+    if _shared_vector_database is not None:
+        await _shared_vector_database.aclose()
+        _shared_vector_database = None
@@ -0,0 +1,103 @@
+"""
+Stand-in locale del Database API, per i test e i benchmark.
+
+Implementa in memoria gli endpoint usati da FileManager e StringManager.
+Si avvia con:
+
+    uvicorn app.stubs.database_api:app --port 8000
+
+La variabile d'ambiente DATABASE_API_STUB_LATENCY_MS aggiunge una latenza
+artificiale a ogni richiesta, per simulare il servizio reale.
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+
+app = FastAPI(title="Database API stub")
+
+_documents: dict[str, dict] = {}
+_faqs: dict[str, dict] = {}
+
+
+def reset():
+    """Svuota lo stato in memoria dello stub."""
+    _documents.clear()
+    _faqs.clear()
+
+
+@app.middleware("http")
+async def _latency(request: Request, call_next):
+    latency_ms = float(os.environ.get("DATABASE_API_STUB_LATENCY_MS", "0"))
+    if latency_ms > 0:
+        await asyncio.sleep(latency_ms / 1000)
+    return await call_next(request)
+
+
+def _check_token(authorization: Optional[str]):
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token mancante")
+
+
+def _check_password(password: Optional[str]):
+    if not password:
+        raise HTTPException(status_code=401, detail="Password errata")
+
+
+@app.get("/auth/verify")
+async def verify_token(authorization: Optional[str] = Header(None)):
+    _check_token(authorization)
+    return {"valid": True}
+
+
+@app.post("/documents", status_code=201)
+async def add_document(body: dict, authorization: Optional[str] = Header(None)):
+    _check_token(authorization)
+    if any(doc["file_path"] == body["file_path"] for doc in _documents.values()):
+        raise HTTPException(status_code=400, detail="Documento già esistente")
+    document_id = str(uuid.uuid4())
+    _documents[document_id] = {"id": document_id, **body}
+    return _documents[document_id]
+
+
+@app.delete("/documents", status_code=204)
+async def delete_document(body: dict, authorization: Optional[str] = Header(None)):
+    _check_token(authorization)
+    _check_password(body.get("admin", {}).get("current_password"))
+    document_id = body.get("file", {}).get("id")
+    if _documents.pop(document_id, None) is None:
+        raise HTTPException(status_code=404, detail="Documento non trovato")
+    return Response(status_code=204)
+
+
+@app.post("/faqs", status_code=201)
+async def add_faq(body: dict, authorization: Optional[str] = Header(None)):
+    _check_token(authorization)
+    faq_id = str(uuid.uuid4())
+    _faqs[faq_id] = {"id": faq_id, **body}
+    return _faqs[faq_id]
+
+
+@app.delete("/faqs/{faq_id}", status_code=204)
+async def delete_faq(
+    faq_id: str, body: dict, authorization: Optional[str] = Header(None)
+):
+    _check_token(authorization)
+    _check_password(body.get("current_password"))
+    if _faqs.pop(faq_id, None) is None:
+        raise HTTPException(status_code=404, detail="FAQ non trovata")
+    return Response(status_code=204)
+
+
+@app.patch("/faqs/{faq_id}")
+async def update_faq(
+    faq_id: str, body: dict, authorization: Optional[str] = Header(None)
+):
+    _check_token(authorization)
+    if faq_id not in _faqs:
+        raise HTTPException(status_code=404, detail="FAQ non trovata")
+    _faqs[faq_id].update(body)
+    return _faqs[faq_id]
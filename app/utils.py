@@ -1,5 +1,6 @@
 import uuid
 import hashlib
+import functools
 from bson import ObjectId
 
 def get_uuid3(text):
@@ -11,4 +12,44 @@ def get_uuid3(text):
 
 def get_object_id(text):
     hash_bytes = hashlib.md5(text.encode("utf-8")).digest()[:12]
-    return ObjectId(hash_bytes)
\ No newline at end of file
+    return ObjectId(hash_bytes)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model_name)
+    except Exception:
+        # tiktoken missing, unknown model or BPE files not downloadable
+        return None
+
+
+def count_tokens(text: str, model_name: str = "text-embedding-ada-002") -> int:
+    """
+    Count the tokens of the text with tiktoken,
+    falling back to an estimate of 4 characters per token.
+    """
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(
+    text: str, max_tokens: int, model_name: str = "text-embedding-ada-002"
+) -> str:
+    """
+    Truncate the text to at most max_tokens tokens, with the same
+    tokenizer (or estimate) used by count_tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
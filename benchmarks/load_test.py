@@ -0,0 +1,374 @@
+"""
+Test di carico delle route POST /, /chat_name e /documents con livelli di
+concorrenza crescenti, senza servizi esterni.
+
+L'app viene avviata con un solo worker uvicorn, con il provider LLM "fake"
+(latenza e velocità configurabili), gli embedding locali di feature hashing,
+il database vettoriale NumPy e il Database API finto di `app/stubs/database_api.py`
+avviato anch'esso con uvicorn. Dopo aver caricato i documenti di `documenti/`, per ogni livello di
+concorrenza altrettanti client inviano richieste per --duration secondi,
+scelte secondo le proporzioni di --mix. Per ogni livello sono riportati
+richieste/s, tempo al primo token e latenza tra i token dello stream,
+percentuale di errori e ritardo dell'event loop (letto da /metrics).
+
+Uso:
+    python -m benchmarks.load_test [--concurrency 1 8 32 128] [--duration 10]
+        [--mix chat=8 chat_name=1 documents=1] [--ttft-ms 300]
+        [--tokens-per-second 50] [--error-rate 0] [--json risultati.json]
+    python -m benchmarks.load_test --url http://localhost:8001   # app già avviata
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.event_loop_monitor_service import LAG_BUCKETS_MS
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", "1", "--log-level", "warning", "--no-access-log",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(url: str, path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            with contextlib.suppress(httpx.HTTPError):
+                if (await client.get(path)).status_code < 500:
+                    return
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Il server {url} non risponde")
+
+
+def load_questions(documents_folder: str) -> list[str]:
+    questions = []
+    for file_name in sorted(os.listdir(documents_folder)):
+        if file_name.endswith(".txt"):
+            path = os.path.join(documents_folder, file_name)
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                name = f.read(200).split(" - ")[0].strip()
+            questions.append(f"Che cosa mi sai dire di {name}?")
+    return questions
+
+
+def percentile(values: list[float], q: int) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def lag_percentile(buckets: dict[str, int], q: float) -> float | None:
+    """Limite superiore del bucket che contiene il q-esimo percentile del ritardo."""
+    total = sum(buckets.values())
+    if total == 0:
+        return None
+    seen = 0
+    for bound in LAG_BUCKETS_MS:
+        seen += buckets.get(str(bound), 0)
+        if seen >= q / 100 * total:
+            return bound
+    return LAG_BUCKETS_MS[-1]
+
+
+class LoadGenerator:
+    """Invia le richieste e ne raccoglie le misure per un livello di concorrenza."""
+
+    def __init__(self, client: httpx.AsyncClient, questions: list[str], token: str):
+        self._client = client
+        self._questions = questions
+        self._token = token
+        self._uploads = itertools.count()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.errors = {}
+        self.durations = []
+        self.ttft = []
+        self.inter_token = []
+
+    def _done(self, kind: str, start: float, error: bool):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        if error:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        else:
+            self.durations.append(time.perf_counter() - start)
+
+    async def chat(self):
+        start = time.perf_counter()
+        error = False
+        first = last = None
+        gaps = []
+        try:
+            async with self._client.stream(
+                "POST", "/", json={"question": random.choice(self._questions)}
+            ) as response:
+                if response.status_code != 200:
+                    error = True
+                else:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        data = line[len("data: ") :]
+                        if data.startswith("[ERROR]"):
+                            error = True
+                            break
+                        if data == "[DONE]":
+                            break
+                        now = time.perf_counter()
+                        if first is None:
+                            first = now - start
+                        else:
+                            gaps.append(now - last)
+                        last = now
+        except httpx.HTTPError:
+            error = True
+        if not error and first is not None:
+            self.ttft.append(first)
+            self.inter_token.extend(gaps)
+        self._done("chat", start, error)
+
+    async def chat_name(self):
+        start = time.perf_counter()
+        try:
+            response = await self._client.post(
+                "/chat_name", json={"context": random.choice(self._questions)}
+            )
+            error = response.status_code != 200
+        except httpx.HTTPError:
+            error = True
+        self._done("chat_name", start, error)
+
+    async def documents(self):
+        start = time.perf_counter()
+        # contenuto sempre diverso, altrimenti il documento risulta già caricato
+        number = next(self._uploads)
+        content = (
+            f"Prodotto di prova {number} - Codice: T{number:06d} "
+            f"{random.choice(self._questions)} Peso: {random.randint(1, 999)} g"
+        )
+        try:
+            response = await self._client.post(
+                "/documents",
+                params={"token": self._token},
+                files={
+                    "files": (
+                        f"load-{os.getpid()}-{number}.txt",
+                        content.encode("utf-8"),
+                        "text/plain",
+                    )
+                },
+            )
+            error = response.status_code != 200
+        except httpx.HTTPError:
+            error = True
+        self._done("documents", start, error)
+
+    async def worker(self, mix: dict[str, int], deadline: float):
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        while time.perf_counter() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            await getattr(self, kind)()
+
+
+async def upload_documents(client: httpx.AsyncClient, folder: str, token: str):
+    """Carica i documenti di prova a blocchi, come farebbe l'interfaccia."""
+    names = sorted(name for name in os.listdir(folder) if name.endswith(".txt"))
+    for i in range(0, len(names), 20):
+        files = []
+        for name in names[i : i + 20]:
+            with open(os.path.join(folder, name), "rb") as f:
+                files.append(("files", (name, f.read(), "text/plain")))
+        response = await client.post("/documents", params={"token": token}, files=files)
+        response.raise_for_status()
+    return len(names)
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    generator: LoadGenerator,
+    concurrency: int,
+    duration: float,
+    mix: dict[str, int],
+) -> dict:
+    before = (await client.get("/metrics")).json().get("event_loop", {})
+    generator.reset()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(
+        *(generator.worker(mix, deadline) for _ in range(concurrency))
+    )
+    elapsed = time.perf_counter() - start
+    after = (await client.get("/metrics")).json().get("event_loop", {})
+
+    buckets = {
+        bound: count - before.get("buckets", {}).get(bound, 0)
+        for bound, count in after.get("buckets", {}).items()
+    }
+    samples = after.get("samples", 0) - before.get("samples", 0)
+    lag_total = after.get("total_lag_ms", 0) - before.get("total_lag_ms", 0)
+    requests = sum(generator.requests.values())
+    errors = sum(generator.errors.values())
+    ms = lambda values, q: None if not values else percentile(values, q) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "requests_per_second": requests / elapsed,
+        "requests_by_route": generator.requests,
+        "error_rate": errors / requests if requests else 0.0,
+        "errors_by_route": generator.errors,
+        "latency_p50_ms": ms(generator.durations, 50),
+        "latency_p99_ms": ms(generator.durations, 99),
+        "ttft_p50_ms": ms(generator.ttft, 50),
+        "ttft_p99_ms": ms(generator.ttft, 99),
+        "inter_token_p50_ms": ms(generator.inter_token, 50),
+        "inter_token_p99_ms": ms(generator.inter_token, 99),
+        "loop_lag_mean_ms": lag_total / samples if samples else None,
+        "loop_lag_p99_ms": lag_percentile(buckets, 99),
+    }
+
+
+def format_ms(value: float | None) -> str:
+    return "n/a" if value is None else f"{value:.0f}"
+
+
+async def run(args, url: str) -> list[dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        if args.documents:
+            uploaded = await upload_documents(client, args.documents, args.token)
+            print(f"{uploaded} documenti caricati")
+        generator = LoadGenerator(
+            client, load_questions(args.documents or settings.DOCUMENTS_FOLDER), args.token
+        )
+        print(
+            f"{'conc':>5} {'req/s':>7} {'err%':>5} {'p50 ms':>7} {'p99 ms':>7} "
+            f"{'ttft50':>7} {'ttft99':>7} {'itl50':>6} {'itl99':>6} "
+            f"{'lag':>5} {'lag99':>6}"
+        )
+        results = []
+        for concurrency in args.concurrency:
+            result = await run_level(
+                client, generator, concurrency, args.duration, args.mix
+            )
+            results.append(result)
+            lag99 = result["loop_lag_p99_ms"]
+            print(
+                f"{concurrency:>5} {result['requests_per_second']:>7.1f} "
+                f"{result['error_rate'] * 100:>5.1f} "
+                f"{format_ms(result['latency_p50_ms']):>7} "
+                f"{format_ms(result['latency_p99_ms']):>7} "
+                f"{format_ms(result['ttft_p50_ms']):>7} "
+                f"{format_ms(result['ttft_p99_ms']):>7} "
+                f"{format_ms(result['inter_token_p50_ms']):>6} "
+                f"{format_ms(result['inter_token_p99_ms']):>6} "
+                f"{format_ms(result['loop_lag_mean_ms']):>5} "
+                f"{'n/a' if lag99 is None else ('>1000' if lag99 == float('inf') else f'{lag99:.0f}'):>6}"
+            )
+        return results
+
+
+def parse_mix(values: list[str]) -> dict[str, int]:
+    mix = {}
+    for value in values:
+        kind, _, weight = value.partition("=")
+        if kind not in ("chat", "chat_name", "documents"):
+            raise argparse.ArgumentTypeError(f"Route sconosciuta: {kind}")
+        mix[kind] = int(weight or 1)
+    return mix
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="usa un'app già avviata invece di avviarla")
+    parser.add_argument("--documents", default=settings.DOCUMENTS_FOLDER)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--mix", nargs="+", default=["chat=8", "chat_name=1", "documents=1"]
+    )
+    parser.add_argument("--ttft-ms", type=float, default=settings.FAKE_LLM_TTFT_MS)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=settings.FAKE_LLM_TOKENS_PER_SECOND
+    )
+    parser.add_argument(
+        "--response-tokens", type=int, default=settings.FAKE_LLM_RESPONSE_TOKENS
+    )
+    parser.add_argument("--error-rate", type=float, default=settings.FAKE_LLM_ERROR_RATE)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--token", default="load-test")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args(argv)
+    args.mix = parse_mix(args.mix)
+
+    if args.url:
+        results = asyncio.run(run(args, args.url))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            database_api_port, app_port = free_port(), free_port()
+            env = {
+                **os.environ,
+                "LLM_PROVIDER": "fake",
+                "EMBEDDING_PROVIDER": "hashing",
+                "VECTOR_DB_PROVIDER": "numpy",
+                "VECTOR_DB_DIRECTORY": os.path.join(directory, "vector_db"),
+                "DOCUMENTS_DIR": os.path.join(directory, "documents"),
+                "DATABASE_API_URL": f"http://127.0.0.1:{database_api_port}",
+                "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+                "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+                "FAKE_LLM_RESPONSE_TOKENS": str(args.response_tokens),
+                "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+            }
+            servers = [
+                start_server("app.stubs.database_api:app", database_api_port, env),
+                start_server("app.main:app", app_port, env),
+            ]
+            url = f"http://127.0.0.1:{app_port}"
+            try:
+                asyncio.run(wait_until_ready(url, "/metrics"))
+                results = asyncio.run(run(args, url))
+            finally:
+                for server in servers:
+                    server.terminate()
+                for server in servers:
+                    server.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
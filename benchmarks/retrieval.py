@@ -0,0 +1,250 @@
+"""
+Benchmark della ricerca sui documenti in `documenti/` per ogni database vettoriale,
+senza chiave OpenAI: gli embedding sono calcolati dal provider locale
+deterministico (EMBEDDING_PROVIDER=hashing).
+
+Da ogni scheda prodotto vengono generate domande sul codice, sul nome,
+sull'origine e sul peso; una ricerca è corretta se tra i primi k chunk c'è un
+chunk della stessa scheda che contiene la risposta. La ricerca è quella usata
+dal servizio di risposta (prima per codice prodotto, poi per similarità);
+con --no-code-lookup solo quella per similarità.
+Per ogni backend sono riportati il tempo di costruzione dell'indice, la memoria,
+le latenze p50/p95/p99 e la recall@k.
+
+Per confrontare la ricerca vettoriale con quella ibrida (BM25 + RRF):
+    python -m benchmarks.retrieval --backends numpy --no-code-lookup
+    python -m benchmarks.retrieval --backends numpy --no-code-lookup --hybrid
+
+Uso:
+    python -m benchmarks.retrieval [--backends numpy chroma] [-k 4] [--hybrid]
+        [--no-code-lookup] [--strip-boilerplate] [--json risultati.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.config import settings
+from app.services.boilerplate_service import BoilerplateFilter
+from app.services.file_manager_service import add_product_codes
+from app.services.vector_database_service import ChromaDB, NumpyVectorDB
+
+BACKENDS = {"numpy": NumpyVectorDB, "chroma": ChromaDB}
+
+CODE_PATTERN = re.compile(r"Codice:\s*([0-9A-Za-z]+)")
+ORIGIN_PATTERN = re.compile(
+    r"Paese e Luogo di Origine:\s*(.*?)\s+(?:Tipo di Latte|Peso|Ordine Minimo|Aggiungi)"
+)
+WEIGHT_PATTERN = re.compile(r"Peso:\s*(.*?)\s+(?:Ordine Minimo|Aggiungi)")
+
+
+def load_corpus(documents_folder: str, strip_boilerplate: bool = False):
+    """
+    Divide in chunk le schede prodotto e genera le domande.
+
+    Returns:
+    - tuple[list[Document], list[dict]]: I chunk (senza duplicati) e le domande,
+      ognuna con tipo, testo, scheda e risposta attesa.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE, chunk_overlap=settings.CHUNK_OVERLAP
+    )
+    texts = {}
+    for file_name in sorted(os.listdir(documents_folder)):
+        if file_name.endswith(".txt"):
+            path = os.path.join(documents_folder, file_name)
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                texts[path] = f.read()
+
+    boilerplate_filter = None
+    if strip_boilerplate:
+        boilerplate_filter = BoilerplateFilter()
+        for path, text in texts.items():
+            boilerplate_filter.observe(path, [text])
+
+    chunks, questions = [], []
+    for path, text in texts.items():
+        content = boilerplate_filter.strip(text) if boilerplate_filter else text
+        data = [Document(page_content=content, metadata={"source": path})]
+        document_chunks = add_product_codes(data, splitter.split_documents(data))
+        if boilerplate_filter:
+            document_chunks = boilerplate_filter.drop_duplicates(path, document_chunks)
+        chunks.extend(document_chunks)
+
+        name = text.split(" - ")[0].strip()
+        questions.append(
+            {"type": "name", "query": f"Che cos'è {name}?", "source": path, "answer": ""}
+        )
+        if match := CODE_PATTERN.search(text):
+            code = match.group(1)
+            questions.append(
+                {
+                    "type": "code",
+                    "query": f"Mi dai la scheda del prodotto {code}?",
+                    "source": path,
+                    "answer": f"Codice: {code}",
+                }
+            )
+        if match := ORIGIN_PATTERN.search(text):
+            questions.append(
+                {
+                    "type": "origin",
+                    "query": f"Da dove viene {name}?",
+                    "source": path,
+                    "answer": match.group(1),
+                }
+            )
+        if match := WEIGHT_PATTERN.search(text):
+            questions.append(
+                {
+                    "type": "weight",
+                    "query": f"Quanto pesa {name}?",
+                    "source": path,
+                    "answer": f"Peso: {match.group(1)}",
+                }
+            )
+    # chunk identici (es. footer comuni) avrebbero lo stesso id
+    unique = {chunk.page_content: chunk for chunk in chunks}
+    return list(unique.values()), questions
+
+
+def is_hit(question: dict, results: list[Document]) -> bool:
+    return any(
+        r.metadata.get("source") == question["source"]
+        and question["answer"] in r.page_content
+        for r in results
+    )
+
+
+def rss_bytes() -> int | None:
+    """Memoria residente del processo (solo Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def benchmark_backend(
+    backend: str, chunks, questions, k: int, code_lookup: bool = True
+) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        rss_before = rss_bytes()
+        tracemalloc.start()
+        start = time.perf_counter()
+        vector_db = BACKENDS[backend](persist_directory=directory)
+        # i backend stampano ogni documento aggiunto
+        with contextlib.redirect_stdout(io.StringIO()):
+            vector_db.add_documents(chunks)
+        build_seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = rss_bytes()
+
+        def retrieve(query: str) -> list[Document]:
+            # come LLMResponseService.generate_llm_response
+            if code_lookup and (results := vector_db.search_by_product_code(query, k)):
+                return results
+            return vector_db.search_context(query, k)
+
+        for question in questions[:10]:
+            retrieve(question["query"])
+        vector_db._query_cache.invalidate()
+
+        latencies, hits = [], {}
+        for question in questions:
+            start = time.perf_counter()
+            results = retrieve(question["query"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits.setdefault(question["type"], []).append(is_hit(question, results))
+
+    all_hits = [hit for type_hits in hits.values() for hit in type_hits]
+    return {
+        "backend": backend,
+        "chunks": len(chunks),
+        "questions": len(questions),
+        "build_seconds": build_seconds,
+        "build_peak_mb": peak / 2**20,
+        "rss_delta_mb": (
+            (rss_after - rss_before) / 2**20
+            if rss_before is not None and rss_after is not None
+            else None
+        ),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "recall": sum(all_hits) / len(all_hits),
+        "recall_by_type": {
+            name: sum(type_hits) / len(type_hits) for name, type_hits in hits.items()
+        },
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", default=settings.DOCUMENTS_FOLDER)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--embedding-provider", default="hashing")
+    parser.add_argument("--hybrid", action="store_true")
+    parser.add_argument(
+        "--no-code-lookup",
+        dest="code_lookup",
+        action="store_false",
+        help="misura solo la ricerca per similarità, anche per le domande sul codice",
+    )
+    parser.add_argument("--strip-boilerplate", action="store_true")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args(argv)
+
+    settings.EMBEDDING_PROVIDER = args.embedding_provider
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.EMBEDDING_BATCH_ENABLED = False
+    settings.HYBRID_SEARCH_ENABLED = args.hybrid
+
+    chunks, questions = load_corpus(args.documents, args.strip_boilerplate)
+    print(
+        f"{len(chunks)} chunk, {len(questions)} domande, k={args.k}, "
+        f"embedding={args.embedding_provider}, hybrid={args.hybrid}, "
+        f"code_lookup={args.code_lookup}"
+    )
+    results = []
+    for backend in args.backends:
+        result = benchmark_backend(
+            backend, chunks, questions, args.k, code_lookup=args.code_lookup
+        )
+        results.append(result)
+        rss = result["rss_delta_mb"]
+        by_type = " ".join(
+            f"{name}={recall:.2f}" for name, recall in result["recall_by_type"].items()
+        )
+        print(
+            f"{backend:7} build={result['build_seconds']:.2f}s "
+            f"peak={result['build_peak_mb']:.1f}MB "
+            f"rss={'n/a' if rss is None else f'{rss:.1f}MB'} "
+            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+            f"p99={result['p99_ms']:.2f}ms recall@{args.k}={result['recall']:.2f} "
+            f"({by_type})"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark del picco di memoria di FileManager._save_file al crescere della
+dimensione del file caricato, confrontato con la lettura dell'intero file.
+
+Il picco è misurato con tracemalloc (allocazioni Python) durante il salvataggio
+di un UploadFile che legge da un file su disco, come fa Starlette oltre la
+soglia della SpooledTemporaryFile.
+
+Uso:
+    python -m benchmarks.upload_memory [--sizes 10 50 200]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from fastapi import UploadFile
+
+from app.services.file_manager_service import TextFileManager
+
+
+async def read_whole_file(file_manager, file: UploadFile):
+    """Salvataggio precedente: legge tutto il file in memoria e lo scrive."""
+    await file.seek(0)
+    contents = await file.read()
+    with open(file_manager.get_full_path(file.filename), "wb") as f:
+        f.write(contents)
+
+
+async def measure(save, file_manager, source_path: str) -> tuple[float, float]:
+    with open(source_path, "rb") as source:
+        file = UploadFile(filename="upload.txt", file=source)
+        tracemalloc.start()
+        start = time.perf_counter()
+        await save(file_manager, file)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / 2**20, elapsed
+
+
+async def main(sizes: list[int]):
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DOCUMENTS_DIR"] = os.path.join(directory, "documents")
+        file_manager = TextFileManager()
+        print(f"{'MB':>6} {'streaming MB':>14} {'s':>6} {'read() MB':>11} {'s':>6}")
+        for size in sizes:
+            source_path = os.path.join(directory, f"source-{size}.txt")
+            with open(source_path, "wb") as f:
+                for _ in range(size):
+                    f.write(os.urandom(2**20))
+
+            streaming_peak, streaming_time = await measure(
+                TextFileManager._save_file, file_manager, source_path
+            )
+            whole_peak, whole_time = await measure(
+                read_whole_file, file_manager, source_path
+            )
+            print(
+                f"{size:>6} {streaming_peak:>14.1f} {streaming_time:>6.2f} "
+                f"{whole_peak:>11.1f} {whole_time:>6.2f}"
+            )
+            os.remove(source_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
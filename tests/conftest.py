@@ -0,0 +1,15 @@
+import pytest
+
+from app.config import settings
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path):
+    # cache degli embedding e registro dei file nella cartella del test,
+    # non nella cartella del database vettoriale del repository
+    monkeypatch.setattr(
+        settings, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache.sqlite3")
+    )
+    monkeypatch.setattr(
+        settings, "INGEST_MANIFEST_PATH", str(tmp_path / "ingest_manifest.sqlite3")
+    )
@@ -176,6 +176,148 @@ async def test_upload_file_with_one_error(monkeypatch):
 
 
 
+@pytest.mark.asyncio
+async def test_upload_files_concurrently(monkeypatch):
+    import asyncio
+
+    running = 0
+    max_running = 0
+
+    async def mock_add_document(file, _):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if file.filename == "bad.txt":
+            raise HTTPException(status_code=400, detail="Documento già esistente")
+
+    fileManager = MagicMock()
+    fileManager.add_document = mock_add_document
+    monkeypatch.setattr("app.routes.documents.get_file_manager", lambda _: fileManager)
+    monkeypatch.setattr("app.routes.documents.settings.UPLOAD_CONCURRENCY", 3)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        files = [
+            ("files", (f"test{i}.txt", BytesIO(b"test content"), "text/plain"))
+            for i in range(6)
+        ] + [
+            ("files", ("bad.txt", BytesIO(b"test content"), "text/plain")),
+            ("files", ("test.exe", BytesIO(b"test content"), "text/plain")),
+        ]
+        response = await ac.post("/documents?token=test_token", files=files)
+
+    assert max_running == 3, "Should process files in parallel up to UPLOAD_CONCURRENCY"
+    assert response.json()["processed_count"] == 6
+    assert [e["filename"] for e in response.json()["errors"]] == [
+        "bad.txt",
+        "test.exe",
+    ], "Errors should keep the order of the uploaded files"
+
+
+@pytest.mark.asyncio
+async def test_upload_files_background(monkeypatch):
+    from app.services.ingestion_job_service import IngestionJobManager
+
+    async def mock_save_new_file(file):
+        return f"/data/documents/{file.filename}", "hash"
+
+    async def mock_ingest_file(file_path, title, token, job=None, sha256=None):
+        job.set_stage(job.PARSING)
+        job.chunks = 2
+        job.set_stage(job.INDEXING)
+
+    fileManager = MagicMock()
+    fileManager._save_new_file = mock_save_new_file
+    fileManager._ingest_file = mock_ingest_file
+    manager = IngestionJobManager(workers=1)
+    monkeypatch.setattr("app.routes.documents.get_file_manager", lambda _: fileManager)
+    monkeypatch.setattr("app.routes.documents.get_ingestion_job_manager", lambda: manager)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        files = [
+            ("files", ("a.txt", BytesIO(b"test content"), "text/plain")),
+            ("files", ("b.exe", BytesIO(b"test content"), "text/plain")),
+        ]
+        response = await ac.post(
+            "/documents?token=test_token&background=true", files=files
+        )
+        assert response.status_code == 202, "Background uploads should be accepted"
+        jobs = response.json()["jobs"]
+        assert [job["filename"] for job in jobs] == ["a.txt"]
+        assert response.json()["errors"][0]["filename"] == "b.exe"
+
+        await manager._queue.join()
+        status = await ac.get(f"/documents/jobs/{jobs[0]['job_id']}")
+        assert status.status_code == 200
+        assert status.json()["stage"] == "done"
+        assert status.json()["chunks"] == 2
+        assert "indexing" in status.json()["timings"]
+
+        missing = await ac.get("/documents/jobs/unknown")
+        assert missing.status_code == 404
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_upload_files_background_submit_error(monkeypatch):
+    async def mock_save_new_file(file):
+        return f"/data/documents/{file.filename}", "hash"
+
+    fileManager = MagicMock()
+    fileManager._save_new_file = mock_save_new_file
+    manager = MagicMock()
+    manager.submit.side_effect = RuntimeError("shutting down")
+    monkeypatch.setattr("app.routes.documents.get_file_manager", lambda _: fileManager)
+    monkeypatch.setattr("app.routes.documents.get_ingestion_job_manager", lambda: manager)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post(
+            "/documents?token=test_token&background=true",
+            files=[("files", ("a.txt", BytesIO(b"test content"), "text/plain"))],
+        )
+    assert response.status_code == 400
+    fileManager._discard_new_file.assert_called_once_with(
+        "/data/documents/a.txt", "hash"
+    ), "Should release the content hash and remove the saved file"
+
+
+@pytest.mark.asyncio
+async def test_replace_file(monkeypatch):
+    async def mock_replace_document(file, token):
+        return {"added": 1, "removed": 2, "unchanged": 5, "embeddings_saved": 5}
+
+    fileManager = MagicMock()
+    fileManager.replace_document = mock_replace_document
+    monkeypatch.setattr("app.routes.documents.get_file_manager", lambda _: fileManager)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.put(
+            "/documents?token=test_token",
+            files={"file": ("a.txt", BytesIO(b"test content"), "text/plain")},
+        )
+        assert response.status_code == 200
+        assert response.json()["embeddings_saved"] == 5
+
+        response = await ac.put(
+            "/documents?token=test_token",
+            files={"file": ("a.exe", BytesIO(b"test content"), "text/plain")},
+        )
+        assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_replace_file_error(monkeypatch):
+    async def mock_replace_document(file, token):
+        raise HTTPException(status_code=404, detail="Documento a.txt non trovato")
+
+    fileManager = MagicMock()
+    fileManager.replace_document = mock_replace_document
+    monkeypatch.setattr("app.routes.documents.get_file_manager", lambda _: fileManager)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.put(
+            "/documents?token=test_token",
+            files={"file": ("a.txt", BytesIO(b"test content"), "text/plain")},
+        )
+    assert response.status_code == 404
+
+
 @pytest.mark.asyncio
 async def test_delete_file_success(monkeypatch):
     async def mock_delete_document(*args, **kwargs):
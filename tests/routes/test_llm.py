@@ -13,7 +13,7 @@ transport = ASGITransport(app=app)
 @pytest.mark.asyncio
 async def test_create_chat_response_success(monkeypatch):
     # Mock LLMResponseService's generate_llm_response to return a list
-    def fake_generate_llm_response(self, question):
+    async def fake_generate_llm_response(self, question):
         return ["fake context", "more fake content"]
 
     # Mock the method
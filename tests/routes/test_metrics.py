@@ -0,0 +1,54 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from fastapi import FastAPI
+from unittest.mock import MagicMock
+
+from app.routes.metrics import router
+
+app = FastAPI()
+app.include_router(router)
+
+transport = ASGITransport(app=app)
+
+
+@pytest.mark.asyncio
+async def test_get_metrics(monkeypatch):
+    vector_database = MagicMock()
+    vector_database.stats.return_value = {"query_cache": {"generation": 3}}
+    monkeypatch.setattr(
+        "app.routes.metrics.get_shared_vector_database", lambda: vector_database
+    )
+    monkeypatch.setattr(
+        "app.routes.metrics.get_boilerplate_stats", lambda: {"tokens_saved": 42}
+    )
+    monkeypatch.setattr(
+        "app.routes.metrics.get_event_loop_stats", lambda: {"samples": 5}
+    )
+    monkeypatch.setattr(
+        "app.routes.metrics.get_prompt_stats", lambda: {"last_tokens": 812}
+    )
+    monkeypatch.setattr(
+        "app.routes.metrics.get_conversation_memory_stats", lambda: {"hits": 2}
+    )
+    monkeypatch.setattr("app.routes.metrics.get_session_stats", lambda: {"size": 1})
+    monkeypatch.setattr(
+        "app.routes.metrics.get_answer_cache_stats", lambda: {"hit_rate": 0.5}
+    )
+    monkeypatch.setattr(
+        "app.routes.metrics.get_faq_fast_path_stats", lambda: {"hits": 3}
+    )
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "vector_database": {"query_cache": {"generation": 3}},
+        "boilerplate": {"tokens_saved": 42},
+        "event_loop": {"samples": 5},
+        "prompt": {"last_tokens": 812},
+        "conversation_memory": {"hits": 2},
+        "sessions": {"size": 1},
+        "answer_cache": {"hit_rate": 0.5},
+        "faq_fast_path": {"hits": 3},
+    }, "Should expose the metrics of every shared service"
@@ -0,0 +1,47 @@
+import time
+
+from app.services.answer_cache_service import AnswerCache
+
+CONTEXT = ("chunk-1", "chunk-2")
+
+
+def test_get_returns_answer_of_similar_question():
+    cache = AnswerCache(max_entries=10, threshold=0.9, ttl=0)
+    cache.set([1.0, 0.0, 0.0], CONTEXT, "", 0, ["Pesa ", "250 g"], 1.5)
+
+    assert cache.get([0.99, 0.1, 0.0], CONTEXT, "", 0) == ["Pesa ", "250 g"]
+    assert cache.get([0.0, 1.0, 0.0], CONTEXT, "", 0) is None, "Too different"
+    assert cache.get([1.0, 0.0, 0.0], ("chunk-3",), "", 0) is None, "Other context"
+    assert cache.get([1.0, 0.0, 0.0], CONTEXT, "history", 0) is None, "Other history"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["seconds_saved"] == 1.5
+
+
+def test_new_generation_invalidates_answers():
+    cache = AnswerCache(max_entries=10, threshold=0.9, ttl=0)
+    cache.set([1.0, 0.0], CONTEXT, "", 3, ["risposta"], 1.0)
+
+    assert cache.get([1.0, 0.0], CONTEXT, "", 4) is None
+    assert cache.stats()["invalidations"] == 1
+    cache.set([1.0, 0.0], CONTEXT, "", 3, ["vecchia"], 1.0)
+    assert cache.stats()["size"] == 0, "Should not store answers of an older generation"
+
+
+def test_evicts_least_recently_used_and_expired_answers():
+    cache = AnswerCache(max_entries=2, threshold=0.9, ttl=0)
+    cache.set([1.0, 0.0], ("a",), "", 0, ["a"], 1.0)
+    cache.set([1.0, 0.0], ("b",), "", 0, ["b"], 1.0)
+    cache.get([1.0, 0.0], ("a",), "", 0)
+    cache.set([1.0, 0.0], ("c",), "", 0, ["c"], 1.0)
+
+    assert cache.get([1.0, 0.0], ("b",), "", 0) is None
+    assert cache.get([1.0, 0.0], ("a",), "", 0) == ["a"]
+
+    expiring = AnswerCache(max_entries=2, threshold=0.9, ttl=0.01)
+    expiring.set([1.0, 0.0], ("a",), "", 0, ["a"], 1.0)
+    time.sleep(0.02)
+    assert expiring.get([1.0, 0.0], ("a",), "", 0) is None
+    assert expiring.stats()["size"] == 0
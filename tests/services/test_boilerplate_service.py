@@ -0,0 +1,154 @@
+import os
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+import app.services.boilerplate_service as boilerplate_service
+from app.config import settings
+from app.services.boilerplate_service import BoilerplateFilter
+
+MENU = "Formaggi Carni & Salumi Pesce Vegetali Cereali & Co Gastronomia Condimenti"
+FOOTER = "Iscriviti per ricevere i nostri aggiornamenti su nuovi prodotti ed eventi"
+
+PRODUCTS = {
+    "a.txt": "Pecorino stagionato in grotta per dodici mesi dal sapore intenso",
+    "b.txt": "Prosciutto crudo di montagna affumicato con legno di faggio",
+    "c.txt": "Alici del Cantabrico sotto sale lavorate a mano una ad una",
+}
+
+
+def make_filter(**kwargs) -> BoilerplateFilter:
+    boilerplate_filter = BoilerplateFilter(**kwargs)
+    for source, text in PRODUCTS.items():
+        boilerplate_filter.observe(source, [f"{MENU}\n{text} Peso: 1 kg\n{FOOTER}"])
+    return boilerplate_filter
+
+
+def test_strip_removes_phrases_shared_by_the_corpus():
+    boilerplate_filter = make_filter()
+
+    stripped = boilerplate_filter.strip(f"{MENU}\nMiele di acacia biologico\n{FOOTER}")
+
+    assert stripped == "Miele di acacia biologico", "Should keep only the product text"
+    stats = boilerplate_filter.stats()
+    assert stats["stripped_documents"] == 1
+    assert stats["bytes_saved"] == len(MENU) + len(FOOTER) + 2
+    assert stats["tokens_saved"] > 0, "Should count the embedding tokens saved"
+
+
+def test_strip_keeps_phrases_of_too_few_documents():
+    boilerplate_filter = make_filter(min_documents=4)
+
+    text = f"{MENU}\nMiele di acacia biologico"
+    assert boilerplate_filter.strip(text) == text, "Three documents are not enough"
+
+
+def test_strip_keeps_fields_and_partial_segments():
+    boilerplate_filter = make_filter()
+
+    text = f"Miele di acacia Peso: 1 kg\n{FOOTER} e promozioni"
+    assert (
+        boilerplate_filter.strip(text) == text
+    ), "Should not strip fields or segments that only contain boilerplate"
+    assert boilerplate_filter.strip(
+        f"{MENU} Miele di acacia Codice: 93001 Peso: 1 kg {FOOTER}"
+    ) == f"{MENU} Miele di acacia Codice: 93001 Peso: 1 kg {FOOTER}", (
+        "Should not cut inside a segment"
+    )
+
+
+def test_strip_removes_repeated_title():
+    text = (
+        "Formaggio Ubriaco al Moscato - Valsana Home Formaggio Ubriaco al Moscato "
+        "Il prodotto Formaggio Ubriaco al Moscato affinato nelle vinacce "
+        "Codice: 93001 Formaggio Ubriaco al Moscato"
+    )
+
+    assert BoilerplateFilter().strip(text) == text, "Titles are kept by default"
+    stripped = BoilerplateFilter(strip_repeated_title=True).strip(text)
+    assert stripped == (
+        "Formaggio Ubriaco al Moscato - Valsana Home Il prodotto affinato nelle vinacce "
+        "Codice: 93001 Formaggio Ubriaco al Moscato"
+    ), "Should keep the first occurrence of the title and the fields"
+
+
+def test_remove_source_updates_document_frequency():
+    boilerplate_filter = make_filter()
+    boilerplate_filter.remove_source("a.txt")
+
+    text = f"{MENU}\nMiele di acacia biologico"
+    assert (
+        boilerplate_filter.strip(text) == text
+    ), "Should no longer count the removed document"
+    assert boilerplate_filter.stats()["documents"] == 2
+
+
+def test_rename_source_keeps_document_frequency():
+    boilerplate_filter = make_filter()
+    boilerplate_filter.rename_source("a.txt", "d.txt")
+    boilerplate_filter.remove_source("a.txt")
+
+    assert boilerplate_filter.stats()["documents"] == 3, "Should keep the renamed document"
+    boilerplate_filter.remove_source("d.txt")
+    assert boilerplate_filter.stats()["documents"] == 2
+
+
+def test_drop_duplicates_uses_minhash_similarity():
+    boilerplate_filter = BoilerplateFilter()
+    description = (
+        "Il caseificio raccoglie il latte da piccoli allevatori locali "
+        "che portano le vacche al pascolo e stagiona le forme in grotte "
+        "naturali scavate nel tufo per almeno dodici mesi"
+    )
+
+    first = boilerplate_filter.drop_duplicates(
+        "a.txt", [Document(page_content=description)]
+    )
+    second = boilerplate_filter.drop_duplicates(
+        "b.txt",
+        [
+            Document(page_content=description + "."),
+            Document(page_content="Pecorino fresco a latte crudo di pecora"),
+            Document(page_content="Maggiori Informazioni"),
+        ],
+    )
+
+    assert len(first) == 1
+    assert [c.page_content for c in second] == [
+        "Pecorino fresco a latte crudo di pecora"
+    ], "Should drop the near duplicate and the almost empty chunk"
+    stats = boilerplate_filter.stats()
+    assert stats["duplicate_chunks_dropped"] == 1
+    assert stats["empty_chunks_dropped"] == 1
+    assert stats["indexed_chunks"] == 2
+
+
+def test_get_boilerplate_filter_uses_stored_documents(tmp_path, monkeypatch):
+    for source, text in PRODUCTS.items():
+        (tmp_path / source).write_text(f"{MENU}\n{text}\n{FOOTER}", encoding="utf-8")
+    (tmp_path / "catalogo.pdf").write_bytes(b"%PDF-1.4")
+    stored_text = "Burrata pugliese con panna fresca, da consumare entro cinque giorni"
+    vector_database = MagicMock()
+    vector_database.get_all_documents.return_value = {
+        "ids": ["1"],
+        "documents": [stored_text],
+        "metadatas": [{"source": "d.txt"}],
+    }
+    monkeypatch.setenv("DOCUMENTS_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(settings, "NEAR_DUPLICATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(boilerplate_service, "_boilerplate_filter", None)
+    monkeypatch.setattr(
+        boilerplate_service, "get_shared_vector_database", lambda: vector_database
+    )
+
+    assert boilerplate_service.get_boilerplate_stats() == {}, "Should not build it"
+    boilerplate_filter = boilerplate_service.get_boilerplate_filter()
+
+    assert boilerplate_service.get_boilerplate_filter() is boilerplate_filter
+    assert boilerplate_filter.stats()["documents"] == 3, "Should read the text files"
+    assert boilerplate_filter.strip(f"{MENU}\nBurrata") == "Burrata"
+    assert (
+        boilerplate_filter.drop_duplicates("e.txt", [Document(page_content=stored_text)])
+        == []
+    ), "Should know the chunks already in the vector database"
@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import patch
+
+from app.services.cache_service import LRUCache, QueryCache
+
+
+def test_lru_cache_get_set():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1, "Should return the stored value"
+    assert cache.get("b") is None, "Should return None for missing keys"
+    assert cache.get("b", "default") == "default", "Should return the default for missing keys"
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2, "Should count hits and misses"
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None, "Least recently used entry should be evicted"
+    assert cache.get("a") == 1 and cache.get("c") == 3, "Recent entries should be kept"
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(max_size=2, ttl=10)
+    with patch("app.services.cache_service.time.monotonic", return_value=100):
+        cache.set("a", 1)
+    with patch("app.services.cache_service.time.monotonic", return_value=105):
+        assert cache.get("a") == 1, "Entry should be valid before the TTL"
+    with patch("app.services.cache_service.time.monotonic", return_value=111):
+        assert cache.get("a") is None, "Entry should expire after the TTL"
+    assert len(cache) == 0, "Expired entries should be removed"
+
+
+def test_lru_cache_disabled_with_zero_size():
+    cache = LRUCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None, "A zero-sized cache should store nothing"
+
+
+def test_query_cache_normalizes_queries():
+    cache = QueryCache(max_size=10)
+    cache.set_embedding("Quanto pesa la composta di fragole?", [0.1, 0.2])
+    assert cache.get_embedding("quanto  pesa la Composta di fragole") == [
+        0.1,
+        0.2,
+    ], "Case, whitespace and final punctuation should not matter"
+
+
+def test_query_cache_results_invalidated_by_writes():
+    cache = QueryCache(max_size=10)
+    generation = cache.generation
+    cache.set_results("domanda", 4, generation, ["doc1", "doc2"])
+    assert cache.get_results("domanda", 4) == ["doc1", "doc2"]
+    assert cache.get_results("domanda", 2) is None, "Results should depend on k"
+
+    cache.set_embedding("domanda", [1.0])
+    cache.invalidate()
+    assert cache.get_results("domanda", 4) is None, "Writes should invalidate results"
+    assert cache.get_embedding("domanda") == [1.0], "Query embeddings survive writes"
+
+
+def test_query_cache_ignores_results_from_older_generation():
+    cache = QueryCache(max_size=10)
+    generation = cache.generation
+    cache.invalidate()
+    cache.set_results("domanda", 4, generation, ["stale"])
+    assert cache.get_results("domanda", 4) is None, "Stale results should not be stored"
@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import MagicMock
+
+from langchain_core.messages import AIMessage
+
+from app.schemas import Message
+from app.services.conversation_memory_service import ConversationMemory, prefix_hashes
+
+
+def make_messages(count: int) -> list[Message]:
+    return [
+        Message(sender="user" if i % 2 == 0 else "bot", content=f"messaggio {i}")
+        for i in range(count)
+    ]
+
+
+def make_memory(**kwargs) -> tuple[ConversationMemory, list]:
+    prompts = []
+
+    async def mock_ainvoke(prompt):
+        prompts.append(prompt)
+        return AIMessage(content=f"riassunto {len(prompts)}")
+
+    llm = MagicMock()
+    llm._model.ainvoke = mock_ainvoke
+    kwargs.setdefault("min_new_messages", 1)
+    return ConversationMemory(llm=llm, **kwargs), prompts
+
+
+def test_prefix_hashes_identify_prefixes():
+    messages = make_messages(3)
+
+    hashes = prefix_hashes(messages)
+
+    assert hashes[:2] == prefix_hashes(messages[:2]), "Prefixes should share hashes"
+    assert hashes[1] != prefix_hashes(make_messages(3)[::-1])[1]
+    assert len(set(hashes)) == 3
+
+
+@pytest.mark.asyncio
+async def test_compact_keeps_short_conversations():
+    memory, prompts = make_memory(recent_messages=4)
+    messages = make_messages(4)
+
+    assert memory.compact(messages) == ("", messages)
+    assert prompts == [], "Should not summarize short conversations"
+
+
+@pytest.mark.asyncio
+async def test_compact_summarizes_in_background_and_reuses_summary():
+    memory, prompts = make_memory(recent_messages=2)
+    messages = make_messages(6)
+
+    summary, history = memory.compact(messages)
+    assert summary == "" and history == messages, "Should not wait for the summary"
+    await memory.wait_pending()
+    assert len(prompts) == 1
+    assert "messaggio 3" in prompts[0][1].content
+    assert "messaggio 4" not in prompts[0][1].content
+
+    summary, history = memory.compact(messages)
+    assert summary == "riassunto 1"
+    assert history == messages[4:], "Should send only the recent messages"
+    assert len(prompts) == 1, "Should reuse the cached summary"
+    assert memory.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_extends_the_longest_cached_summary():
+    memory, prompts = make_memory(recent_messages=2)
+    messages = make_messages(8)
+    memory.compact(messages[:6])
+    await memory.wait_pending()
+
+    summary, history = memory.compact(messages)
+    assert summary == "riassunto 1", "Should use the previous summary meanwhile"
+    assert history == messages[4:]
+    await memory.wait_pending()
+
+    new_messages = prompts[1][1].content
+    assert "riassunto 1" in new_messages
+    assert "messaggio 3" not in new_messages, "Should summarize only the new messages"
+    assert "messaggio 5" in new_messages
+    assert memory.compact(messages) == ("riassunto 2", messages[6:])
+    assert memory.stats()["partial_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_survives_summary_errors():
+    memory, _ = make_memory(recent_messages=2)
+
+    async def failing_ainvoke(prompt):
+        raise RuntimeError("boom")
+
+    memory._llm._model.ainvoke = failing_ainvoke
+    messages = make_messages(5)
+    memory.compact(messages)
+    await memory.wait_pending()
+
+    assert memory.compact(messages) == ("", messages)
+    assert memory.stats()["summary_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_waits_for_enough_new_messages():
+    memory, prompts = make_memory(recent_messages=2, min_new_messages=4)
+    messages = make_messages(12)
+
+    assert memory.compact(messages[:5]) == ("", messages[:5]), "Too few to summarize"
+    memory.compact(messages[:6])
+    await memory.wait_pending()
+    assert len(prompts) == 1
+
+    for count in (7, 8, 9):
+        summary, history = memory.compact(messages[:count])
+        assert summary == "riassunto 1" and history == messages[4:count]
+    await memory.wait_pending()
+    assert len(prompts) == 1, "Should not call the model on every turn"
+    assert memory.stats()["deferred"] == 4
+
+    memory.compact(messages[:10])
+    await memory.wait_pending()
+    assert len(prompts) == 2
+    assert "riassunto 1" in prompts[1][1].content
+    assert "messaggio 3" not in prompts[1][1].content, "Should extend the summary"
+    assert memory.compact(messages[:10]) == ("riassunto 2", messages[8:10])
@@ -0,0 +1,98 @@
+import pytest
+from httpx import ASGITransport
+from unittest.mock import MagicMock
+from fastapi import HTTPException
+
+from app.services.database_api_service import (
+    DatabaseAPIClient,
+    get_database_api_client,
+    close_database_api_client,
+)
+from app.services.file_manager_service import StringManager
+from app.stubs import database_api
+import app.schemas as schemas
+
+
+@pytest.fixture
+def stub_client():
+    database_api.reset()
+    client = DatabaseAPIClient(
+        base_url="http://database-api",
+        transport=ASGITransport(app=database_api.app),
+    )
+    yield client
+    database_api.reset()
+
+
+@pytest.mark.asyncio
+async def test_database_api_client_reuses_connection_pool(stub_client):
+    first = stub_client._get_client()
+    second = stub_client._get_client()
+    assert first is second, "Should reuse the same pooled httpx client"
+    await stub_client.aclose()
+    assert stub_client._client is None, "Should drop the client after closing"
+
+
+@pytest.mark.asyncio
+async def test_database_api_client_sends_bearer_token(stub_client):
+    response = await stub_client.post(
+        "/documents",
+        token="test_token",
+        json={"file_path": "/data/documents/a.txt", "title": "a.txt"},
+    )
+    assert response.status_code == 201, "Stub should accept an authenticated upload"
+
+    response = await stub_client.post(
+        "/documents", json={"file_path": "/data/documents/b.txt", "title": "b.txt"}
+    )
+    assert response.status_code == 401, "Stub should reject requests without token"
+    await stub_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_database_api_stub_verifies_token(stub_client):
+    response = await stub_client.get("/auth/verify", token="test_token")
+    assert response.status_code == 200, "Stub should accept a bearer token"
+    response = await stub_client.get("/auth/verify")
+    assert response.status_code == 401, "Stub should reject requests without token"
+    await stub_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_get_database_api_client_is_shared(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.database_api_service._database_api_client", None
+    )
+    client = get_database_api_client()
+    assert client is get_database_api_client(), "Should return the shared client"
+    await close_database_api_client()
+    assert get_database_api_client() is not client, "Should build a new client after closing"
+
+
+@pytest.mark.asyncio
+async def test_string_manager_faq_lifecycle_against_stub(stub_client, monkeypatch):
+    manager = StringManager()
+    monkeypatch.setattr(manager, "_database_api", stub_client)
+    monkeypatch.setattr(manager, "_vector_database", MagicMock())
+
+    faq = await manager.add_faq(
+        schemas.FAQBase(title="Spedizione", question="Spedite?", answer="Sì"),
+        "test_token",
+    )
+    assert faq.id, "Should receive the FAQ id from the database API"
+    manager._vector_database.add_documents.assert_called_once()
+
+    faq.answer = "Sì, in tutta Italia"
+    await manager.update_faq(faq, "test_token")
+    manager._vector_database.delete_faq.assert_called_with(faq.id)
+
+    await manager.delete_faq(
+        schemas.FAQDelete(id=faq.id, admin_password="pwd"), "test_token"
+    )
+
+    with pytest.raises(HTTPException) as exc_info:
+        await manager.delete_faq(
+            schemas.FAQDelete(id=faq.id, admin_password="pwd"), "test_token"
+        )
+    assert exc_info.value.status_code == 400, "Deleting twice should report FAQ not found"
+    await stub_client.aclose()
@@ -1,9 +1,17 @@
 import pytest
+import threading
 
 from app.services.embeddings_service import (
     OpenAIEmbeddingProvider,
+    BatchingEmbeddings,
+    BatchingEmbeddingProvider,
+    CachedEmbeddings,
+    CachedEmbeddingProvider,
+    HashingEmbeddings,
+    HashingEmbeddingProvider,
     get_embedding_provider,
 )
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 
 
@@ -43,6 +51,12 @@ def test_get_embeddings_provider(monkeypatch):
     monkeypatch.setattr(
         "app.services.embeddings_service.settings.LLM_PROVIDER", "openai"
     )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", False
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_BATCH_ENABLED", False
+    )
 
     embedding_provider = get_embedding_provider()
     assert isinstance(
@@ -58,3 +72,225 @@ def test_get_embedding_provider_invalid(monkeypatch):
 
     with pytest.raises(ValueError):
         get_embedding_provider()
+
+
+@pytest.mark.asyncio
+async def test_openai_embedding_provider_aclose(monkeypatch):
+    embedding_provider = OpenAIEmbeddingProvider()
+    embedding_function = embedding_provider.get_embedding_function()
+
+    await embedding_provider.aclose()
+
+    assert embedding_function.client._client.is_closed(), "Should close the sync client"
+    assert embedding_provider._embedding_function is None, "Should drop the embedding function"
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.5]
+
+
+def test_cached_embeddings_skips_known_texts(tmp_path):
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "model", str(tmp_path / "cache.sqlite3"))
+
+    first = cache.embed_documents(["uno", "due", "uno"])
+    second = cache.embed_documents(["due", "tre"])
+
+    assert inner.embedded == ["uno", "due", "tre"], "Should embed each distinct text once"
+    assert first == [[3.0, 1.0, 0.5], [3.0, 1.0, 0.5], [3.0, 1.0, 0.5]]
+    assert second[1] == [3.0, 1.0, 0.5], "Should return vectors in input order"
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3, "Should count hits and misses"
+    assert stats["entries"] == 3, "Should store one entry per distinct text"
+    cache.close()
+
+
+def test_cached_embeddings_persists_on_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = CachedEmbeddings(CountingEmbeddings(), "model", path)
+    cache.embed_documents(["composta di fragole"])
+    cache.close()
+
+    inner = CountingEmbeddings()
+    reopened = CachedEmbeddings(inner, "model", path)
+    reopened.embed_documents(["composta di fragole"])
+    assert inner.embedded == [], "Should reuse vectors stored by a previous process"
+
+    other_model = CachedEmbeddings(inner, "other-model", path)
+    other_model.embed_documents(["composta di fragole"])
+    assert inner.embedded == ["composta di fragole"], "Cache keys should include the model name"
+    reopened.close()
+    other_model.close()
+
+
+def test_cached_embeddings_evicts_least_recently_used(tmp_path):
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "model", str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+    cache.embed_documents(["a"])
+    cache.embed_documents(["b"])
+    cache.embed_documents(["a"])
+    cache.embed_documents(["c"])
+
+    assert cache.stats()["entries"] == 2, "Should keep at most max_entries vectors"
+    cache.embed_documents(["a"])
+    assert inner.embedded == ["a", "b", "c"], "Recently used entries should survive eviction"
+    cache.embed_documents(["b"])
+    assert inner.embedded[-1] == "b", "Least recently used entry should have been evicted"
+    cache.close()
+
+
+def test_get_embedding_provider_with_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.LLM_PROVIDER", "openai"
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", True
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_PATH", ""
+    )
+
+    embedding_provider = get_embedding_provider(cache_directory=str(tmp_path))
+    assert isinstance(
+        embedding_provider, CachedEmbeddingProvider
+    ), "Should wrap the provider with the persistent cache"
+    embedding_function = embedding_provider.get_embedding_function()
+    assert isinstance(embedding_function, CachedEmbeddings)
+    assert (tmp_path / "embedding_cache.sqlite3").exists(), "Should store the cache next to the vector store"
+
+
+def test_batching_embeddings_groups_concurrent_requests():
+    class RecordingEmbeddings(CountingEmbeddings):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def embed_documents(self, texts):
+            self.batches.append(len(texts))
+            return super().embed_documents(texts)
+
+    inner = RecordingEmbeddings()
+    batching = BatchingEmbeddings(inner, batch_size=8, max_wait=1.0)
+    results = {}
+    barrier = threading.Barrier(4)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batching.embed_documents([f"file {i}"] * (i + 1))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(inner.batches) == 10, "Every text should be embedded"
+    assert len(inner.batches) < 4, "Concurrent requests should share batches"
+    assert max(inner.batches) <= 8, "Batches should not exceed batch_size"
+    for i in range(4):
+        assert results[i] == [[6.0, 1.0, 0.5]] * (i + 1), "Each caller gets its own vectors"
+
+
+def test_batching_embeddings_propagates_errors():
+    class FailingEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("rate limit")
+
+    batching = BatchingEmbeddings(FailingEmbeddings(), batch_size=8, max_wait=0)
+    with pytest.raises(RuntimeError):
+        batching.embed_documents(["uno"])
+    assert batching.embed_documents([]) == []
+
+
+def test_get_embedding_provider_with_batching(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", False
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_BATCH_ENABLED", True
+    )
+    embedding_provider = get_embedding_provider()
+    assert isinstance(embedding_provider, BatchingEmbeddingProvider)
+    assert isinstance(embedding_provider.get_embedding_function(), BatchingEmbeddings)
+
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized():
+    embeddings = HashingEmbeddings(dimensions=64)
+
+    vector = embeddings.embed_query("Formaggio stagionato in grotta")
+
+    assert len(vector) == 64, "Should use the configured dimensions"
+    assert vector == HashingEmbeddings(dimensions=64).embed_documents(
+        ["Formaggio stagionato in grotta"]
+    )[0], "Should not depend on the instance or the method"
+    assert sum(v * v for v in vector) == pytest.approx(1.0)
+    assert embeddings.embed_query("il e di") == [0.0] * 64, "Stopwords only"
+
+
+def test_hashing_embeddings_rank_similar_texts_higher():
+    embeddings = HashingEmbeddings()
+    query = embeddings.embed_query("Quanto pesa il pecorino stagionato?")
+    related, unrelated = embeddings.embed_documents(
+        [
+            "Pecorino stagionato 12 mesi. Peso: 13 kg circa",
+            "Alici del Cantabrico sotto sale",
+        ]
+    )
+
+    def dot(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    assert dot(query, related) > dot(query, unrelated)
+
+
+def test_get_embedding_provider_hashing(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.LLM_PROVIDER", "openai"
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_PROVIDER", "hashing"
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_BATCH_ENABLED", False
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", False
+    )
+
+    embedding_provider = get_embedding_provider()
+    assert isinstance(
+        embedding_provider, HashingEmbeddingProvider
+    ), "EMBEDDING_PROVIDER should take precedence over LLM_PROVIDER"
+
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", True
+    )
+    cached_provider = get_embedding_provider(cache_directory=str(tmp_path))
+    assert (
+        cached_provider._model_name == "hashing-512"
+    ), "Should not share cached vectors with the OpenAI model"
+
+
+def test_get_embedding_provider_fake_llm_uses_hashing(monkeypatch):
+    monkeypatch.setattr("app.services.embeddings_service.settings.LLM_PROVIDER", "fake")
+    monkeypatch.setattr("app.services.embeddings_service.settings.EMBEDDING_PROVIDER", "")
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_BATCH_ENABLED", False
+    )
+    monkeypatch.setattr(
+        "app.services.embeddings_service.settings.EMBEDDING_CACHE_ENABLED", False
+    )
+
+    assert isinstance(
+        get_embedding_provider(), HashingEmbeddingProvider
+    ), "The fake LLM provider should not need OpenAI embeddings"
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.event_loop_monitor_service import EventLoopMonitor
+
+
+def test_record_fills_cumulative_histogram():
+    monitor = EventLoopMonitor(interval_ms=100)
+
+    for lag in (0.5, 3, 30, 2000):
+        monitor.record(lag)
+
+    stats = monitor.stats()
+    assert stats["samples"] == 4
+    assert stats["max_lag_ms"] == 2000
+    assert stats["buckets"]["1"] == 1
+    assert stats["buckets"]["5"] == 1
+    assert stats["buckets"]["50"] == 1
+    assert stats["buckets"]["inf"] == 1, "Should count lags over the last bound"
+
+
+@pytest.mark.asyncio
+async def test_monitor_measures_blocking_code():
+    monitor = EventLoopMonitor(interval_ms=10)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    time.sleep(0.1)  # blocca l'event loop
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["samples"] >= 2
+    assert stats["max_lag_ms"] >= 50, "Should notice the blocked event loop"
+
+
+@pytest.mark.asyncio
+async def test_monitor_disabled_with_zero_interval():
+    monitor = EventLoopMonitor(interval_ms=0)
+    monitor.start()
+    await monitor.stop()
+    assert monitor.stats()["samples"] == 0
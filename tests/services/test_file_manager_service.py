@@ -4,15 +4,48 @@ from app.services.file_manager_service import (
     get_file_manager_by_extension,
     TextFileManager,
     PdfFileManager,
+    close_pdf_executor,
 )
+import app.services.file_manager_service as file_manager_service
+from app.config import settings
+from app.services.ingest_manifest_service import IngestManifest
+from app.services.boilerplate_service import BoilerplateFilter
 from fastapi import Depends, File, UploadFile
 from io import BytesIO
 from unittest.mock import MagicMock, patch
 import os
 import asyncio
 from fastapi import HTTPException
-import requests
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_core.documents import Document
+
+
+@pytest.fixture(autouse=True)
+def ingest_manifest(tmp_path, monkeypatch):
+    manifest = IngestManifest(str(tmp_path / "ingest_manifest.sqlite3"))
+    monkeypatch.setattr(
+        "app.services.file_manager_service.get_ingest_manifest", lambda: manifest
+    )
+    yield manifest
+    manifest.close()
+
+
+@pytest.fixture(autouse=True)
+def disable_boilerplate_filter(monkeypatch):
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", False)
+    monkeypatch.setattr(settings, "NEAR_DUPLICATE_FILTER_ENABLED", False)
+
+
+@pytest.fixture
+def boilerplate_filter(monkeypatch):
+    boilerplate_filter = BoilerplateFilter(min_documents=2)
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(settings, "NEAR_DUPLICATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(
+        "app.services.file_manager_service.get_boilerplate_filter",
+        lambda: boilerplate_filter,
+    )
+    return boilerplate_filter
 
 
 @pytest.fixture(autouse=True)
@@ -37,7 +70,7 @@ def test_txt_file_manager_get_full_path(documents_dir, monkeypatch):
     ), "Should return the correct full path for the .txt file"
 
 
-def test_txt_file_manager_save_file(monkeypatch):
+def test_txt_file_manager_save_file(monkeypatch, tmp_path):
     MyTxtFileManager = TextFileManager()
     file_name = "test.txt"
     file_content = b"Test content"
@@ -47,12 +80,12 @@ def test_txt_file_manager_save_file(monkeypatch):
     file.filename = file_name
 
     # Assign mocked methods
-    file.read.return_value = file_content
+    file.read.side_effect = [file_content, b""]
     file.seek.return_value = MagicMock(side_effect=None)  # Mock seek method
 
     # Mock _get_full_path method
     monkeypatch.setattr(
-        MyTxtFileManager, "get_full_path", lambda x: os.path.join(".cache", x)
+        MyTxtFileManager, "get_full_path", lambda x: os.path.join(tmp_path, x)
     )
 
     # pass   with open(file_path, "wb") as f:
@@ -61,17 +94,59 @@ def test_txt_file_manager_save_file(monkeypatch):
         file_path = asyncio.run(MyTxtFileManager._save_file(file))
 
     # Check if the path is correct
-    expected_path = os.path.join(".cache", "test.txt")
+    expected_path = os.path.join(tmp_path, "test.txt")
     assert (
         file_path == expected_path
     ), "Should return the correct full path for the saved .txt file"
 
 
 @pytest.mark.asyncio
-async def test_text_file_manager_load_split_file():
+async def test_save_file_streams_in_chunks(documents_dir, monkeypatch):
+    import hashlib
+
+    monkeypatch.setattr("app.services.file_manager_service.settings.UPLOAD_CHUNK_SIZE", 4)
+    MyTxtFileManager = TextFileManager()
+    content = b"Composta di pesche Codice: 93002"
+    file = UploadFile(filename="93002.txt", file=BytesIO(content))
+    reads = []
+    original_read = file.read
+
+    async def read(size=-1):
+        reads.append(size)
+        return await original_read(size)
+
+    monkeypatch.setattr(file, "read", read)
+
+    file_path, sha256 = await MyTxtFileManager._save_file_with_hash(file)
+
+    assert file_path == os.path.join(documents_dir, "93002.txt")
+    with open(file_path, "rb") as f:
+        assert f.read() == content, "Should write the whole file"
+    assert sha256 == hashlib.sha256(content).hexdigest(), "Should hash the content"
+    assert set(reads) == {4}, "Should read fixed-size chunks only"
+    assert os.listdir(documents_dir) == ["93002.txt"], "Should not leave temp files"
+
+
+@pytest.mark.asyncio
+async def test_save_file_failure_removes_temp_file(documents_dir, monkeypatch):
+    MyTxtFileManager = TextFileManager()
+    file = UploadFile(filename="test.txt", file=BytesIO(b"Test content"))
+
+    async def failing_read(size=-1):
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(file, "read", failing_read)
+
+    with pytest.raises(OSError):
+        await MyTxtFileManager._save_file(file)
+    assert os.listdir(documents_dir) == [], "Partial uploads should not be kept"
+
+
+@pytest.mark.asyncio
+async def test_text_file_manager_load_split_file(tmp_path):
     MyTxtFileManager = TextFileManager()
     file_name = "test.txt"
-    file_path = os.path.join(".cache", file_name)
+    file_path = os.path.join(tmp_path, file_name)
 
     # Mock the file content
     mock_file_content = "This is a test content for the text file."
@@ -86,6 +161,21 @@ async def test_text_file_manager_load_split_file():
     assert len(result) > 0, "Should return a non-empty list of documents"
 
 
+@pytest.mark.asyncio
+async def test_text_file_manager_load_split_file_product_codes(documents_dir):
+    MyTxtFileManager = TextFileManager()
+    file_path = os.path.join(documents_dir, "93002.txt")
+    with open(file_path, "w") as f:
+        f.write("Composta di pesche Codice: 93002 " + "Ingredienti pesche " * 50)
+
+    result = await MyTxtFileManager._load_split_file(file_path)
+
+    assert len(result) > 1, "Should split the file in several chunks"
+    assert all(
+        chunk.metadata["product_codes"] == "93002" for chunk in result
+    ), "Every chunk should carry the product code of the file"
+
+
 @pytest.mark.asyncio
 async def test_text_file_manager_add_document(monkeypatch):
     # Create an instance of TextFileManager
@@ -93,18 +183,18 @@ async def test_text_file_manager_add_document(monkeypatch):
 
     # Create mock implementations for _save_file and _load_split_file
     async def mock_save_file(file):
-        return "/mock/path/to/test.txt"
+        return "/mock/path/to/test.txt", None
 
     async def mock_load_split_file(file_path):
         return ["chunk1", "chunk2", "chunk3"]
 
-    monkeypatch.setattr(MyTxtFileManager, "_save_file", mock_save_file)
+    monkeypatch.setattr(MyTxtFileManager, "_save_new_file", mock_save_file)
     monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
 
     # CORRECTED: Mock the _vector_database attribute
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
-    with patch("requests.post") as mock_post:
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
         mock_post.return_value = MagicMock(status_code=201)
 
         file = MagicMock(spec=UploadFile)
@@ -119,6 +209,230 @@ async def test_text_file_manager_add_document(monkeypatch):
         )
 
 
+@pytest.mark.asyncio
+async def test_add_document_skips_already_indexed_content(
+    documents_dir, ingest_manifest, monkeypatch
+):
+    from langchain_core.documents import Document
+
+    MyTxtFileManager = TextFileManager()
+    load_split_file = MagicMock(return_value=[Document(page_content="Codice: 93002")])
+
+    async def mock_load_split_file(file_path):
+        return load_split_file(file_path)
+
+    monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    MyTxtFileManager._vector_database.get_existing_ids.side_effect = lambda ids: set(ids)
+
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
+        mock_post.return_value = MagicMock(status_code=201)
+        first = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002"))
+        assert await MyTxtFileManager.add_document(first, "test_token") is True
+
+        copy = UploadFile(filename="b.txt", file=BytesIO(b"Codice: 93002"))
+        with pytest.raises(HTTPException) as exc_info:
+            await MyTxtFileManager.add_document(copy, "test_token")
+
+    assert exc_info.value.status_code == 409
+    assert "già indicizzato: a.txt" in exc_info.value.detail
+    load_split_file.assert_called_once()
+    assert mock_post.call_count == 1
+    assert os.listdir(documents_dir) == ["a.txt"], "Should not keep the duplicate file"
+    assert ingest_manifest.claim(
+        ingest_manifest.get_by_source(os.path.join(documents_dir, "a.txt"))["hash"]
+    ), "Should release the in-progress mark"
+
+
+@pytest.mark.asyncio
+async def test_add_document_duplicate_keeps_file_with_same_name(
+    documents_dir, ingest_manifest, monkeypatch
+):
+    MyTxtFileManager = TextFileManager()
+
+    async def mock_load_split_file(file_path):
+        with open(file_path) as f:
+            return [Document(page_content=f.read())]
+
+    monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    MyTxtFileManager._vector_database.get_existing_ids.side_effect = lambda ids: set(ids)
+
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
+        mock_post.return_value = MagicMock(status_code=201)
+        for name, content in (("a.txt", b"Codice: 93002"), ("b.txt", b"Codice: 93003")):
+            file = UploadFile(filename=name, file=BytesIO(content))
+            assert await MyTxtFileManager.add_document(file, "test_token") is True
+
+        copy = UploadFile(filename="b.txt", file=BytesIO(b"Codice: 93002"))
+        with pytest.raises(HTTPException) as exc_info:
+            await MyTxtFileManager.add_document(copy, "test_token")
+
+    assert exc_info.value.status_code == 409
+    assert sorted(os.listdir(documents_dir)) == ["a.txt", "b.txt"]
+    with open(os.path.join(documents_dir, "b.txt"), "rb") as f:
+        assert f.read() == b"Codice: 93003", "Should keep the indexed b.txt on disk"
+
+
+@pytest.mark.asyncio
+async def test_add_document_ignores_stale_manifest_entries(
+    documents_dir, ingest_manifest, monkeypatch
+):
+    import hashlib
+    from langchain_core.documents import Document
+
+    MyTxtFileManager = TextFileManager()
+    content = b"Codice: 93002"
+    ingest_manifest.add(
+        hashlib.sha256(content).hexdigest(), "/old/a.txt", ["missing-chunk"]
+    )
+
+    async def mock_load_split_file(file_path):
+        return [Document(page_content="Codice: 93002")]
+
+    monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    MyTxtFileManager._vector_database.get_existing_ids.return_value = set()
+
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
+        mock_post.return_value = MagicMock(status_code=201)
+        file = UploadFile(filename="a.txt", file=BytesIO(content))
+        assert await MyTxtFileManager.add_document(file, "test_token") is True
+
+    entry = ingest_manifest.get(hashlib.sha256(content).hexdigest())
+    assert entry["source"] == os.path.join(documents_dir, "a.txt"), "Should re-index"
+
+
+@pytest.fixture
+def valid_token(monkeypatch):
+    async def mock_get(self, path, token=None):
+        return MagicMock(status_code=200)
+
+    monkeypatch.setattr(
+        "app.services.database_api_service.DatabaseAPIClient.get", mock_get
+    )
+
+
+@pytest.mark.asyncio
+async def test_replace_document_rejects_invalid_token(documents_dir, monkeypatch):
+    MyTxtFileManager = TextFileManager()
+    file_path = os.path.join(documents_dir, "a.txt")
+    with open(file_path, "w") as f:
+        f.write("Codice: 93002")
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+
+    with patch.object(MyTxtFileManager._database_api, "get") as mock_get:
+        mock_get.return_value = MagicMock(status_code=401)
+        file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002 v2"))
+        with pytest.raises(HTTPException) as exc_info:
+            await MyTxtFileManager.replace_document(file, "bad_token")
+
+    assert exc_info.value.status_code == 401
+    mock_get.assert_called_once_with("/auth/verify", token="bad_token")
+    MyTxtFileManager._vector_database.replace_document.assert_not_called()
+    with open(file_path) as f:
+        assert f.read() == "Codice: 93002", "Should not touch the document"
+    assert os.listdir(documents_dir) == ["a.txt"]
+
+
+@pytest.mark.asyncio
+async def test_replace_document(
+    documents_dir, ingest_manifest, valid_token, monkeypatch
+):
+    from langchain_core.documents import Document
+
+    MyTxtFileManager = TextFileManager()
+    with open(os.path.join(documents_dir, "a.txt"), "w") as f:
+        f.write("Codice: 93002")
+
+    async def mock_load_split_file(file_path):
+        return [Document(page_content="Codice: 93002 v2")]
+
+    monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    stats = {"added": 1, "removed": 1, "unchanged": 0, "embeddings_saved": 0}
+    MyTxtFileManager._vector_database.replace_document.return_value = stats
+
+    file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002 v2"))
+    assert await MyTxtFileManager.replace_document(file, "test_token") == stats
+    MyTxtFileManager._vector_database.replace_document.assert_called_once()
+
+    file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002 v2"))
+    result = await MyTxtFileManager.replace_document(file, "test_token")
+    assert result["embeddings_saved"] == 1, "Identical content should not be re-indexed"
+    assert MyTxtFileManager._vector_database.replace_document.call_count == 1
+
+    missing = UploadFile(filename="missing.txt", file=BytesIO(b"x"))
+    with pytest.raises(HTTPException) as exc_info:
+        await MyTxtFileManager.replace_document(missing, "test_token")
+    assert exc_info.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_replace_document_indexes_new_version_before_saving_it(
+    documents_dir, valid_token, monkeypatch
+):
+    MyTxtFileManager = TextFileManager()
+    file_path = os.path.join(documents_dir, "a.txt")
+    with open(file_path, "w") as f:
+        f.write("Codice: 93002")
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    MyTxtFileManager._vector_database.replace_document.return_value = {
+        "added": 1,
+        "removed": 1,
+        "unchanged": 0,
+        "embeddings_saved": 0,
+    }
+
+    file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002 v2"))
+    await MyTxtFileManager.replace_document(file, "test_token")
+
+    source, chunks = MyTxtFileManager._vector_database.replace_document.call_args[0]
+    assert source == file_path
+    assert [c.metadata["source"] for c in chunks] == [file_path], "Chunks should point to the document"
+    with open(file_path) as f:
+        assert f.read() == "Codice: 93002 v2", "Should save the new version"
+    assert os.listdir(documents_dir) == ["a.txt"], "Should not leave temp files"
+
+
+@pytest.mark.asyncio
+async def test_replace_document_keeps_old_version_on_failure(
+    documents_dir, ingest_manifest, valid_token, monkeypatch
+):
+    import hashlib
+
+    MyTxtFileManager = TextFileManager()
+    a_path = os.path.join(documents_dir, "a.txt")
+    with open(a_path, "w") as f:
+        f.write("Codice: 93002")
+    monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
+    MyTxtFileManager._vector_database.get_existing_ids.return_value = {"chunk"}
+    ingest_manifest.add(
+        hashlib.sha256(b"Codice: 93003").hexdigest(),
+        os.path.join(documents_dir, "b.txt"),
+        ["chunk"],
+    )
+
+    # contenuto già indicizzato come un altro documento
+    file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93003"))
+    with pytest.raises(HTTPException) as exc_info:
+        await MyTxtFileManager.replace_document(file, "test_token")
+    assert exc_info.value.status_code == 409
+
+    # errore durante l'indicizzazione
+    MyTxtFileManager._vector_database.replace_document.side_effect = Exception("boom")
+    file = UploadFile(filename="a.txt", file=BytesIO(b"Codice: 93002 v2"))
+    with pytest.raises(Exception):
+        await MyTxtFileManager.replace_document(file, "test_token")
+
+    with open(a_path) as f:
+        assert f.read() == "Codice: 93002", "The indexed version should stay on disk"
+    assert os.listdir(documents_dir) == ["a.txt"], "Should not leave temp files"
+    assert ingest_manifest.claim(
+        hashlib.sha256(b"Codice: 93002 v2").hexdigest()
+    ), "Should release the in-progress mark"
+
+
 @pytest.mark.asyncio
 async def test_text_file_manager_add_document_error_400(monkeypatch):
     # Create an instance of TextFileManager
@@ -126,20 +440,20 @@ async def test_text_file_manager_add_document_error_400(monkeypatch):
 
     # Create mock implementations for _save_file and _load_split_file
     async def mock_save_file(file):
-        return "/mock/path/to/test.txt"  # Return a mock file path
+        return "/mock/path/to/test.txt", None  # Return a mock file path
 
     async def mock_load_split_file(file_path):
         return ["chunk1", "chunk2", "chunk3"]  # Mock the chunks from file splitting
 
     # Use monkeypatch to replace the methods with the mock implementations
-    monkeypatch.setattr(MyTxtFileManager, "_save_file", mock_save_file)
+    monkeypatch.setattr(MyTxtFileManager, "_save_new_file", mock_save_file)
     monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
 
     # Mock _vector_database to avoid interaction with the actual database
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
     # Mock HTTP request using patch to completely prevent the actual request
-    with patch("requests.post") as mock_post:
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
         mock_post.return_value = MagicMock(
             status_code=400
         )  # Mock response with status 201
@@ -167,20 +481,20 @@ async def test_text_file_manager_add_document_error_500(monkeypatch):
 
     # Create mock implementations for _save_file and _load_split_file
     async def mock_save_file(file):
-        return "/mock/path/to/test.txt"  # Return a mock file path
+        return "/mock/path/to/test.txt", None  # Return a mock file path
 
     async def mock_load_split_file(file_path):
         return ["chunk1", "chunk2", "chunk3"]  # Mock the chunks from file splitting
 
     # Use monkeypatch to replace the methods with the mock implementations
-    monkeypatch.setattr(MyTxtFileManager, "_save_file", mock_save_file)
+    monkeypatch.setattr(MyTxtFileManager, "_save_new_file", mock_save_file)
     monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
 
     # Mock _vector_database to avoid interaction with the actual database
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
     # Mock HTTP request using patch to completely prevent the actual request
-    with patch("requests.post") as mock_post:
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
         mock_post.return_value = MagicMock(
             status_code=500
         )  # Mock response with status 201
@@ -208,20 +522,20 @@ async def test_text_file_manager_add_document_error_defalut(monkeypatch):
 
     # Create mock implementations for _save_file and _load_split_file
     async def mock_save_file(file):
-        return "/mock/path/to/test.txt"  # Return a mock file path
+        return "/mock/path/to/test.txt", None  # Return a mock file path
 
     async def mock_load_split_file(file_path):
         return ["chunk1", "chunk2", "chunk3"]  # Mock the chunks from file splitting
 
     # Use monkeypatch to replace the methods with the mock implementations
-    monkeypatch.setattr(MyTxtFileManager, "_save_file", mock_save_file)
+    monkeypatch.setattr(MyTxtFileManager, "_save_new_file", mock_save_file)
     monkeypatch.setattr(MyTxtFileManager, "_load_split_file", mock_load_split_file)
 
     # Mock _vector_database to avoid interaction with the actual database
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
     # Mock HTTP request using patch to completely prevent the actual request
-    with patch("requests.post") as mock_post:
+    with patch.object(MyTxtFileManager._database_api, "post") as mock_post:
         mock_post.return_value = MagicMock(
             status_code=501
         )  # Mock response with status 201
@@ -261,10 +575,10 @@ async def test_delete_document_os_remove_error(monkeypatch):
     # Mock _vector_database as it might be called if other parts succeed
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
-    # Mock the requests.delete call to the Database API
+    # Mock the delete call to the Database API
     # This is crucial: ensure this call is mocked to return a success (204)
     # so that the code proceeds to the os.remove part.
-    with patch("requests.delete") as mock_requests_delete:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_requests_delete:
         mock_requests_delete.return_value = MagicMock(
             status_code=204
         )  # Simulate DB API success
@@ -304,7 +618,7 @@ async def test_text_file_manager_delete_document(monkeypatch):
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
     # Mock the HTTP request using patch
-    with patch("requests.delete") as mock_delete:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_delete:
         mock_delete.return_value = MagicMock(
             status_code=204
         )  # Mock response with status 200
@@ -347,7 +661,7 @@ async def test_text_file_manager_delete_document_not_found(monkeypatch):
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
     # Mock the HTTP request using patch
-    with patch("requests.delete") as mock_delete:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_delete:
         mock_delete.return_value = MagicMock(
             status_code=404
         )  # Mock response with status 200
@@ -385,7 +699,7 @@ async def test_text_file_manager_delete_document_500_exception(monkeypatch):
     # Define the specific text we expect delete_req.text to be
     expected_api_error_text = "Database server encountered an error."
 
-    with patch("requests.delete") as mock_delete_request:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_delete_request:
         # This mock_response object will be 'delete_req' in your service code
         mock_response = MagicMock()
         mock_response.status_code = 500  # To hit the 'case 500:'
@@ -432,7 +746,7 @@ async def test_text_file_manager_delete_document_default_exception(
     # Mock _vector_database to avoid interaction with the actual database
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
     # Mock the HTTP request using patch
-    with patch("requests.delete") as mock_delete:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_delete:
         mock_delete.return_value = MagicMock(
             status_code=501
         )  # Mock response with status 500
@@ -477,10 +791,10 @@ async def test_text_file_manager_delete_path_not_found(monkeypatch):
     # Mock _vector_database as it's not relevant for this specific failure path
     monkeypatch.setattr(MyTxtFileManager, "_vector_database", MagicMock())
 
-    # Mock the requests.delete call to the Database API
+    # Mock the delete call to the Database API
     # This is crucial: ensure this call is mocked to return a success (204)
     # so that the code proceeds to the filesystem check part.
-    with patch("requests.delete") as mock_requests_delete:
+    with patch.object(MyTxtFileManager._database_api, "delete") as mock_requests_delete:
         mock_requests_delete.return_value = MagicMock(
             status_code=204
         )  # Simulate DB API success
@@ -549,6 +863,10 @@ def test_get_file_manager_by_extension():
 
 @pytest.mark.asyncio
 async def test_pdf_file_manager_load_split_file(monkeypatch):
+    # lettura nel thread pool, senza controllo delle pagine
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 0)
+    monkeypatch.setattr(settings, "PDF_MAX_PAGES", 0)
+    monkeypatch.setattr(settings, "PDF_STREAMING_MIN_PAGES", 0)
     MyPdfFileManager = PdfFileManager()
     FakePdfFileManager = MagicMock()
     FakePdfFileManager.load = MagicMock(return_value=["chunk1", "chunk2", "chunk3"])
@@ -569,3 +887,324 @@ async def test_pdf_file_manager_load_split_file(monkeypatch):
     assert isinstance(
         FakeSplitter.split_documents.return_value, list
     ), "Should return a list of documents"
+
+
+def write_pdf(path, pages):
+    """Scrive un PDF minimo con una riga di testo per pagina."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    font = 3
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {content} 0 R /Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+@pytest.fixture
+def pdf_pool(monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 1)
+    yield
+    close_pdf_executor()
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_parses_in_process_pool(tmp_path, pdf_pool):
+    path = str(tmp_path / "catalogo.pdf")
+    write_pdf(path, ["Sedia da ufficio Codice: 93002", "Tavolo in legno"])
+
+    chunks = await PdfFileManager()._load_split_file(path)
+
+    text = " ".join(chunk.page_content for chunk in chunks)
+    assert "Sedia da ufficio" in text, "Should extract the text in the pool"
+    assert "Tavolo in legno" in text, "Should extract every page"
+    assert all(
+        chunk.metadata["product_codes"] == "93002" for chunk in chunks
+    ), "Should tag the chunks with the product codes"
+    assert (
+        file_manager_service._pdf_executor is not None
+    ), "Should keep the process pool for the next PDF"
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_rejects_too_many_pages(
+    tmp_path, pdf_pool, monkeypatch
+):
+    monkeypatch.setattr(settings, "PDF_MAX_PAGES", 2)
+    path = str(tmp_path / "catalogo.pdf")
+    write_pdf(path, ["uno", "due", "tre"])
+
+    with pytest.raises(HTTPException) as exc_info:
+        await PdfFileManager()._load_split_file(path)
+
+    assert exc_info.value.status_code == 413, "Should reject PDFs over the page limit"
+    assert "3 pagine" in exc_info.value.detail, "Should report the page count"
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_rejects_too_many_pages_inline(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 0)
+    monkeypatch.setattr(settings, "PDF_MAX_PAGES", 1)
+    path = str(tmp_path / "catalogo.pdf")
+    write_pdf(path, ["uno", "due"])
+
+    with pytest.raises(HTTPException) as exc_info:
+        await PdfFileManager()._load_split_file(path)
+
+    assert (
+        exc_info.value.status_code == 413
+    ), "Should apply the page limit without the process pool too"
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_timeout_resets_pool(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    import time
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    reset = MagicMock()
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 1)
+    monkeypatch.setattr(settings, "PDF_PARSE_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "PDF_MAX_PAGES", 0)
+    monkeypatch.setattr(settings, "PDF_STREAMING_MIN_PAGES", 0)
+    monkeypatch.setattr(file_manager_service, "_get_pdf_executor", lambda: executor)
+    monkeypatch.setattr(file_manager_service, "_reset_pdf_executor", reset)
+    monkeypatch.setattr(
+        file_manager_service, "load_pdf_file", lambda *args: time.sleep(0.5)
+    )
+
+    with pytest.raises(HTTPException) as exc_info:
+        await PdfFileManager()._load_split_file("lento.pdf")
+    executor.shutdown(wait=True)
+
+    assert exc_info.value.status_code == 422, "Should fail PDFs over the time limit"
+    reset.assert_called_once_with(executor)
+
+
+@pytest.fixture
+def streamed_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_STREAMING_MIN_PAGES", 1)
+    monkeypatch.setattr(settings, "PDF_STREAMING_WINDOW_PAGES", 1)
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_SIZE", 2)
+    path = str(tmp_path / "catalogo.pdf")
+    write_pdf(
+        path,
+        [
+            "Sedia da ufficio Codice: 93002 " + "seduta ergonomica " * 6,
+            "Tavolo in legno Codice: 81001 " + "piano in rovere " * 6,
+            "Lampada da terra " + "luce calda " * 6,
+        ],
+    )
+    return path
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_streams_pages(streamed_pdf, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 0)
+    manager = PdfFileManager()
+    manager._splitter = file_manager_service.RecursiveCharacterTextSplitter(
+        chunk_size=60, chunk_overlap=20
+    )
+
+    batches = [batch async for batch in manager._iter_split_file(streamed_pdf)]
+    chunks = [chunk for batch in batches for chunk in batch]
+
+    assert len(batches) > 1, "Should yield the chunks in batches"
+    assert all(len(batch) <= 2 for batch in batches), "Should respect the batch size"
+    assert {chunk.metadata["page"] for chunk in chunks} == {
+        0,
+        1,
+        2,
+    }, "Should keep the page numbers in the metadata"
+    for chunk in chunks:
+        assert chunk.metadata["source"] == streamed_pdf
+        assert chunk.metadata["page"] <= chunk.metadata["page_end"]
+    first_page = [c for c in chunks if c.metadata["page_end"] == 0]
+    assert all(
+        c.metadata["product_codes"] == "93002" for c in first_page
+    ), "Should tag the chunks with the product codes of their pages"
+    last_page = [c for c in chunks if c.metadata["page"] == 2]
+    assert all(
+        "product_codes" not in c.metadata for c in last_page
+    ), "Should not tag the pages without product codes"
+    assert [c.page_content for c in chunks] == [
+        c.page_content
+        for c in manager._split_data(
+            streamed_pdf, file_manager_service.load_pdf_file(streamed_pdf)
+        )
+    ], "Should split the pages like the whole document"
+
+    assert [
+        c.page_content for c in await manager._load_split_file(streamed_pdf)
+    ] == [c.page_content for c in chunks], "Should split the same way when loading"
+
+
+@pytest.mark.asyncio
+async def test_pdf_file_manager_streams_pages_in_process_pool(
+    streamed_pdf, pdf_pool
+):
+    chunks = await PdfFileManager()._load_split_file(streamed_pdf)
+
+    assert len(chunks) == 1, "Should carry the short pages into a single chunk"
+    assert chunks[0].metadata["page"] == 0
+    assert chunks[0].metadata["page_end"] == 2, "Should record the last page"
+    assert (
+        chunks[0].metadata["product_codes"] == "93002,81001"
+    ), "Should tag the chunk with the codes of every page it spans"
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_indexes_streamed_batches(streamed_pdf, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PARSER_WORKERS", 0)
+    manager = PdfFileManager()
+    manager._splitter = file_manager_service.RecursiveCharacterTextSplitter(
+        chunk_size=60, chunk_overlap=20
+    )
+    vector_database = MagicMock()
+    manager._vector_database = vector_database
+
+    chunks = await manager._index_file(streamed_pdf)
+
+    assert vector_database.add_documents.call_count > 1, "Should index each batch"
+    indexed = [
+        chunk
+        for call in vector_database.add_documents.call_args_list
+        for chunk in call.args[0]
+    ]
+    assert chunks == indexed, "Should return every indexed chunk"
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_removes_batches_when_parsing_fails(monkeypatch):
+    manager = TextFileManager()
+    vector_database = MagicMock()
+    manager._vector_database = vector_database
+
+    async def failing_iter_split_file(file_path):
+        yield [Document(page_content="primo blocco")]
+        raise HTTPException(status_code=422, detail="PDF illeggibile")
+
+    monkeypatch.setattr(manager, "_iter_split_file", failing_iter_split_file)
+
+    with pytest.raises(HTTPException):
+        await manager._index_file("catalogo.pdf")
+
+    vector_database.delete_chunks.assert_called_once_with(
+        [file_manager_service.get_uuid3("primo blocco")]
+    )
+
+
+FOOTER = (
+    "Aggiungi ai preferiti Scheda in PDF Condividi via mail "
+    "Caratteristiche del prodotto Maggiori Informazioni"
+)
+
+
+@pytest.mark.asyncio
+async def test_text_file_manager_strips_boilerplate(documents_dir, boilerplate_filter):
+    manager = TextFileManager()
+    for name, description in [
+        ("1.txt", "Formaggio di capra a pasta morbida"),
+        ("2.txt", "Salame di cinghiale stagionato due mesi"),
+    ]:
+        with open(os.path.join(documents_dir, name), "w", encoding="utf-8") as f:
+            f.write(f"{description} Codice: 1000{name[0]}\n{FOOTER}")
+        await manager._load_split_file(os.path.join(documents_dir, name))
+
+    file_path = os.path.join(documents_dir, "3.txt")
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(
+            f"Miele di castagno biologico\n{FOOTER}\n"
+            "Dal sapore amarognolo Codice: 20001 Peso: 1 kg"
+        )
+    chunks = await manager._load_split_file(file_path)
+
+    assert [chunk.page_content for chunk in chunks] == [
+        "Miele di castagno biologico\nDal sapore amarognolo Codice: 20001 Peso: 1 kg"
+    ], "Should strip the corpus boilerplate and keep the fields"
+    assert chunks[0].metadata["product_codes"] == "20001"
+    assert boilerplate_filter.stats()["bytes_saved"] > len(FOOTER)
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_drops_near_duplicate_chunks(
+    boilerplate_filter, monkeypatch
+):
+    manager = TextFileManager()
+    manager._vector_database = MagicMock()
+    description = (
+        "Il caseificio raccoglie il latte da piccoli allevatori locali "
+        "e stagiona le forme in grotte naturali per almeno dodici mesi"
+    )
+
+    async def iter_split_file(file_path):
+        yield [
+            Document(page_content=description, metadata={"source": file_path}),
+            Document(page_content=f"Scheda del prodotto {file_path}", metadata={}),
+        ]
+
+    monkeypatch.setattr(manager, "_iter_split_file", iter_split_file)
+
+    first = await manager._index_file("a.txt")
+    second = await manager._index_file("b.txt")
+
+    assert len(first) == 2, "Should keep the chunks of the first document"
+    assert [c.page_content for c in second] == [
+        "Scheda del prodotto b.txt"
+    ], "Should drop the chunks already stored for another document"
+    assert boilerplate_filter.stats()["duplicate_chunks_dropped"] == 1
+
+    boilerplate_filter.remove_source("a.txt")
+    assert (
+        len(await manager._index_file("c.txt")) == 2
+    ), "Should accept the chunk again once the other document is forgotten"
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_filter_runs_without_boilerplate_stripping(
+    boilerplate_filter, monkeypatch
+):
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", False)
+    manager = TextFileManager()
+    manager._vector_database = MagicMock()
+    description = (
+        "Il caseificio raccoglie il latte da piccoli allevatori locali "
+        "e stagiona le forme in grotte naturali per almeno dodici mesi"
+    )
+
+    async def iter_split_file(file_path):
+        yield [
+            Document(page_content=description, metadata={"source": file_path}),
+            Document(page_content=f"Codice: {file_path}", metadata={}),
+        ]
+
+    monkeypatch.setattr(manager, "_iter_split_file", iter_split_file)
+
+    await manager._index_file("a.txt")
+    second = await manager._index_file("b.txt")
+
+    assert [c.page_content for c in second] == [
+        "Codice: b.txt"
+    ], "Should drop near duplicates but keep short chunks when nothing is stripped"
+    assert boilerplate_filter.stats()["empty_chunks_dropped"] == 0
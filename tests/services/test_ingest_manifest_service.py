@@ -0,0 +1,57 @@
+from app.services.ingest_manifest_service import (
+    IngestManifest,
+    get_ingest_manifest,
+    close_ingest_manifest,
+)
+
+
+def test_manifest_add_and_get(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.sqlite3"))
+    assert manifest.get("abc") is None, "Unknown hashes should not be found"
+
+    manifest.add("abc", "/data/a.txt", ["id1", "id2"])
+    entry = manifest.get("abc")
+    assert entry["source"] == "/data/a.txt"
+    assert entry["chunk_ids"] == ["id1", "id2"]
+    assert entry["ingested_at"] > 0
+    assert manifest.get_by_source("/data/a.txt")["hash"] == "abc"
+
+    manifest.add("def", "/data/a.txt", ["id3"])
+    assert manifest.get("abc") is None, "A new version of the file should replace the old entry"
+
+    manifest.remove_source("/data/a.txt")
+    assert manifest.get("def") is None, "Should remove the entry of a deleted file"
+    manifest.close()
+
+
+def test_manifest_persists_on_disk(tmp_path):
+    path = str(tmp_path / "manifest.sqlite3")
+    manifest = IngestManifest(path)
+    manifest.add("abc", "/data/a.txt", ["id1"])
+    manifest.close()
+
+    reopened = IngestManifest(path)
+    assert reopened.get("abc")["chunk_ids"] == ["id1"], "Should survive a restart"
+    reopened.clear()
+    assert reopened.get("abc") is None
+    reopened.close()
+
+
+def test_manifest_claim(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.sqlite3"))
+    assert manifest.claim("abc") is True
+    assert manifest.claim("abc") is False, "The same content should not be ingested twice at once"
+    manifest.release("abc")
+    assert manifest.claim("abc") is True
+    manifest.close()
+
+
+def test_shared_manifest(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "app.services.ingest_manifest_service.settings.INGEST_MANIFEST_PATH",
+        str(tmp_path / "manifest.sqlite3"),
+    )
+    manifest = get_ingest_manifest()
+    assert manifest is get_ingest_manifest(), "Should return the shared instance"
+    close_ingest_manifest()
+    assert (tmp_path / "manifest.sqlite3").exists()
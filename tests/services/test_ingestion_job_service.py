@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+
+from app.services.ingestion_job_service import (
+    IngestionJob,
+    IngestionJobManager,
+    get_ingestion_job_manager,
+    close_ingestion_job_manager,
+)
+
+
+class FakeFileManager:
+    def __init__(self, error=None, delay=0):
+        self.error = error
+        self.delay = delay
+        self.ingested = []
+        self.discarded = []
+
+    async def _ingest_file(self, file_path, title, token, job=None, sha256=None):
+        job.set_stage(job.PARSING)
+        await asyncio.sleep(self.delay)
+        job.chunks = 3
+        job.set_stage(job.INDEXING)
+        if self.error is not None:
+            raise self.error
+        job.set_stage(job.REGISTERING)
+        self.ingested.append((file_path, title, token))
+        return True
+
+    def _discard_new_file(self, file_path, sha256):
+        self.discarded.append((file_path, sha256))
+
+
+async def _wait(job):
+    for _ in range(100):
+        if job.finished:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_background():
+    manager = IngestionJobManager(workers=2)
+    file_manager = FakeFileManager()
+
+    job = manager.submit(file_manager, "/data/test.txt", "test.txt", "token")
+    assert job.stage == IngestionJob.QUEUED, "Job should be queued when submitted"
+    assert manager.get(job.id) is job
+
+    await _wait(job)
+    assert job.stage == IngestionJob.DONE
+    assert job.chunks == 3
+    assert set(job.timings) == {"queued", "parsing", "indexing", "registering"}
+    assert file_manager.ingested == [("/data/test.txt", "test.txt", "token")]
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_failure_is_reported():
+    manager = IngestionJobManager(workers=1)
+    http_job = manager.submit(
+        FakeFileManager(HTTPException(status_code=400, detail="Documento già esistente")),
+        "/data/a.txt",
+        "a.txt",
+        "token",
+    )
+    error_job = manager.submit(
+        FakeFileManager(RuntimeError("boom")), "/data/b.txt", "b.txt", "token"
+    )
+    await _wait(error_job)
+
+    assert http_job.stage == IngestionJob.FAILED
+    assert http_job.to_dict()["status_code"] == 400
+    assert http_job.error == "Documento già esistente"
+    assert error_job.status_code == 500 and "boom" in error_job.error
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_history_is_bounded():
+    manager = IngestionJobManager(workers=1, max_history=2)
+    jobs = [
+        manager.submit(FakeFileManager(), f"/data/{i}.txt", f"{i}.txt", "token")
+        for i in range(3)
+    ]
+    await _wait(jobs[-1])
+    manager.submit(FakeFileManager(), "/data/3.txt", "3.txt", "token")
+    assert manager.get(jobs[0].id) is None, "Oldest finished jobs should be dropped"
+    assert manager.get(jobs[2].id) is jobs[2]
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_fails_pending_jobs():
+    manager = IngestionJobManager(workers=1)
+    job = manager.submit(FakeFileManager(delay=10), "/data/a.txt", "a.txt", "token")
+    await asyncio.sleep(0.01)
+    await manager.stop()
+    assert job.stage == IngestionJob.FAILED, "Unfinished jobs should be marked as failed"
+
+
+@pytest.mark.asyncio
+async def test_stop_discards_queued_files():
+    manager = IngestionJobManager(workers=1)
+    file_manager = FakeFileManager(delay=10)
+    manager.submit(file_manager, "/data/a.txt", "a.txt", "token", "hash-a")
+    queued = manager.submit(file_manager, "/data/b.txt", "b.txt", "token", "hash-b")
+    await asyncio.sleep(0.01)
+    await manager.stop()
+    assert queued.stage == IngestionJob.FAILED
+    assert file_manager.discarded == [
+        ("/data/b.txt", "hash-b")
+    ], "Queued jobs should release their content hash"
+
+
+@pytest.mark.asyncio
+async def test_shared_job_manager():
+    manager = get_ingestion_job_manager()
+    assert manager is get_ingestion_job_manager(), "Should return the shared instance"
+    await close_ingestion_job_manager()
+    assert get_ingestion_job_manager() is not manager, "Should create a new one after close"
+    await close_ingestion_job_manager()
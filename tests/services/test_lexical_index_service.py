@@ -0,0 +1,95 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.services.lexical_index_service import (
+    BM25Index,
+    ProductCodeIndex,
+    extract_product_codes,
+    tokenize,
+    reciprocal_rank_fusion,
+)
+
+
+def test_tokenize_italian_text():
+    tokens = tokenize("Composta di fragole dell'orto, Codice: 31100M23F04 è più buona")
+    assert "di" not in tokens and "dell" not in tokens, "Should drop Italian stopwords"
+    assert "orto" in tokens, "Should split elisions"
+    assert "31100m23f04" in tokens, "Product codes should stay whole"
+    assert tokenize("fragola") == tokenize("fragole"), "Singular and plural should match"
+    assert tokenize("Origine: città") == tokenize("origine citta"), "Accents should not matter"
+
+
+def _index():
+    index = BM25Index()
+    index.add(
+        ["a", "b", "c"],
+        [
+            Document(page_content="Composta di fragole Codice: 93001", metadata={"source": "a.txt"}),
+            Document(page_content="Confettura di pesche Codice: 93002", metadata={"source": "b.txt"}),
+            Document(page_content="Domanda: spedite? Risposta: sì", metadata={"source": "faqs", "faq_id": "1"}),
+        ],
+    )
+    return index
+
+
+def test_bm25_search_exact_code():
+    results = _index().search("cosa contiene il prodotto 93002?", 2)
+    assert len(results) == 1, "Only documents sharing a term should be returned"
+    document, score = results[0]
+    assert document.id == "b" and score > 0, "Should find the product by code"
+    assert document.metadata == {"source": "b.txt"}
+
+
+def test_bm25_remove_and_remove_where():
+    index = _index()
+    index.remove(["a"])
+    assert index.search("fragole", 4) == [], "Removed documents should not be found"
+    index.remove_where("faq_id", "1")
+    assert len(index) == 1, "Should remove documents matching the metadata"
+    index.clear()
+    assert index.search("pesche", 4) == [], "Cleared index should be empty"
+
+
+def test_bm25_readding_document_replaces_it():
+    index = _index()
+    index.add(["a"], [Document(page_content="Olio extravergine")])
+    assert len(index) == 3, "Re-adding an id should not duplicate it"
+    assert index.search("fragole", 4) == [], "Old terms should be removed"
+
+
+def test_reciprocal_rank_fusion():
+    a = Document(id="a", page_content="a")
+    b = Document(id="b", page_content="b")
+    c = Document(id="c", page_content="c")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, c]], 2)
+    assert [d.id for d in fused] == ["b", "c"], "Documents ranked well by both lists should win"
+
+
+def test_extract_product_codes():
+    text = "Codice: 31100m23f04 Peso: 300 g Codice: 93001 Codice: 31100M23F04"
+    assert extract_product_codes(text) == ["31100M23F04", "93001"]
+
+
+def test_product_code_index_lookup():
+    index = ProductCodeIndex()
+    index.add(
+        ["a", "b", "c"],
+        [
+            Document(page_content="x", metadata={"source": "a.txt", "product_codes": "93001"}),
+            Document(page_content="y", metadata={"source": "a.txt", "product_codes": "93001"}),
+            Document(page_content="z", metadata={"source": "b.txt"}),
+        ],
+    )
+    assert len(index) == 1, "Only chunks with codes should be indexed"
+    assert sorted(index.lookup("scheda del 93001?")) == ["a", "b"]
+    assert index.lookup("peso 300 g") == [], "Unknown codes should not match"
+    index.remove_where("source", "a.txt")
+    assert index.lookup("93001") == [], "Deleted chunks should be dropped"
+
+
+def test_bm25_search_restricted_to_ids():
+    results = _index().search("fragole 93002", 4, ids=["a", "b"])
+    assert [d.id for d, _ in results] == ["b", "a"] or [
+        d.id for d, _ in results
+    ] == ["a", "b"], "Should only rank the requested chunks"
+    assert len(_index().search("olio", 4, ids=["c"])) == 1, "Zero scores should be kept"
@@ -2,12 +2,16 @@ import pytest
 from app.services.llm_response_service import (
     LLMResponseService,
     get_llm_response_service,
+    close_llm_response_service,
 )
 from app.services.vector_database_service import VectorDatabase, get_vector_database
 from app.services.llm_service import LLM, get_llm_model
+from app.services.session_service import InMemorySessionStore
+from app.services.answer_cache_service import AnswerCache
 from app.schemas import Question, Message
 from starlette.responses import StreamingResponse
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
+from langchain_core.documents import Document
 from fastapi import HTTPException
 
 
@@ -100,6 +104,66 @@ def test_llm_response_service_get_context_exception(monkeypatch):
     ), "Should raise HTTPException with the correct error message for generic exceptions"
 
 
+@pytest.mark.asyncio
+async def test_llm_response_service_aget_context(monkeypatch):
+    llm_response_service = LLMResponseService()
+    mock_doc = MagicMock()
+    mock_doc.page_content = "Paris is the capital of France."
+
+    async def mock_asearch_context(q):
+        return [mock_doc]
+
+    monkeypatch.setattr(
+        llm_response_service._vector_database, "asearch_context", mock_asearch_context
+    )
+
+    context_list = await llm_response_service._aget_context("Capital of France?")
+    assert context_list == [
+        "Paris is the capital of France."
+    ], "Should return the page_content of the documents found asynchronously"
+
+
+@pytest.mark.asyncio
+async def test_llm_response_service_aget_context_skips_product_codes(monkeypatch):
+    llm_response_service = LLMResponseService()
+    mock_doc = MagicMock()
+    mock_doc.page_content = "Composta di pesche Codice: 93002"
+    search_by_product_code = MagicMock()
+
+    monkeypatch.setattr(
+        llm_response_service._vector_database,
+        "search_by_product_code",
+        search_by_product_code,
+    )
+    monkeypatch.setattr(
+        llm_response_service._vector_database,
+        "asearch_context",
+        AsyncMock(return_value=[mock_doc]),
+    )
+
+    context_list = await llm_response_service._aget_context("Ingredienti del 93002?")
+    assert context_list == ["Composta di pesche Codice: 93002"]
+    search_by_product_code.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_llm_response_service_aget_context_false(monkeypatch):
+    llm_response_service = LLMResponseService()
+
+    async def mock_asearch_context(q):
+        return []
+
+    monkeypatch.setattr(
+        llm_response_service._vector_database, "asearch_context", mock_asearch_context
+    )
+
+    with pytest.raises(HTTPException) as excinfo:
+        await llm_response_service._aget_context("Capital of France?")
+    assert (
+        excinfo.value.status_code == 404
+    ), "Should raise HTTPException with status code 404"
+
+
 def test_get_llm_response_service():
     llm_response_service = get_llm_response_service()
     assert isinstance(
@@ -149,7 +213,7 @@ def test_generate_llm_chat_name_exception(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_generate_llm_response_with_messages_list(monkeypatch):
-    def mock_search_context(question):
+    async def mock_search_context(question):
         return "Mocked context"
 
     class mockChunk:
@@ -172,13 +236,13 @@ async def test_generate_llm_response_with_messages_list(monkeypatch):
     mock_LLM.model = mock_LLM_MODEL
 
     service = LLMResponseService()
-    monkeypatch.setattr(service, "_get_context", mock_search_context)
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
     question = Question(
         question="Voglio pizza!", messages=[Message(sender="me", content="Hi")]
     )
     monkeypatch.setattr(service, "_LLM", mock_LLM)
 
-    result = service.generate_llm_response(question)
+    result = await service.generate_llm_response(question)
     assert isinstance(
         result, StreamingResponse
     ), "Should be a StreamingResponse instance"
@@ -188,7 +252,7 @@ async def test_generate_llm_response_with_messages_list(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_generate_llm_response_with_empty_messages_list(monkeypatch):
-    def mock_search_context(question):
+    async def mock_search_context(question):
         return "Mocked context"
 
     class mockChunk:
@@ -211,11 +275,11 @@ async def test_generate_llm_response_with_empty_messages_list(monkeypatch):
     mock_LLM.model = mock_LLM_MODEL
 
     service = LLMResponseService()
-    monkeypatch.setattr(service, "_get_context", mock_search_context)
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
     question = Question(question="Voglio pizza!", messages=[])
     monkeypatch.setattr(service, "_LLM", mock_LLM)
 
-    result = service.generate_llm_response(question)
+    result = await service.generate_llm_response(question)
     assert isinstance(
         result, StreamingResponse
     ), "Should be a StreamingResponse instance"
@@ -225,7 +289,7 @@ async def test_generate_llm_response_with_empty_messages_list(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_generate_llm_response_with_stream_error(monkeypatch):
-    def mock_search_context(question):
+    async def mock_search_context(question):
         return "Mocked context"
 
     def mock_astream(messages):
@@ -237,17 +301,326 @@ async def test_generate_llm_response_with_stream_error(monkeypatch):
     mock_LLM._model = mock_LLM_MODEL
 
     service = LLMResponseService()
-    monkeypatch.setattr(service, "_get_context", mock_search_context)
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
     question = Question(
         question="Voglio pizza!", messages=[Message(sender="me", content="Hi")]
     )
     monkeypatch.setattr(service, "_LLM", mock_LLM)
 
     with pytest.raises(HTTPException) as excinfo:
-        service.generate_llm_response(question)
+        await service.generate_llm_response(question)
     assert (
         excinfo.value.status_code == 500
     ), "Should raise HTTPException with status code 500"
     assert str(excinfo.value.detail).startswith(
         "Error in chat service:"
     ), "Should raise HTTPException with the correct error message"
+
+
+def test_get_llm_response_service_is_shared(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.llm_response_service._llm_response_service", None
+    )
+    first = get_llm_response_service()
+    second = get_llm_response_service()
+    assert first is second, "Should reuse the same LLMResponseService across requests"
+
+
+@pytest.mark.asyncio
+async def test_close_llm_response_service(monkeypatch):
+    service = MagicMock()
+
+    async def mock_aclose():
+        service.closed = True
+
+    service.aclose = mock_aclose
+    monkeypatch.setattr(
+        "app.services.llm_response_service._llm_response_service", service
+    )
+
+    await close_llm_response_service()
+
+    assert service.closed is True, "Should close the shared service"
+    new_service = get_llm_response_service()
+    assert new_service is not service, "Should build a new service after closing"
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_uses_prompt_builder(monkeypatch):
+    async def mock_search_context(question):
+        return ["Pizza margherita"]
+
+    sent = []
+
+    async def mock_astream(messages):
+        sent.extend(messages)
+        yield "ok"
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    prompt_builder = MagicMock()
+    prompt_builder.build.return_value = ["prompt"]
+
+    service = LLMResponseService(
+        llm=mock_LLM, vector_database=MagicMock(), prompt_builder=prompt_builder
+    )
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
+    history = [Message(sender="me", content="Hi")]
+
+    result = await service.generate_llm_response(
+        Question(question="Voglio pizza!", messages=history)
+    )
+    chunks = [chunk async for chunk in result.body_iterator]
+
+    prompt_builder.build.assert_called_once_with(
+        "Voglio pizza!", history, ["Pizza margherita"], ""
+    )
+    assert sent == ["prompt"], "Should send the prompt built within the budgets"
+    assert chunks == ["data: ok\n\n", "data: [DONE]\n\n"]
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_uses_conversation_memory(monkeypatch):
+    async def mock_search_context(question):
+        return ["Pizza margherita"]
+
+    async def mock_astream(messages):
+        yield "ok"
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    prompt_builder = MagicMock()
+    history = [Message(sender="me", content=f"messaggio {i}") for i in range(10)]
+    conversation_memory = MagicMock()
+    conversation_memory.compact.return_value = ("riassunto", history[-2:])
+
+    service = LLMResponseService(
+        llm=mock_LLM,
+        vector_database=MagicMock(),
+        prompt_builder=prompt_builder,
+        conversation_memory=conversation_memory,
+    )
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
+
+    await service.generate_llm_response(
+        Question(question="Voglio pizza!", messages=history)
+    )
+
+    conversation_memory.compact.assert_called_once_with(history)
+    prompt_builder.build.assert_called_once_with(
+        "Voglio pizza!", history[-2:], ["Pizza margherita"], "riassunto"
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_with_session(monkeypatch):
+    async def mock_search_context(question):
+        return ["Pizza margherita"]
+
+    async def mock_astream(messages):
+        for chunk in ["Certo", ", ecco"]:
+            yield chunk
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    prompt_builder = MagicMock()
+    session_store = InMemorySessionStore()
+    service = LLMResponseService(
+        llm=mock_LLM,
+        vector_database=MagicMock(),
+        prompt_builder=prompt_builder,
+        session_store=session_store,
+    )
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
+    seed = [Message(sender="user", content="Ciao"), Message(sender="bot", content="Ciao!")]
+
+    result = await service.generate_llm_response(
+        Question(question="Voglio pizza!", messages=seed, session_id="chat-1")
+    )
+    [chunk async for chunk in result.body_iterator]
+    result = await service.generate_llm_response(
+        Question(question="E la marinara?", session_id="chat-1")
+    )
+    [chunk async for chunk in result.body_iterator]
+
+    stored = [(m.sender, m.content) for m in await session_store.get_messages("chat-1")]
+    assert stored == [
+        ("user", "Ciao"),
+        ("bot", "Ciao!"),
+        ("user", "Voglio pizza!"),
+        ("bot", "Certo, ecco"),
+        ("user", "E la marinara?"),
+        ("bot", "Certo, ecco"),
+    ], "Should store the seed, questions and streamed answers"
+    second_history = prompt_builder.build.call_args_list[1].args[1]
+    assert [m.content for m in second_history] == [
+        "Ciao",
+        "Ciao!",
+        "Voglio pizza!",
+        "Certo, ecco",
+    ], "Should read the history from the session"
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_serves_cached_answer(monkeypatch):
+    async def mock_search_context(question):
+        return ["Composta di fragole. Peso: 250 g"]
+
+    calls = []
+
+    async def mock_astream(messages):
+        calls.append(messages)
+        for chunk in ["Pesa ", "250 g"]:
+            yield chunk
+
+    async def mock_aembed_query(question):
+        return [1.0, 0.0] if "fragole" in question else [0.0, 1.0]
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    vector_database = MagicMock()
+    vector_database.generation = 0
+    vector_database.aembed_query = mock_aembed_query
+    answer_cache = AnswerCache(max_entries=10, threshold=0.9, ttl=0)
+    service = LLMResponseService(
+        llm=mock_LLM,
+        vector_database=vector_database,
+        prompt_builder=MagicMock(),
+        answer_cache=answer_cache,
+    )
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
+
+    async def ask(text: str) -> list[str]:
+        result = await service.generate_llm_response(Question(question=text))
+        return [chunk async for chunk in result.body_iterator]
+
+    first = await ask("Quanto pesa la composta di fragole?")
+    second = await ask("quanto pesa la composta di fragole")
+    assert first == second == ["data: Pesa \n\n", "data: 250 g\n\n", "data: [DONE]\n\n"]
+    assert len(calls) == 1, "Should serve the second answer from the cache"
+
+    await ask("Cosa contiene?")
+    assert len(calls) == 2, "Should call the LLM for a different question"
+
+    vector_database.generation = 1
+    await ask("Quanto pesa la composta di fragole?")
+    assert len(calls) == 3, "Should not reuse answers after a write"
+    assert answer_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_does_not_embed_product_code_questions(monkeypatch):
+    calls = []
+
+    async def mock_astream(messages):
+        calls.append(messages)
+        yield "Pesa 250 g"
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    vector_database = MagicMock()
+    vector_database.generation = 0
+    vector_database.asearch_by_product_code = AsyncMock(
+        return_value=[
+            Document(page_content="Composta di fragole Codice: 93002 Peso: 250 g")
+        ]
+    )
+    vector_database.aembed_query = AsyncMock()
+    vector_database.asearch_context = AsyncMock()
+    vector_database.asearch_faqs = AsyncMock()
+    answer_cache = AnswerCache(max_entries=10, threshold=0.9, ttl=0)
+    service = LLMResponseService(
+        llm=mock_LLM,
+        vector_database=vector_database,
+        prompt_builder=MagicMock(),
+        answer_cache=answer_cache,
+    )
+
+    for _ in range(2):
+        result = await service.generate_llm_response(
+            Question(question="Quanto pesa il 93002?")
+        )
+        [chunk async for chunk in result.body_iterator]
+
+    assert len(calls) == 2, "Product code answers should not be cached"
+    vector_database.aembed_query.assert_not_awaited()
+    vector_database.asearch_context.assert_not_awaited()
+    assert answer_cache.stats()["size"] == 0
+    vector_database.asearch_faqs.assert_not_awaited()
+    assert service._faq_stats == {"hits": 0, "misses": 0}, "Should skip the FAQ search"
+
+
+def make_faq_service(monkeypatch, score: float, metadata: dict):
+    async def mock_asearch_faqs(question, results_number):
+        faq = Document(
+            page_content="Domanda: Spedite all'estero?\nRisposta: Sì, in tutta Europa.",
+            metadata=metadata,
+        )
+        return [(faq, score)]
+
+    async def mock_search_context(question):
+        return ["Spedizioni"]
+
+    calls = []
+
+    async def mock_astream(messages):
+        calls.append(messages)
+        yield "Risposta del modello"
+
+    mock_LLM = MagicMock()
+    mock_LLM._model.astream = mock_astream
+    vector_database = MagicMock()
+    vector_database.asearch_faqs = mock_asearch_faqs
+    service = LLMResponseService(
+        llm=mock_LLM,
+        vector_database=vector_database,
+        prompt_builder=MagicMock(),
+        answer_cache=None,
+    )
+    monkeypatch.setattr(service, "_aget_context", mock_search_context)
+    monkeypatch.setattr(
+        "app.services.llm_response_service.settings.ANSWER_CACHE_ENABLED", False
+    )
+    monkeypatch.setattr(
+        "app.services.llm_response_service.settings.FAQ_FAST_PATH_THRESHOLD", 0.9
+    )
+    return service, calls
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_answers_from_faq(monkeypatch):
+    service, calls = make_faq_service(
+        monkeypatch, 0.97, {"source": "faqs", "faq_id": "1", "faq_answer": "Sì, in tutta Europa."}
+    )
+
+    result = await service.generate_llm_response(Question(question="Spedite all'estero?"))
+    chunks = [chunk async for chunk in result.body_iterator]
+
+    assert chunks == ["data: Sì, in tutta Europa.\n\n", "data: [DONE]\n\n"]
+    assert calls == [], "Should not call the LLM"
+    assert service._faq_stats == {"hits": 1, "misses": 0}
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_faq_answer_from_text(monkeypatch):
+    service, calls = make_faq_service(monkeypatch, 0.97, {"source": "faqs", "faq_id": "1"})
+
+    result = await service.generate_llm_response(Question(question="Spedite all'estero?"))
+    chunks = [chunk async for chunk in result.body_iterator]
+
+    assert chunks[0] == "data: Sì, in tutta Europa.\n\n", "Should read older FAQs too"
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_generate_llm_response_faq_below_threshold(monkeypatch):
+    service, calls = make_faq_service(
+        monkeypatch, 0.5, {"source": "faqs", "faq_id": "1", "faq_answer": "Sì"}
+    )
+
+    result = await service.generate_llm_response(Question(question="Avete il miele?"))
+    chunks = [chunk async for chunk in result.body_iterator]
+
+    assert chunks[0] == "data: Risposta del modello\n\n"
+    assert len(calls) == 1, "Should fall back to the LLM"
+    assert service._faq_stats == {"hits": 0, "misses": 1}
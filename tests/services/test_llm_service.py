@@ -1,7 +1,15 @@
 import pytest
 
-from app.services.llm_service import LLM, OpenAI, Ollama, get_llm_model
+from app.services.llm_service import (
+    LLM,
+    OpenAI,
+    Ollama,
+    Fake,
+    FakeChatModel,
+    get_llm_model,
+)
 import os
+import time
 def test_openai_initialization(monkeypatch):
     # Mock the environment variable for OpenAI API key
     monkeypatch.setattr("app.services.llm_service.settings.LLM_PROVIDER", "openai")
@@ -93,3 +101,63 @@ def test_get_llm_model_invalid_provider(monkeypatch):
     )
     with pytest.raises(ValueError):
         get_llm_model()
+
+
+def test_get_llm_model_fake(monkeypatch):
+    monkeypatch.setattr("app.services.llm_service.settings.LLM_PROVIDER", "fake")
+    monkeypatch.setattr("app.services.llm_service.settings.FAKE_LLM_RESPONSE_TOKENS", 7)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    llm = get_llm_model()
+    assert isinstance(llm, Fake), "Expected an instance of Fake class"
+    assert llm._model.response_tokens == 7, "Should use the FAKE_LLM_* settings"
+
+
+@pytest.mark.asyncio
+async def test_fake_model_astream_respects_latency():
+    model = FakeChatModel(ttft_ms=50, tokens_per_second=100, response_tokens=10)
+
+    start = time.perf_counter()
+    first = None
+    tokens = []
+    async for chunk in model.astream([]):
+        if first is None:
+            first = time.perf_counter() - start
+        tokens.append(chunk.content)
+    elapsed = time.perf_counter() - start
+
+    assert len(tokens) == 10, "Should emit the configured number of tokens"
+    assert first >= 0.05, "Should wait the time to first token"
+    assert elapsed >= 0.05 + 9 / 100, "Should emit tokens at the configured rate"
+
+
+@pytest.mark.asyncio
+async def test_fake_model_astream_injects_errors():
+    model = FakeChatModel(ttft_ms=0, tokens_per_second=0, response_tokens=5, error_rate=1, seed=1)
+
+    tokens = []
+    with pytest.raises(RuntimeError):
+        async for chunk in model.astream([]):
+            tokens.append(chunk)
+    assert len(tokens) <= 5
+
+
+def test_fake_model_invoke():
+    model = FakeChatModel(ttft_ms=0, tokens_per_second=0, response_tokens=3)
+    assert model.invoke([]).content == "Questa è una", "Should return the whole response"
+
+    failing = FakeChatModel(ttft_ms=0, tokens_per_second=0, error_rate=1)
+    with pytest.raises(RuntimeError):
+        failing.invoke([])
+
+
+@pytest.mark.asyncio
+async def test_fake_model_ainvoke():
+    model = FakeChatModel(ttft_ms=0, tokens_per_second=0, response_tokens=3)
+    assert (await model.ainvoke([])).content == "Questa è una"
+
+
+def test_get_llm_model_with_model_name(monkeypatch):
+    monkeypatch.setattr("app.services.llm_service.settings.LLM_PROVIDER", "fake")
+    assert get_llm_model("modello-economico")._model_name == "modello-economico"
+    monkeypatch.setattr("app.services.llm_service.settings.LLM_MODEL_NAME", "modello")
+    assert get_llm_model()._model_name == "modello", "Should default to LLM_MODEL_NAME"
@@ -0,0 +1,78 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.schemas import Message
+from app.services.prompt_builder_service import PromptBuilder
+from app.utils import count_tokens
+
+MODEL = "gpt-4o-mini"
+
+
+def make_builder(**kwargs) -> PromptBuilder:
+    return PromptBuilder(instructions="Istruzioni", model_name=MODEL, **kwargs)
+
+
+def test_build_sends_only_the_question_text():
+    builder = make_builder()
+
+    prompt = builder.build(
+        "Quanto pesa la composta di fragole?",
+        [Message(sender="user", content="Ciao")],
+        ["Composta di fragole. Peso: 250 g"],
+    )
+
+    assert isinstance(prompt[0], SystemMessage)
+    assert prompt[1].content == "Conversazione precedente: user: Ciao"
+    assert prompt[2].content == "Contesto: Composta di fragole. Peso: 250 g"
+    assert isinstance(prompt[3], HumanMessage)
+    assert (
+        prompt[3].content
+        == "Domanda a cui devi rispondere: Quanto pesa la composta di fragole?"
+    ), "Should not stringify the whole Question model"
+
+
+def test_pack_history_keeps_most_recent_messages():
+    messages = [Message(sender="user", content=f"messaggio numero {i} " * 5) for i in range(20)]
+    line_tokens = count_tokens(f"user: {messages[-1].content}", MODEL) + 1
+    builder = make_builder(history_tokens=line_tokens * 3)
+
+    history, dropped = builder.pack_history(messages)
+
+    assert dropped == 17, "Should keep only the messages that fit the budget"
+    assert history.splitlines()[-1].startswith("user: messaggio numero 19")
+    assert history.splitlines()[0].startswith("user: messaggio numero 17")
+
+
+def test_pack_context_follows_rank_and_skips_what_does_not_fit():
+    long_chunk = "parola " * 400
+    chunks = ["primo chunk rilevante", long_chunk, "primo chunk rilevante", "terzo chunk"]
+    builder = make_builder(context_tokens=50)
+
+    context, dropped = builder.pack_context(chunks)
+
+    assert context == "primo chunk rilevante\n\nterzo chunk"
+    assert dropped == 2, "Should drop the duplicate and the chunk over budget"
+    assert builder.pack_context("Contesto unico") == ("Contesto unico", 0)
+
+
+def test_build_truncates_question_and_records_stats():
+    builder = make_builder(question_tokens=5)
+
+    prompt = builder.build("domanda " * 100, [], [])
+
+    question = prompt[3].content.removeprefix("Domanda a cui devi rispondere: ")
+    assert count_tokens(question, MODEL) <= 5, "Should truncate the question"
+    stats = builder.stats()
+    assert stats["prompts"] == 1
+    assert stats["questions_truncated"] == 1
+    assert stats["last_tokens"] == stats["max_tokens"] == stats["mean_tokens"] > 0
+
+
+def test_pack_history_puts_summary_first():
+    builder = make_builder()
+
+    history, dropped = builder.pack_history(
+        [Message(sender="user", content="E il pecorino?")], summary="Chiede dei formaggi"
+    )
+
+    assert history == "Riassunto: Chiede dei formaggi\nuser: E il pecorino?"
+    assert dropped == 0
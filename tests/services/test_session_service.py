@@ -0,0 +1,48 @@
+import pytest
+
+import app.services.session_service as session_service
+from app.schemas import Message
+from app.services.session_service import InMemorySessionStore
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_appends_and_trims_messages():
+    store = InMemorySessionStore(max_sessions=10, max_messages=3, ttl=0)
+
+    assert await store.get_messages("chat") == [], "Unknown sessions are empty"
+    await store.append_messages("chat", [Message(sender="user", content="1")])
+    first = await store.get_messages("chat")
+    await store.append_messages(
+        "chat",
+        [Message(sender="bot", content=str(i)) for i in range(2, 5)],
+    )
+
+    assert [m.content for m in await store.get_messages("chat")] == ["2", "3", "4"]
+    assert [m.content for m in first] == ["1"], "Readers should not see later changes"
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_sessions=2, max_messages=10, ttl=0)
+    for session_id in ("a", "b"):
+        await store.append_messages(session_id, [Message(sender="user", content=session_id)])
+    await store.get_messages("a")
+    await store.append_messages("c", [Message(sender="user", content="c")])
+
+    assert await store.get_messages("b") == [], "Should evict the least recently used"
+    assert len(await store.get_messages("a")) == 1
+    await store.delete("a")
+    assert await store.get_messages("a") == []
+
+
+def test_get_session_store(monkeypatch):
+    monkeypatch.setattr(session_service, "_session_store", None)
+    assert session_service.get_session_stats() == {}
+    store = session_service.get_session_store()
+    assert isinstance(store, InMemorySessionStore)
+    assert session_service.get_session_store() is store
+
+    monkeypatch.setattr(session_service, "_session_store", None)
+    monkeypatch.setattr(session_service.settings, "SESSION_STORE_PROVIDER", "redis")
+    with pytest.raises(ValueError):
+        session_service.get_session_store()
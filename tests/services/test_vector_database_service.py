@@ -2,9 +2,19 @@ from unittest.mock import MagicMock
 import pytest
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-
-from app.services.vector_database_service import ChromaDB, get_vector_database
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import os
+
+from app.services.vector_database_service import (
+    ChromaDB,
+    NumpyVectorDB,
+    get_vector_database,
+    get_shared_vector_database,
+    close_shared_vector_database,
+)
 import uuid
+import threading
 from chromadb.errors import DuplicateIDError
 
 
@@ -462,3 +472,333 @@ def test_get_collection_count_with_client_none(monkeypatch, tmp_path):
 
     count = vector_db._get_collection_count()
     assert count == 0, "Should return 0 when collection is not available via the client"
+
+
+@pytest.mark.asyncio
+async def test_shared_vector_database(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.VECTOR_DB_PROVIDER", "chroma"
+    )
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.VECTOR_DB_DIRECTORY",
+        str(tmp_path / "chroma_test_shared"),
+    )
+    monkeypatch.setattr(
+        "app.services.vector_database_service._shared_vector_database", None
+    )
+
+    vector_db = get_shared_vector_database()
+    assert vector_db is get_shared_vector_database(), "Should reuse the same instance"
+
+    await close_shared_vector_database()
+    assert vector_db._db is None, "Should release the Chroma client on close"
+    assert (
+        get_shared_vector_database() is not vector_db
+    ), "Should build a new instance after closing"
+
+
+@pytest.mark.asyncio
+async def test_chromadb_asearch_context(monkeypatch):
+    vector_db = ChromaDB()
+    expected = [Document(page_content="Test content")]
+    main_thread = threading.get_ident()
+    calls = []
+
+    def mock_search_context(query, results_number=4):
+        calls.append((query, results_number, threading.get_ident()))
+        return expected
+
+    monkeypatch.setattr(vector_db, "search_context", mock_search_context)
+
+    results = await vector_db.asearch_context("Test", 2)
+
+    assert results == expected, "Should return the results of search_context"
+    assert calls[0][:2] == ("Test", 2), "Should forward query and results number"
+    assert calls[0][2] != main_thread, "Should run the search off the event loop thread"
+
+
+def test_chromadb_search_context_uses_query_cache(monkeypatch):
+    vector_db = ChromaDB()
+    fake_db = MagicMock()
+    fake_db.similarity_search_by_vector.return_value = [
+        Document(page_content="Composta di fragole 300 g")
+    ]
+    embedding_function = MagicMock()
+    embedding_function.embed_query.return_value = [0.1, 0.2]
+    monkeypatch.setattr(vector_db, "_db", fake_db)
+    monkeypatch.setattr(
+        vector_db.embedding_provider, "get_embedding_function", lambda: embedding_function
+    )
+
+    first = vector_db.search_context("Quanto pesa la composta di fragole?")
+    second = vector_db.search_context("quanto pesa la composta di fragole")
+
+    assert first == second, "Should return the same results for equivalent questions"
+    assert embedding_function.embed_query.call_count == 1, "Should embed the question once"
+    assert fake_db.similarity_search_by_vector.call_count == 1, "Should search once"
+
+    vector_db.delete_faq("faq-1")
+    vector_db.search_context("Quanto pesa la composta di fragole?")
+    assert (
+        fake_db.similarity_search_by_vector.call_count == 2
+    ), "Writes should invalidate cached results"
+    assert (
+        embedding_function.embed_query.call_count == 1
+    ), "Query embeddings should survive writes"
+    assert vector_db.stats()["query_cache"]["results"]["hits"] == 1
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embedding deterministico: conta le parole chiave presenti nel testo."""
+
+    KEYWORDS = ["fragole", "pesche", "olio", "miele", "vino"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        words = text.lower().split()
+        return [float(words.count(k)) + 0.01 for k in self.KEYWORDS]
+
+
+@pytest.fixture
+def numpy_db(monkeypatch, tmp_path):
+    vector_db = NumpyVectorDB(persist_directory=str(tmp_path / "numpy_db"))
+    monkeypatch.setattr(
+        vector_db.embedding_provider, "get_embedding_function", KeywordEmbeddings
+    )
+    return vector_db
+
+
+def _products():
+    return [
+        Document(page_content="composta di fragole", metadata={"source": "a.txt"}),
+        Document(page_content="confettura di pesche", metadata={"source": "b.txt"}),
+        Document(page_content="olio extravergine", metadata={"source": "c.txt"}),
+        Document(
+            page_content="Domanda: miele? Risposta: sì",
+            metadata={"source": "faqs", "faq_id": "faq-1"},
+        ),
+    ]
+
+
+def test_numpy_add_and_search(numpy_db):
+    assert numpy_db.is_empty() is True, "Database should be empty initially"
+    numpy_db.add_documents(_products())
+    assert numpy_db.count() == 4, "Should store every chunk"
+
+    results = numpy_db.search_context("quanto pesano le pesche", 2)
+    assert len(results) == 2, "Should return k results"
+    assert results[0].page_content == "confettura di pesche", "Best match should come first"
+    assert results[0].id == str(uuid.uuid3(uuid.NAMESPACE_DNS, "confettura di pesche"))
+    assert results[0].metadata == {"source": "b.txt"}, "Should keep the metadata"
+
+
+def test_numpy_add_duplicate_document(numpy_db):
+    numpy_db.add_documents(_products())
+    with pytest.raises(DuplicateIDError):
+        numpy_db.add_documents([_products()[0]])
+    assert numpy_db.count() == 4, "Failed adds should not change the database"
+
+
+def test_numpy_add_documents_rechecks_ids_after_embedding(numpy_db, monkeypatch):
+    class RacingEmbeddings(KeywordEmbeddings):
+        def embed_documents(self, texts):
+            # un altro caricamento aggiunge lo stesso chunk durante l'embedding
+            monkeypatch.setattr(
+                numpy_db.embedding_provider, "get_embedding_function", KeywordEmbeddings
+            )
+            numpy_db.add_documents([_products()[0]])
+            return super().embed_documents(texts)
+
+    monkeypatch.setattr(
+        numpy_db.embedding_provider, "get_embedding_function", RacingEmbeddings
+    )
+    with pytest.raises(DuplicateIDError):
+        numpy_db.add_documents(_products()[:2])
+
+    state = numpy_db._get_db()
+    assert numpy_db.count() == 1, "The losing upload should not add any chunk"
+    assert len(state["positions"]) == len(state["ids"]), "Positions should stay consistent"
+
+
+def test_numpy_delete_document_and_faq(numpy_db):
+    numpy_db.add_documents(_products())
+    numpy_db.delete_document("a.txt")
+    numpy_db.delete_faq("faq-1")
+    assert numpy_db.count() == 2, "Should delete chunks by source and by faq_id"
+    sources = [m["source"] for m in numpy_db.get_all_documents()["metadatas"]]
+    assert sources == ["b.txt", "c.txt"]
+    results = numpy_db.search_context("fragole", 1)
+    assert results[0].metadata["source"] != "a.txt", "Deleted chunks should not be found"
+
+
+def test_numpy_snapshot_reload(numpy_db, monkeypatch):
+    numpy_db.add_documents(_products())
+
+    reloaded = NumpyVectorDB(persist_directory=numpy_db.persist_directory)
+    monkeypatch.setattr(
+        reloaded.embedding_provider, "get_embedding_function", KeywordEmbeddings
+    )
+    assert reloaded.count() == 4, "Should reload the snapshot from disk"
+    assert isinstance(
+        reloaded._get_db()["vectors"], np.memmap
+    ), "Snapshot should be memory-mapped"
+    assert reloaded.search_context("olio", 1)[0].page_content == "olio extravergine"
+
+
+def test_numpy_delete_all_documents(numpy_db):
+    numpy_db.add_documents(_products())
+    numpy_db.search_context("olio", 1)
+    numpy_db.delete_all_documents()
+    assert numpy_db.is_empty() is True, "Should delete every chunk"
+    assert numpy_db.search_context("olio", 1) == [], "Cached results should be invalidated"
+    assert not os.path.exists(
+        os.path.join(numpy_db.persist_directory, NumpyVectorDB._VECTORS_FILE)
+    ), "Should remove the snapshot"
+
+
+def test_get_vector_database_numpy(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.VECTOR_DB_PROVIDER", "numpy"
+    )
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.VECTOR_DB_DIRECTORY",
+        str(tmp_path),
+    )
+    assert isinstance(get_vector_database(), NumpyVectorDB)
+
+
+def test_hybrid_search_finds_product_code(numpy_db, monkeypatch):
+    documents = _products() + [
+        Document(page_content="olio Codice: 31100M23F04", metadata={"source": "d.txt"})
+    ]
+    numpy_db.add_documents(documents)
+
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.HYBRID_SEARCH_ENABLED", False
+    )
+    vector_only = numpy_db.search_context("scheda 31100M23F04", 2)
+    monkeypatch.setattr(
+        "app.services.vector_database_service.settings.HYBRID_SEARCH_ENABLED", True
+    )
+    hybrid = numpy_db.search_context("codice 31100M23F04", 2)
+
+    assert "d.txt" not in [
+        d.metadata["source"] for d in vector_only
+    ], "Dense embeddings miss the code"
+    assert hybrid[0].metadata["source"] == "d.txt", "Hybrid search should find the exact code"
+
+
+def test_lexical_index_follows_writes(numpy_db):
+    numpy_db.add_documents(_products()[:2])
+    assert numpy_db._lexical_search("fragole", 4), "Index should be built from stored chunks"
+    numpy_db.add_documents(_products()[2:])
+    assert numpy_db._lexical_search("olio", 4), "Index should include newly added chunks"
+    numpy_db.delete_document("c.txt")
+    assert numpy_db._lexical_search("olio", 4) == [], "Index should drop deleted chunks"
+    numpy_db.delete_all_documents()
+    assert numpy_db._lexical_search("fragole", 4) == [], "Index should be emptied"
+
+
+def test_search_by_product_code_skips_embeddings(numpy_db, monkeypatch):
+    numpy_db.add_documents(
+        [
+            Document(
+                page_content="Composta di pesche Codice: 93002",
+                metadata={"source": "93002.txt", "product_codes": "93002"},
+            ),
+            Document(
+                page_content="Ingredienti: pesche, zucchero",
+                metadata={"source": "93002.txt", "product_codes": "93002"},
+            ),
+        ]
+        + _products()
+    )
+    embed_query = MagicMock()
+    monkeypatch.setattr(numpy_db, "_embed_query", embed_query)
+
+    results = numpy_db.search_by_product_code("ingredienti del 93002?", 4)
+    assert [d.metadata["source"] for d in results] == ["93002.txt"] * 2
+    assert results[0].page_content.startswith("Ingredienti"), "Should rank chunks with BM25"
+    assert numpy_db.search_by_product_code("quanto pesano le pesche") == []
+    assert numpy_db.search_by_product_code("prodotto 99999") == []
+    embed_query.assert_not_called()
+
+    numpy_db.delete_document("93002.txt")
+    assert numpy_db.search_by_product_code("93002") == [], "Should follow deletions"
+
+
+@pytest.mark.asyncio
+async def test_asearch_by_product_code_runs_off_the_event_loop(numpy_db, monkeypatch):
+    main_thread = threading.get_ident()
+    calls = []
+
+    def mock_search_by_product_code(query, results_number=4):
+        calls.append((query, results_number, threading.get_ident()))
+        return [Document(page_content="Composta di pesche Codice: 93002")]
+
+    monkeypatch.setattr(numpy_db, "search_by_product_code", mock_search_by_product_code)
+
+    results = await numpy_db.asearch_by_product_code("ingredienti del 93002?", 2)
+    assert results[0].page_content.startswith("Composta")
+    assert calls[0][:2] == ("ingredienti del 93002?", 2)
+    assert calls[0][2] != main_thread, "Should run in the search executor"
+
+    assert await numpy_db.asearch_by_product_code("quanto pesano le pesche") == []
+    assert len(calls) == 1, "Questions without codes should not leave the event loop"
+
+
+def test_replace_document_embeds_only_new_chunks(numpy_db, monkeypatch):
+    def version(*texts, codes="93002"):
+        return [
+            Document(
+                page_content=text,
+                metadata={"source": "93002.txt", "product_codes": codes},
+            )
+            for text in texts
+        ]
+
+    numpy_db.add_documents(version("composta di pesche", "peso 300 g", "vasetto di vetro"))
+    embedding_function = KeywordEmbeddings()
+    embed_documents = MagicMock(side_effect=embedding_function.embed_documents)
+    monkeypatch.setattr(embedding_function, "embed_documents", embed_documents)
+    monkeypatch.setattr(
+        numpy_db.embedding_provider, "get_embedding_function", lambda: embedding_function
+    )
+    numpy_db._get_lexical_index()
+
+    stats = numpy_db.replace_document(
+        "93002.txt",
+        version("composta di pesche", "peso 250 g", "vasetto di vetro", codes="93002,93003"),
+    )
+
+    assert stats == {"added": 1, "removed": 1, "unchanged": 2, "embeddings_saved": 2}
+    embed_documents.assert_called_once_with(["peso 250 g"])
+    assert numpy_db.count() == 3
+    assert {m["product_codes"] for m in numpy_db.get_all_documents()["metadatas"]} == {
+        "93002,93003"
+    }, "Unchanged chunks should get the new metadata"
+    assert numpy_db._lexical_search("300", 4) == [], "Removed chunks should leave the index"
+    assert len(numpy_db.search_by_product_code("93003")) == 3, "Codes should be updated"
+
+
+@pytest.mark.asyncio
+async def test_generation_and_aembed_query(numpy_db):
+    generation = numpy_db.generation
+    embedding = await numpy_db.aembed_query("composta di fragole")
+    assert embedding == KeywordEmbeddings().embed_query("composta di fragole")
+
+    numpy_db.add_documents(_products())
+    assert numpy_db.generation == generation + 1, "Writes should bump the generation"
+
+
+def test_numpy_search_faqs_returns_only_faqs_with_scores(numpy_db):
+    assert numpy_db.search_faqs("miele", 1) == [], "No FAQ stored yet"
+    numpy_db.add_documents(_products())
+
+    results = numpy_db.search_faqs("composta di fragole", 3)
+
+    assert [document.metadata["faq_id"] for document, _ in results] == ["faq-1"]
+    _, score = results[0]
+    assert 0 < score < 1, "Should return the cosine similarity"
@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+
+import app.main as main
+
+
+def test_lifespan_builds_and_closes_shared_resources(monkeypatch):
+    vector_database = MagicMock()
+    llm_response_service = MagicMock()
+    closed = []
+
+    async def mock_close_llm_response_service():
+        closed.append("llm")
+
+    async def mock_close_shared_vector_database():
+        closed.append("vector_database")
+
+    async def mock_close_database_api_client():
+        closed.append("database_api")
+
+    async def mock_close_ingestion_job_manager():
+        closed.append("jobs")
+
+    def mock_close_ingest_manifest():
+        closed.append("manifest")
+
+    def mock_close_pdf_executor():
+        closed.append("pdf")
+
+    async def mock_close_conversation_memory():
+        closed.append("conversation_memory")
+
+    async def mock_close_session_store():
+        closed.append("sessions")
+
+    async def mock_close_event_loop_monitor():
+        closed.append("event_loop")
+
+    job_manager = MagicMock()
+    event_loop_monitor = MagicMock()
+
+    monkeypatch.setattr(main, "get_shared_vector_database", lambda: vector_database)
+    monkeypatch.setattr(main, "get_llm_response_service", lambda: llm_response_service)
+    monkeypatch.setattr(
+        main, "close_llm_response_service", mock_close_llm_response_service
+    )
+    monkeypatch.setattr(
+        main, "close_shared_vector_database", mock_close_shared_vector_database
+    )
+    monkeypatch.setattr(
+        main, "close_database_api_client", mock_close_database_api_client
+    )
+    monkeypatch.setattr(main, "get_ingestion_job_manager", lambda: job_manager)
+    monkeypatch.setattr(main, "close_ingest_manifest", mock_close_ingest_manifest)
+    monkeypatch.setattr(main, "close_pdf_executor", mock_close_pdf_executor)
+    monkeypatch.setattr(
+        main, "close_ingestion_job_manager", mock_close_ingestion_job_manager
+    )
+    monkeypatch.setattr(
+        main, "close_conversation_memory", mock_close_conversation_memory
+    )
+    monkeypatch.setattr(main, "close_session_store", mock_close_session_store)
+    monkeypatch.setattr(main, "get_event_loop_monitor", lambda: event_loop_monitor)
+    monkeypatch.setattr(
+        main, "close_event_loop_monitor", mock_close_event_loop_monitor
+    )
+
+    with TestClient(main.app):
+        vector_database.open.assert_called_once()
+        job_manager.start.assert_called_once()
+        event_loop_monitor.start.assert_called_once()
+        assert closed == [], "Resources should stay open while the app is running"
+
+    assert closed == [
+        "event_loop",
+        "jobs",
+        "llm",
+        "conversation_memory",
+        "sessions",
+        "vector_database",
+        "database_api",
+        "manifest",
+        "pdf",
+    ], "Should close the shared resources on shutdown"
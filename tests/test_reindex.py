@@ -0,0 +1,229 @@
+import json
+import os
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.embeddings import Embeddings
+
+from app import reindex as reindex_module
+from app.reindex import Checkpoint, file_sha256, list_files, parse_file, reindex
+from app.services.ingest_manifest_service import IngestManifest
+from app.services.vector_database_service import NumpyVectorDB
+from app.config import settings
+from app.utils import count_tokens
+
+
+class LengthEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+@pytest.fixture
+def documents_folder(tmp_path):
+    folder = tmp_path / "documenti"
+    folder.mkdir()
+    for code in ["93001", "93002", "93003"]:
+        (folder / f"{code}.txt").write_text(
+            f"Prodotto Codice: {code} "
+            + " ".join(f"riga {i} del prodotto {code}" for i in range(60)),
+            encoding="utf-8",
+        )
+    (folder / "note.md").write_text("ignorato", encoding="utf-8")
+    return str(folder)
+
+
+@pytest.fixture(autouse=True)
+def ingest_manifest(tmp_path, monkeypatch):
+    manifest = IngestManifest(str(tmp_path / "ingest_manifest.sqlite3"))
+    monkeypatch.setattr(reindex_module, "get_ingest_manifest", lambda: manifest)
+    yield manifest
+    manifest.close()
+
+
+@pytest.fixture(autouse=True)
+def disable_boilerplate_filter(monkeypatch):
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", False)
+    monkeypatch.setattr(settings, "NEAR_DUPLICATE_FILTER_ENABLED", False)
+
+
+@pytest.fixture
+def vector_db(monkeypatch, tmp_path):
+    vector_db = NumpyVectorDB(persist_directory=str(tmp_path / "vdb"))
+    embeddings = LengthEmbeddings()
+    monkeypatch.setattr(
+        vector_db.embedding_provider, "get_embedding_function", lambda: embeddings
+    )
+    return vector_db
+
+
+@pytest.mark.asyncio
+async def test_list_files_and_parse_file(documents_folder):
+    files = list_files(documents_folder)
+    assert [os.path.basename(f) for f in files] == ["93001.txt", "93002.txt", "93003.txt"]
+    chunks = await parse_file(files[0])
+    assert len(chunks) > 1, "Should split the file in chunks"
+    assert chunks[0].metadata["product_codes"] == "93001"
+
+
+@pytest.mark.asyncio
+async def test_reindex_embeds_in_batches(documents_folder, vector_db):
+    stats = await reindex(
+        documents_folder, vector_db, workers=0, batch_size=4, concurrency=2
+    )
+    embeddings = vector_db.embedding_provider.get_embedding_function()
+
+    assert stats["files"] == 3
+    assert stats["chunks"] == vector_db.count() > 0, "Should store every chunk"
+    assert max(embeddings.calls) <= 4, "Should embed in batches of batch_size"
+    assert stats["tokens"] > 0 and stats["chunks_per_second"] > 0
+    assert vector_db.search_by_product_code("scheda 93002"), "Should keep product codes"
+
+
+@pytest.mark.asyncio
+async def test_reindex_resumes_from_checkpoint(documents_folder, vector_db):
+    files = list_files(documents_folder)
+    checkpoint_path = os.path.join(vector_db.persist_directory, "reindex_checkpoint.json")
+    # Run interrotto: il primo file è stato salvato e registrato nel checkpoint
+    vector_db.add_documents(await parse_file(files[0]))
+    Checkpoint(checkpoint_path).mark_done(files[:1])
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["skipped_files"] == 1, "Completed files should be skipped"
+    assert stats["files"] == 2
+
+    with open(checkpoint_path) as f:
+        assert sorted(json.load(f)["files"]) == files, "Should record every file"
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["files"] == 0 and stats["skipped_files"] == 3, "Nothing left to do"
+
+
+@pytest.mark.asyncio
+async def test_reindex_skips_stored_chunks(documents_folder, vector_db):
+    files = list_files(documents_folder)
+    # Run interrotto dopo la scrittura ma prima del checkpoint
+    vector_db.add_documents(await parse_file(files[0]))
+    count = vector_db.count()
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["skipped_chunks"] == count, "Stored chunks should not be embedded again"
+
+    stats = await reindex(documents_folder, vector_db, workers=0, reset=True)
+    assert stats["files"] == 3 and stats["skipped_chunks"] == 0, "Reset should start over"
+
+
+@pytest.mark.asyncio
+async def test_reindex_replaces_chunks_of_changed_files(documents_folder, vector_db):
+    await reindex(documents_folder, vector_db, workers=0)
+    changed = list_files(documents_folder)[0]
+    with open(changed, "w", encoding="utf-8") as f:
+        f.write("Prodotto Codice: 93001 nuova scheda del prodotto")
+    os.utime(changed, (0, 0))
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["files"] == 1 and stats["updated_files"] == 1, "Should reindex the changed file"
+    stored = vector_db.get_all_documents()
+    texts = [
+        text
+        for text, metadata in zip(stored["documents"], stored["metadatas"])
+        if metadata["source"] == changed
+    ]
+    assert texts == [
+        "Prodotto Codice: 93001 nuova scheda del prodotto"
+    ], "Chunks of the previous version should be deleted"
+
+
+@pytest.mark.asyncio
+async def test_reindex_registers_files_in_manifest(
+    documents_folder, vector_db, ingest_manifest
+):
+    await reindex(documents_folder, vector_db, workers=0)
+
+    for file_path in list_files(documents_folder):
+        entry = ingest_manifest.get(file_sha256(file_path))
+        assert entry["source"] == file_path, "Uploads of the same content should get 409"
+        assert vector_db.get_existing_ids(entry["chunk_ids"]) == set(entry["chunk_ids"])
+
+
+@pytest.mark.asyncio
+async def test_reindex_removes_deleted_files(documents_folder, vector_db, ingest_manifest):
+    await reindex(documents_folder, vector_db, workers=0)
+    deleted = list_files(documents_folder)[0]
+    sha256 = file_sha256(deleted)
+    os.remove(deleted)
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["removed_files"] == 1
+    stored = vector_db.get_all_documents()
+    assert deleted not in {m["source"] for m in stored["metadatas"]}, "Should drop its chunks"
+    assert ingest_manifest.get(sha256) is None
+
+    stats = await reindex(documents_folder, vector_db, workers=0)
+    assert stats["removed_files"] == 0, "Should forget the file in the checkpoint"
+
+
+@pytest.mark.asyncio
+async def test_reindex_uses_the_documents_dir_and_upload_filters(
+    documents_folder, vector_db, monkeypatch
+):
+    from app.services.boilerplate_service import BoilerplateFilter
+    from app.services.file_manager_service import TextFileManager
+
+    monkeypatch.setenv("DOCUMENTS_DIR", documents_folder)
+    boilerplate_filter = BoilerplateFilter(min_documents=2)
+    monkeypatch.setattr(settings, "BOILERPLATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(settings, "NEAR_DUPLICATE_FILTER_ENABLED", True)
+    monkeypatch.setattr(
+        "app.services.file_manager_service.get_boilerplate_filter",
+        lambda: boilerplate_filter,
+    )
+    for code in ["93001", "93002", "93003"]:
+        with open(os.path.join(documents_folder, f"{code}.txt"), "w") as f:
+            f.write(f"MENU Home Prodotti Contatti\nProdotto Codice: {code} composta")
+    # come get_boilerplate_filter, che osserva la cartella alla creazione
+    boilerplate_filter.observe_folder(documents_folder)
+
+    await reindex(vector_database=vector_db, workers=0)
+
+    stored = vector_db.get_all_documents()
+    assert {m["source"] for m in stored["metadatas"]} == {
+        TextFileManager().get_full_path(f"{code}.txt") for code in ["93001", "93002", "93003"]
+    }, "Sources should match the paths used by DELETE and PUT /documents"
+    assert not any("MENU" in text for text in stored["documents"]), "Should strip boilerplate"
+
+
+@pytest.mark.asyncio
+async def test_reindex_concurrent_files(documents_folder, vector_db):
+    stats = await reindex(documents_folder, vector_db, workers=2)
+    assert stats["files"] == 3 and vector_db.count() == stats["chunks"]
+
+
+def test_count_tokens_fallback(monkeypatch):
+    monkeypatch.setattr("app.utils._get_encoding", lambda model_name: None)
+    assert count_tokens("abcdefgh") == 2, "Should estimate 4 characters per token"
+
+
+def test_main(monkeypatch, capsys):
+    async def mock_reindex(**kwargs):
+        assert kwargs["workers"] == 2 and kwargs["reset"] is True
+        return {
+            "files": 3,
+            "skipped_files": 0,
+            "chunks": 30,
+            "skipped_chunks": 0,
+            "tokens": 3000,
+            "seconds": 1.5,
+            "files_per_second": 2.0,
+            "chunks_per_second": 20.0,
+            "tokens_per_second": 2000.0,
+        }
+
+    monkeypatch.setattr(reindex_module, "reindex", mock_reindex)
+    reindex_module.main(["--workers", "2", "--reset"])
+    assert "20.0 chunk/s" in capsys.readouterr().out